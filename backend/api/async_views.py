@@ -0,0 +1,144 @@
+"""
+ASGI-native read endpoints, mounted under ``/api/async/``.
+
+They return the same payloads as the DRF viewsets for photo, word and
+experience list/retrieve, ``/top`` and the current user, but are plain async
+Django views. Rows are loaded with the async ORM (``aget``, ``async for``)
+and the DRF serializers only format rows that are already in memory, so a
+request never occupies a worker thread while it waits on the database or a
+slow client. Django still executes each query on its database thread, which
+costs one hop per query instead of one thread per request. Lists and
+``/top`` use the lean ``.values()`` serializers when ``FAST_SERIALIZATION``
+is on, like the sync viewsets.
+
+Lists use keyset pagination on ``(-created_at, -id)``: follow the ``next``
+link, which carries an opaque ``cursor`` parameter (forward only).
+``page_size`` and ``expand=user`` work as on the sync endpoints, and so
+does ``liked_by_me`` for the session user.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from . import auth, leaderboard, likesets
+from .models import Photo, Word, Experience
+from .pagination import FeedCursorPagination
+from .renderers import FastJSONRenderer
+from .serializers import (
+    UserSerializer, PhotoSerializer, PhotoWithAuthorSerializer,
+    WordSerializer, WordWithAuthorSerializer, ExperienceSerializer,
+    PhotoValuesSerializer, PhotoWithAuthorValuesSerializer, WordValuesSerializer, WordWithAuthorValuesSerializer,
+    ExperienceValuesSerializer, ValuesSerializer, fast_serialization,
+)
+
+# feed 名: (モデル, 通常のシリアライザ, ?expand=user 用のシリアライザ)
+FEEDS = {
+    'photos': (Photo, PhotoSerializer, PhotoWithAuthorSerializer),
+    'words': (Word, WordSerializer, WordWithAuthorSerializer),
+    'experiences': (Experience, ExperienceSerializer, ExperienceSerializer),
+}
+# 一覧と /top 用の軽量シリアライザ（FAST_SERIALIZATION）
+VALUES_FEEDS = {
+    'photos': (PhotoValuesSerializer, PhotoWithAuthorValuesSerializer),
+    'words': (WordValuesSerializer, WordWithAuthorValuesSerializer),
+    'experiences': (ExperienceValuesSerializer, ExperienceValuesSerializer),
+}
+
+
+def render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def get_queryset(feed):
+    model = FEEDS[feed][0]
+    queryset = model.objects.order_by('-created_at', '-id')
+    if model is not Experience:
+        queryset = queryset.select_related('user')
+    return queryset
+
+
+def get_serializer_class(feed, request, many=False):
+    _, flat, expanded = FEEDS[feed]
+    if many and fast_serialization():
+        flat, expanded = VALUES_FEEDS[feed]
+    return expanded if 'user' in request.GET.get('expand', '').split(',') else flat
+
+
+async def get_serializer_context(request):
+    # liked_by_me 用のいいね集合（同期版の likes_context と同じ）
+    return {'likes': await likesets.afor_request(request, await auth.aget_session_user(request))}
+
+
+def page_size(request):
+    try:
+        size = int(request.GET['page_size'])
+    except (KeyError, ValueError):
+        return api_settings.PAGE_SIZE
+    return max(1, min(size, FeedCursorPagination.max_page_size))
+
+
+def encode_cursor(row):
+    # values() の dict でもモデルのインスタンスでもよい
+    created_at, pk = (row['created_at'], row['id']) if isinstance(row, dict) else (row.created_at, row.pk)
+    position = f'{created_at.isoformat()}|{pk}'
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, pk)``; raises ValueError for malformed cursors."""
+    created_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(pk)
+
+
+@require_GET
+async def feed_list(request, feed):
+    queryset = get_queryset(feed)
+    serializer_class = get_serializer_class(feed, request, many=True)
+    if issubclass(serializer_class, ValuesSerializer):
+        queryset = serializer_class.values(queryset)
+    size = page_size(request)
+    if cursor := request.GET.get('cursor'):
+        try:
+            created_at, pk = decode_cursor(cursor)
+        except ValueError:
+            return render({'detail': 'Invalid cursor'}, status=404)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    # 1 件多く読んで次ページの有無を判定する
+    rows = [row async for row in queryset[:size + 1]]
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(rows[-1]))
+    context = await get_serializer_context(request)
+    return render({'next': next_url, 'results': serializer_class(rows, many=True, context=context).data})
+
+
+@require_GET
+async def feed_detail(request, feed, pk):
+    try:
+        instance = await get_queryset(feed).aget(pk=pk)
+    except FEEDS[feed][0].DoesNotExist:
+        return render({'detail': 'Not found.'}, status=404)
+    context = await get_serializer_context(request)
+    return render(get_serializer_class(feed, request)(instance, context=context).data)
+
+
+@require_GET
+async def feed_top(request, feed):
+    limit = leaderboard.parse_limit(request.GET.get('limit'))
+    rows = await leaderboard.atop(FEEDS[feed][0], limit)
+    context = await get_serializer_context(request)
+    return render(get_serializer_class(feed, request, many=True)(rows, many=True, context=context).data)
+
+
+@require_GET
+async def current_user(request):
+    user = await auth.aget_session_user(request)
+    if user is None:
+        return render({'message': 'Not authenticated'}, status=401)
+    return render(UserSerializer(user).data)
@@ -0,0 +1,114 @@
+"""
+Session-based authentication helpers for the custom ``api.User`` model.
+
+The logged-in user's id lives in ``request.session['user_id']``. The User row
+itself comes from the object cache (``api/objectcache.py``, kept fresh by
+model signals) and is memoized on the request, so resolving the current user normally costs no
+database query.
+
+Password hashing runs on a small bounded thread pool
+(``PASSWORD_HASHING_CONCURRENCY``), so a burst of logins uses at most that
+many CPUs at once. The request thread still waits for its hash. Stored hashes made with an older hasher or older cost
+parameters, and plaintext passwords left by old seed data, are replaced on the
+next successful login.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX, check_password, identify_hasher, make_password,
+)
+from django.utils.crypto import constant_time_compare
+
+from . import objectcache
+from .models import User
+
+
+def _load_session_user(request):
+    user_id = request.session.get('user_id')
+    if user_id is None:
+        return None
+    try:
+        return objectcache.get(User, user_id)
+    except User.DoesNotExist:
+        return None
+
+
+async def _aload_session_user(request):
+    user_id = await request.session.aget('user_id')
+    if user_id is None:
+        return None
+    try:
+        return await objectcache.aget(User, user_id)
+    except User.DoesNotExist:
+        return None
+
+
+def get_session_user(request):
+    """Return the logged-in ``api.User`` (or None), resolved at most once per request."""
+    request = getattr(request, '_request', request)
+    if not hasattr(request, '_api_user'):
+        request._api_user = _load_session_user(request)
+    return request._api_user
+
+
+async def aget_session_user(request):
+    """Async ``get_session_user`` for ASGI views; shares the same memo."""
+    if not hasattr(request, '_api_user'):
+        request._api_user = await _aload_session_user(request)
+    return request._api_user
+
+
+def login(request, user):
+    request.session['user_id'] = user.id
+    objectcache.remember(user)
+    getattr(request, '_request', request)._api_user = user
+
+
+def logout(request):
+    if 'user_id' in request.session:
+        del request.session['user_id']
+    getattr(request, '_request', request)._api_user = None
+
+
+_hashing_pool = None
+_hashing_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _hashing_pool
+    if _hashing_pool is None:
+        with _hashing_pool_lock:
+            if _hashing_pool is None:
+                workers = getattr(settings, 'PASSWORD_HASHING_CONCURRENCY', None) or os.cpu_count() or 1
+                _hashing_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return _hashing_pool
+
+
+def _verify(raw_password, encoded):
+    """Return ``(valid, new_encoded)``; ``new_encoded`` is set when the stored value must be upgraded."""
+    try:
+        identify_hasher(encoded)
+    except ValueError:
+        # 旧 initialize_data が保存した平文パスワード
+        if encoded and not encoded.startswith(UNUSABLE_PASSWORD_PREFIX) and constant_time_compare(raw_password, encoded):
+            return True, make_password(raw_password)
+        return False, None
+    outdated = []
+    valid = check_password(raw_password, encoded, setter=outdated.append)
+    return valid, make_password(raw_password) if valid and outdated else None
+
+
+def hash_password(raw_password):
+    return get_hashing_pool().submit(make_password, raw_password).result()
+
+
+def check_user_password(user, raw_password):
+    """Check ``raw_password`` against ``user`` and upgrade the stored hash if needed."""
+    valid, encoded = get_hashing_pool().submit(_verify, raw_password, user.password).result()
+    if encoded:
+        user.password = encoded
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,131 @@
+"""
+Conditional GET (ETag / Last-Modified) and Cache-Control for read endpoints.
+
+Every model has a version stamp in the Django cache: the time of its last
+change in nanoseconds, bumped by model signals and by likes. A view's
+validators are derived from the stamps of the models it depends on, so
+``If-None-Match`` / ``If-Modified-Since`` are answered with a 304 before any
+query runs or anything is serialized.
+
+Writes inside a transaction bump the stamp again on commit, so a response
+rendered from the rows before the commit never carries the final ETag.
+Stamps expire after ``CONDITIONAL_GET_VERSION_TTL`` seconds. Stamps in a
+per-process cache (the LocMem default) would miss other workers' writes, so
+``CONDITIONAL_GET`` is off when several workers run without Redis.
+
+A 200 is computed once for identical concurrent requests (same key, same
+host) and shared (api/singleflight.py).
+
+A 200 read from a replica shortly after the last write may not include
+that write yet; it is sent without validators (api/replicas.py).
+
+Views whose responses depend on who is asking (``liked_by_me``) define
+``conditional_user_key(request)``: its value joins the ETag, responses vary
+on ``Cookie`` and are ``private`` for logged-in users.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from . import replicas, singleflight
+
+VERSION_KEY = 'api:version:{}'
+
+
+def _version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def _version_ttl():
+    return getattr(settings, 'CONDITIONAL_GET_VERSION_TTL', 300)
+
+
+def get_version(model):
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=_version_ttl())
+        version = cache.get(key) or time.time_ns()
+    return version
+
+
+def _bump(key):
+    # 時計のずれがあっても単調増加になるようにする
+    version = max(time.time_ns(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=_version_ttl())
+    return version
+
+
+def bump_version(model):
+    """
+    Bump ``model``'s stamp now and, inside a transaction, again when it
+    commits: a GET that read the new stamp before the commit may have
+    rendered the old rows, and must not keep its ETag valid.
+    """
+    key = _version_key(model)
+    version = _bump(key)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(key))
+    return version
+
+
+def conditional(view_method):
+    """Answer conditional GETs from model versions; add validators to 200s."""
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not getattr(settings, 'CONDITIONAL_GET', True):
+            return view_method(self, request, *args, **kwargs)
+        versions = [get_version(model) for model in self.conditional_models]
+        user_key = getattr(self, 'conditional_user_key', None)
+        user_key = user_key(request) if user_key is not None else None
+        key = '|'.join([request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+                       + [str(v) for v in versions] + [user_key or ''])
+        etag = 'W/"%s"' % hashlib.md5(key.encode()).hexdigest()
+        last_modified = max(versions) // 1_000_000_000
+
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            name = f'{getattr(self, "basename", type(self).__name__)}-{getattr(self, "action", "")}'
+            # レプリカから読んだ結果はプライマリから読むリクエストと共有しない
+            response, shared = singleflight.do(
+                name, f'{request.get_host()}|{replicas.current() or ""}|{key}',
+                lambda: view_method(self, request, *args, **kwargs))
+            if shared:
+                # レスポンスはリクエストごとに描画されるので、データだけを共有する
+                response = Response(response.data, status=response.status_code)
+        if response.status_code == 200 and replicas.may_be_stale(max(versions)):
+            # 直前の書き込みがまだレプリカに届いていないかもしれない。古い本文に新しい ETag を付けない
+            response['Cache-Control'] = 'no-cache'
+        elif response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if user_key:
+                # ログイン中のレスポンスは共有キャッシュに載せない
+                response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+            else:
+                response['Cache-Control'] = getattr(
+                    settings, 'API_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+            patch_vary_headers(response, ['Accept'] if user_key is None else ['Accept', 'Cookie'])
+        return response
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """Conditional GET for ``list`` and ``retrieve`` of a ModelViewSet."""
+    # このビューのレスポンス内容が依存するモデル
+    conditional_models = ()
+
+    @conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
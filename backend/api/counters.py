@@ -0,0 +1,112 @@
+"""
+Denormalized per-user counters: ``User.photo_count``, ``User.word_count``
+and ``User.likes_received``.
+
+Profiles read them from the user row, so no page needs ``COUNT(*)`` or
+``SUM(likes)``. They are kept up to date with relative
+``UPDATE ... SET x = x + n`` statements, one per write:
+
+* model signals cover ``save()`` and ``delete()`` of single photos and
+  words, including moving one to another user and likes written by a
+  full ``save()``;
+* ``add_items()`` covers ``bulk_create`` (the /batch/ endpoints);
+* ``likes.apply_likes`` credits the owners of liked objects, batched with
+  the likes themselves when they are written behind.
+
+Like credits only drop the owners' cached rows and leave the ``User``
+stamp alone, so a like does not expire every /api/users/ ETag; a 304 may
+carry a ``likes_received`` up to ``CONDITIONAL_GET_VERSION_TTL`` seconds old.
+
+``recount()`` rebuilds the counters from the tables in one statement
+(``initialize_data`` calls it after its bulk inserts).
+"""
+from collections import Counter
+
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import objectcache
+from .conditional import bump_version
+from .models import User, Photo, Word
+
+COUNT_FIELDS = {Photo: 'photo_count', Word: 'word_count'}
+
+
+def _delta(counts, user_ids):
+    amounts = set(counts.values())
+    if len(amounts) == 1 and counts.keys() == user_ids:
+        return Value(amounts.pop())
+    return Case(*[When(pk=pk, then=Value(n)) for pk, n in counts.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def update(changes, bump=True):
+    """
+    Apply ``{field: {user_id: n}}`` relative changes in a single UPDATE.
+    With ``bump=False`` the ``User`` stamp is left as it is.
+    """
+    changes = {field: {pk: n for pk, n in counts.items() if n} for field, counts in changes.items()}
+    changes = {field: counts for field, counts in changes.items() if counts}
+    if not changes:
+        return 0
+    user_ids = set().union(*changes.values())
+    updated = User.objects.filter(pk__in=user_ids).update(
+        **{field: F(field) + _delta(counts, user_ids) for field, counts in changes.items()})
+    # .update() はシグナルを送らないのでキャッシュと ETag は手動で更新する
+    objectcache.invalidate(User, user_ids)
+    if bump:
+        bump_version(User)
+    return updated
+
+
+def add_items(model, objects, sign=1):
+    """Count newly created (or, with ``sign=-1``, deleted) photos or words."""
+    items, likes = Counter(), Counter()
+    for obj in objects:
+        items[obj.user_id] += sign
+        likes[obj.user_id] += sign * obj.likes
+    return update({COUNT_FIELDS[model]: items, 'likes_received': likes})
+
+
+def add_likes(model, counts, owners=None):
+    """
+    Credit ``{pk: n}`` likes on ``model`` objects to their owners.
+    ``owners`` maps pks to user ids; only the pks missing from it are looked up.
+    """
+    owners = dict(owners or {})
+    missing = [pk for pk in counts if pk not in owners]
+    if missing:
+        owners.update(model.objects.filter(pk__in=missing).values_list('pk', 'user_id'))
+    credits = Counter()
+    for pk, n in counts.items():
+        if pk in owners:
+            credits[owners[pk]] += n
+    return update({'likes_received': credits}, bump=False)
+
+
+def move(model, origin, instance):
+    """``save()`` of an existing row; ``origin`` is its ``(user_id, likes)`` before the save."""
+    user_id, likes = origin
+    if user_id == instance.user_id:
+        return update({'likes_received': {user_id: instance.likes - likes}})
+    return update({
+        COUNT_FIELDS[model]: {user_id: -1, instance.user_id: 1},
+        'likes_received': {user_id: -likes, instance.user_id: instance.likes},
+    })
+
+
+def recount(users=None):
+    """Recompute the counters of ``users`` (a queryset; all users by default) from the tables."""
+    def total(model, expression):
+        rows = model.objects.filter(user=OuterRef('pk')).order_by().values('user')
+        return Coalesce(Subquery(rows.annotate(total=expression).values('total')), 0)
+
+    users = User.objects.all() if users is None else users
+    updated = users.update(
+        photo_count=total(Photo, Count('*')),
+        word_count=total(Word, Count('*')),
+        likes_received=total(Photo, Sum('likes')) + total(Word, Sum('likes')),
+    )
+    objectcache.invalidate(User, list(users.values_list('pk', flat=True)))
+    bump_version(User)
+    return updated
@@ -0,0 +1,25 @@
+"""
+Password hashers whose cost parameters come from settings.
+
+Each hasher keeps the algorithm name of its Django parent, so existing
+hashes still verify, and ``must_update`` reports hashes made with other
+parameters so they are upgraded on the next login.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', None) or ScryptPasswordHasher.work_factor
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = getattr(settings, 'PASSWORD_ARGON2_TIME_COST', None) or Argon2PasswordHasher.time_cost
+    memory_cost = getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', None) or Argon2PasswordHasher.memory_cost
+    parallelism = getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', None) or Argon2PasswordHasher.parallelism
@@ -0,0 +1,198 @@
+"""
+Image ingestion for photos and experiences.
+
+``ingest()`` stores the uploaded original in ``default_storage`` (MEDIA_ROOT
+by default) and renders a set of responsive variants: every width in
+``IMAGE_VARIANT_WIDTHS`` that is narrower than the original, in each format
+of ``IMAGE_FORMATS`` that this Pillow build can encode. The original itself
+covers its full width. Decoding, resizing and encoding run in parallel on a
+bounded thread pool (Pillow releases the GIL for that work); the storage
+and database writes stay on the caller's thread. With ``IMAGE_PROCESSING =
+'queue'`` (the default) the upload only stores the original and an
+``images.render`` task renders the variants in a ``run_tasks`` worker, so
+encoding never ties up a web worker.
+
+Uploads larger than ``IMAGE_MAX_UPLOAD_SIZE`` bytes are refused before they
+are read, and images of more than ``Image.MAX_IMAGE_PIXELS`` pixels before
+they are decoded.
+
+The model keeps ``width``, ``height`` and a ``variants`` list of
+``{"width", "format", "name"}`` entries; serializers turn it into a
+``srcset`` per format.
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import tasks
+
+# Pillow のフォーマット名
+PILLOW_FORMATS = {'webp': 'WEBP', 'avif': 'AVIF', 'jpeg': 'JPEG'}
+ORIGINAL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif', 'AVIF': 'avif'}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(settings, 'IMAGE_WORKERS', None) or os.cpu_count() or 1
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image')
+    return _pool
+
+
+def max_upload_size():
+    return getattr(settings, 'IMAGE_MAX_UPLOAD_SIZE', 20 * 1024 * 1024)
+
+
+def variant_widths(original_width):
+    # 元画像と同じ幅は元画像そのものを使う
+    return sorted({w for w in getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 1024)) if w < original_width})
+
+
+def variant_formats():
+    Image.init()
+    formats = getattr(settings, 'IMAGE_FORMATS', ('avif', 'webp'))
+    return [fmt for fmt in formats if PILLOW_FORMATS.get(fmt) in Image.SAVE]
+
+
+def inspect(data):
+    """Return ``(format, width, height)`` of the image in ``data``, after EXIF rotation."""
+    try:
+        # open() はヘッダーしか読まないので、展開する前に画素数を確かめられる
+        with Image.open(BytesIO(data)) as image:
+            width, height = image.size
+            if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+                raise InvalidImage(f'Image has more than {Image.MAX_IMAGE_PIXELS} pixels')
+            image.verify()
+        with Image.open(BytesIO(data)) as image:
+            # 90 度回転の EXIF を持つ写真は縦横が入れ替わる
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return image.format, width, height
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f'Unsupported or corrupt image: {e}') from e
+
+
+def render_variant(data, width, fmt):
+    """Decode ``data``, scale it to ``width`` and encode it as ``fmt``; returns bytes."""
+    with Image.open(BytesIO(data)) as image:
+        # JPEG は DCT スケーリングで縮小デコードしてから正確にリサイズする
+        image.draft('RGB', (width, width))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        height = max(1, round(image.height * width / image.width))
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        if fmt == 'jpeg' and image.mode == 'RGBA':
+            image = image.convert('RGB')
+        out = BytesIO()
+        image.save(out, PILLOW_FORMATS[fmt], quality=getattr(settings, 'IMAGE_QUALITY', 75))
+        return out.getvalue()
+
+
+def render_variants(prefix, data, width):
+    """Render and store every variant of the original in ``data``; returns the ``variants`` list."""
+    pool = get_pool()
+    jobs = [
+        (w, fmt, pool.submit(render_variant, data, w, fmt))
+        for fmt in variant_formats() for w in variant_widths(width)
+    ]
+    variants = []
+    try:
+        for w, fmt, job in jobs:
+            name = default_storage.save(f'{prefix}/{w}.{fmt}', ContentFile(job.result()))
+            variants.append({'width': w, 'format': fmt, 'name': name})
+    except BaseException:
+        delete(None, variants)
+        raise
+    return variants
+
+
+def deferred():
+    return getattr(settings, 'IMAGE_PROCESSING', 'queue') == 'queue'
+
+
+def delete(original, variants=()):
+    """Remove stored files of an upload whose row was never saved."""
+    for name in [original, *(v['name'] for v in variants)]:
+        if name:
+            default_storage.delete(name)
+
+
+def ingest(instance, data, defer=False):
+    """
+    Store ``data`` as the original image of ``instance`` and generate its
+    variants. Sets ``image_url``, ``width``, ``height`` and ``variants`` on
+    the instance and returns the storage name of the original; the caller
+    saves the instance and calls ``delete()`` if that fails.
+
+    With ``defer`` only the original is stored and ``variants`` stays empty;
+    the caller enqueues ``images.render`` once the instance is saved.
+    """
+    original_format, width, height = inspect(data)
+    prefix = f'{instance._meta.model_name}/{uuid.uuid4().hex}'
+    extension = ORIGINAL_EXTENSIONS.get(original_format, original_format.lower())
+    original = default_storage.save(f'{prefix}/original.{extension}', ContentFile(data))
+
+    instance.image_url = default_storage.url(original)
+    instance.width = width
+    instance.height = height
+    instance.variants = []
+    if not defer:
+        try:
+            instance.variants = render_variants(prefix, data, width)
+        except BaseException:
+            delete(original)
+            raise
+    return original
+
+
+@tasks.register('images.render')
+def render_task(model, pk, original):
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    with default_storage.open(original, 'rb') as f:
+        data = f.read()
+    instance.variants = render_variants(original.rsplit('/', 1)[0], data, instance.width)
+    # save() でシグナルが飛び、ETag のバージョンも進む
+    instance.save(update_fields=['variants'])
+
+
+def _url_function():
+    # FileSystemStorage.url() は毎回 urljoin を通る。生成したファイル名には '..' などが
+    # 含まれないので、base_url に連結するだけで同じ URL になる（一覧では 1 行に 6 回呼ばれる）
+    if isinstance(default_storage, FileSystemStorage):
+        base_url = default_storage.base_url
+        return lambda name: base_url + filepath_to_uri(name)
+    return default_storage.url
+
+
+def srcset(variants):
+    """``{"webp": "/media/... 320w, /media/... 640w", ...}`` for ``<picture>`` sources."""
+    if not variants:
+        return {}
+    url = _url_function()
+    sources = {}
+    for variant in sorted(variants, key=lambda v: v['width']):
+        sources.setdefault(variant['format'], []).append(f'{url(variant["name"])} {variant["width"]}w')
+    return {fmt: ', '.join(entries) for fmt, entries in sources.items()}
@@ -0,0 +1,150 @@
+"""
+In-process top-N leaderboards for the ``/top`` endpoints.
+
+Each board keeps the ``LEADERBOARD_SIZE`` most liked objects of a model in
+memory. Likes update the board incrementally, so ``/top`` is served without a
+database round trip once the board is warm. A cold or expired board is
+reloaded with one indexed ``ORDER BY likes DESC, id DESC LIMIT n`` query,
+which concurrent requests wait for instead of repeating it; the TTL bounds
+how far boards in different workers can drift apart. Boards load from the
+primary, never from a read replica.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .replicas import PRIMARY
+
+
+def _rank(instance):
+    return (instance.likes, instance.pk)
+
+
+class Leaderboard:
+    def __init__(self, model, size=50, ttl=60.0):
+        self.model = model
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entries = None
+        self._ranked = []
+        self._complete = False
+        self._loaded_at = 0.0
+
+    def _is_warm(self):
+        return self._entries is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _queryset(self):
+        return self.model.objects.using(PRIMARY).select_related('user').order_by('-likes', '-id')[:self.size]
+
+    def load(self):
+        self._install(list(self._queryset()))
+
+    async def aload(self):
+        self._install([row async for row in self._queryset()])
+
+    def _install(self, rows):
+        with self._lock:
+            self._entries = {row.pk: row for row in rows}
+            self._ranked = rows
+            # テーブル全体が収まっている場合は新しい行もボードに追加できる
+            self._complete = len(rows) < self.size
+            self._loaded_at = time.monotonic()
+
+    def top(self, limit):
+        if not self._is_warm():
+            # 同時に来た読み込みは 1 回のクエリにまとめる
+            with self._load_lock:
+                if not self._is_warm():
+                    self.load()
+        with self._lock:
+            return self._ranked[:limit]
+
+    async def atop(self, limit):
+        if not self._is_warm():
+            await self.aload()
+        with self._lock:
+            return self._ranked[:limit]
+
+    def record(self, instance):
+        """Update the board after ``instance.likes`` changed or it was saved."""
+        with self._lock:
+            if self._entries is None:
+                return
+            if instance.pk not in self._entries:
+                if len(self._entries) >= self.size:
+                    if _rank(instance) <= _rank(self._ranked[-1]):
+                        return
+                    del self._entries[self._ranked[-1].pk]
+                    self._complete = False
+                elif not self._complete:
+                    return
+            self._entries[instance.pk] = instance
+            self._ranked = sorted(self._entries.values(), key=_rank, reverse=True)
+
+    def discard(self, pk):
+        with self._lock:
+            if self._entries is not None and pk in self._entries:
+                # 次点の行が分からないので、次回の読み込みで再構築する
+                self._entries = None
+                self._ranked = []
+
+    def clear(self):
+        with self._lock:
+            self._entries = None
+            self._ranked = []
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def get_leaderboard(model):
+    board = _boards.get(model)
+    if board is None:
+        with _boards_lock:
+            board = _boards.setdefault(model, Leaderboard(
+                model,
+                size=max_limit(),
+                ttl=getattr(settings, 'LEADERBOARD_TTL', 60.0),
+            ))
+    return board
+
+
+def max_limit():
+    return getattr(settings, 'LEADERBOARD_MAX_LIMIT', 50)
+
+
+def parse_limit(value, default=5):
+    """Clamp a ``limit`` query parameter to ``1..LEADERBOARD_MAX_LIMIT``."""
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, max_limit()))
+
+
+def top(model, limit):
+    return get_leaderboard(model).top(limit)
+
+
+async def atop(model, limit):
+    return await get_leaderboard(model).atop(limit)
+
+
+def record(instance):
+    if type(instance) in _boards:
+        _boards[type(instance)].record(instance)
+
+
+def discard(model, pk):
+    if model in _boards:
+        _boards[model].discard(pk)
+
+
+def invalidate(model):
+    """Drop a board after writes that bypass model signals (e.g. bulk_create)."""
+    if model in _boards:
+        _boards[model].clear()
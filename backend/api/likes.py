@@ -0,0 +1,268 @@
+"""
+Like counters for Photo and Word.
+
+Likes are applied with server-side ``UPDATE ... SET likes = likes + n``
+statements, so concurrent requests never lose increments and only the
+``likes`` column is written.
+
+When ``LIKES_WRITE_BEHIND`` is enabled, likes are buffered in process and
+flushed in batches (one UPDATE per model) every ``LIKES_FLUSH_INTERVAL``
+seconds or once ``LIKES_FLUSH_THRESHOLD`` likes are pending, so a viral
+photo does not serialize every writer on its row lock. With
+``LIKES_FLUSH_TO_QUEUE`` a flush only enqueues one ``likes.apply`` task per
+model and a ``run_tasks`` worker performs the UPDATE.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import counters, leaderboard, likesets, objectcache, tasks, trending
+from .conditional import bump_version
+
+logger = logging.getLogger(__name__)
+
+
+def apply_likes(model, counts, owners=None):
+    """
+    Apply ``{pk: n}`` increments to ``model`` in a single UPDATE and credit
+    them to the owners' ``likes_received`` (``owners`` maps pks to user ids
+    the caller already knows). Call it inside a transaction.
+    Trending events are written by ``like()``, ``unlike()`` and
+    ``like_many()``, which know when each like was made.
+    """
+    counts = {pk: n for pk, n in counts.items() if n}
+    if not counts:
+        return 0
+    objectcache.invalidate(model, counts)
+    amounts = set(counts.values())
+    if len(amounts) == 1:
+        delta = Value(amounts.pop())
+    else:
+        delta = Case(
+            *[When(pk=pk, then=Value(n)) for pk, n in counts.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    updated = model.objects.filter(pk__in=list(counts)).update(likes=F('likes') + delta)
+    counters.add_likes(model, counts, owners)
+    return updated
+
+
+@tasks.register('likes.apply')
+def apply_likes_task(model, counts, owners=None):
+    model = apps.get_model(model)
+    with transaction.atomic():
+        apply_likes(model, {int(pk): n for pk, n in counts.items()},
+                    {int(pk): user_id for pk, user_id in (owners or {}).items()})
+    bump_version(model)
+
+
+class LikeBuffer:
+    """In-process write-behind buffer of pending like increments."""
+
+    def __init__(self, threshold=500, interval=1.0):
+        self.threshold = threshold
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        # 持ち主の likes_received もフラッシュ時にまとめて加算する
+        self._owners = defaultdict(dict)
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._thread = None
+
+    def add(self, model, pk, n=1, owner=None):
+        """Buffer ``n`` likes of an object owned by user ``owner``; return its pending count."""
+        with self._lock:
+            self._pending[model][pk] += n
+            if owner is not None:
+                self._owners[model][pk] = owner
+            self._size += n
+            pending = self._pending[model][pk]
+            due = (self._size >= self.threshold
+                   or time.monotonic() - self._last_flush >= self.interval)
+        if due:
+            self.flush()
+        return pending
+
+    def pending(self, model, pk):
+        with self._lock:
+            return self._pending.get(model, {}).get(pk, 0)
+
+    def flush(self):
+        """Write all pending likes to the database. Returns the number flushed."""
+        with self._flush_lock:
+            with self._lock:
+                batch, owners = self._pending, self._owners
+                self._pending = defaultdict(lambda: defaultdict(int))
+                self._owners = defaultdict(dict)
+                self._size = 0
+                self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    for model, counts in batch.items():
+                        if getattr(settings, 'LIKES_FLUSH_TO_QUEUE', False):
+                            tasks.enqueue('likes.apply', {'model': model._meta.label, 'counts': counts,
+                                                          'owners': owners.get(model, {})})
+                        else:
+                            apply_likes(model, counts, owners.get(model))
+                            bump_version(model)
+            except Exception:
+                # 失敗した分はバッファに戻して次回のフラッシュで再試行する
+                self._merge(batch, owners)
+                raise
+            return sum(sum(counts.values()) for counts in batch.values())
+
+    def _merge(self, batch, owners):
+        with self._lock:
+            for model, known in owners.items():
+                self._owners[model] = {**known, **self._owners[model]}
+            for model, counts in batch.items():
+                for pk, n in counts.items():
+                    self._pending[model][pk] += n
+                    self._size += n
+
+    def start(self):
+        """Start a daemon thread that flushes the buffer periodically."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='like-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush buffered likes')
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LikeBuffer(
+                    threshold=getattr(settings, 'LIKES_FLUSH_THRESHOLD', 500),
+                    interval=getattr(settings, 'LIKES_FLUSH_INTERVAL', 1.0),
+                )
+                _buffer.start()
+    return _buffer
+
+
+def write_behind_enabled():
+    return getattr(settings, 'LIKES_WRITE_BEHIND', False)
+
+
+def record_like(instance, n=1):
+    """
+    Add ``n`` likes to a Photo or Word and update ``instance.likes``.
+
+    In write-behind mode the returned count includes this process's pending
+    likes and may lag behind other workers until the next flush.
+    """
+    model = type(instance)
+    if write_behind_enabled():
+        instance.likes += get_buffer().add(model, instance.pk, n, owner=instance.user_id)
+    else:
+        with transaction.atomic():
+            apply_likes(model, {instance.pk: n}, {instance.pk: instance.user_id})
+        instance.refresh_from_db(fields=['likes'])
+    if n > 0:
+        leaderboard.record(instance)
+    else:
+        # 減った行は盤外の次点より下がるかもしれないので盤から外す
+        leaderboard.discard(model, instance.pk)
+    bump_version(model)
+    return instance.likes
+
+
+def record_likes(model, counts, owners=None):
+    """
+    Apply ``{pk: n}`` likes in one statement and return the liked objects.
+    ``owners`` (``{pk: user_id}``) saves looking the owners up.
+
+    Unknown primary keys are ignored.
+    """
+    owners = owners or {}
+    if write_behind_enabled():
+        buffer = get_buffer()
+        for pk, n in counts.items():
+            buffer.add(model, pk, n, owner=owners.get(pk))
+        objects = list(model.objects.select_related('user').filter(pk__in=list(counts)))
+        for obj in objects:
+            obj.likes += buffer.pending(model, obj.pk)
+    else:
+        with transaction.atomic():
+            apply_likes(model, counts, owners)
+            objects = list(model.objects.select_related('user').filter(pk__in=list(counts)))
+    for obj in objects:
+        leaderboard.record(obj)
+    bump_version(model)
+    return objects
+
+
+def _add_pending(instance):
+    # 何も数えなかったときも record_like と同じく未フラッシュ分を含めて返す
+    if write_behind_enabled():
+        instance.likes += get_buffer().pending(type(instance), instance.pk)
+
+
+def like(user, instance):
+    """Like ``instance`` as ``user``; returns False (and counts nothing) if it was already liked."""
+    model = type(instance)
+    if not likesets.liked(user.pk, model, [instance.pk]):
+        now = timezone.now()
+        with transaction.atomic():
+            if likesets.add(user.pk, model, [instance.pk], at=now):
+                trending.record(model, {instance.pk: 1}, now)
+                record_like(instance)
+                return True
+    _add_pending(instance)
+    return False
+
+
+def unlike(user, instance):
+    """Withdraw ``user``'s like of ``instance``; returns False if there was none."""
+    with transaction.atomic():
+        liked_at = likesets.remove(user.pk, type(instance), instance.pk)
+        if liked_at is None:
+            _add_pending(instance)
+            return False
+        # 取り消したいいねと同じ重みをトレンドから引く
+        trending.record(type(instance), {instance.pk: -1}, liked_at)
+        record_like(instance, -1)
+    return True
+
+
+def like_many(user, model, ids):
+    """
+    Like ``ids`` as ``user`` and return the objects. Objects the user already
+    liked are returned but not counted again; unknown ids are ignored.
+    """
+    owners = dict(model.objects.filter(pk__in=set(ids)).values_list('pk', 'user_id'))
+    existing = set(owners)
+    new = existing - likesets.liked(user.pk, model, existing)
+    now = timezone.now()
+    with transaction.atomic():
+        added = likesets.add(user.pk, model, new, at=now)
+        trending.record(model, dict.fromkeys(added, 1), now)
+        return record_likes(model, {pk: int(pk in added) for pk in existing}, owners)
@@ -0,0 +1,242 @@
+"""
+Which photos and words has a user liked?
+
+``Like`` rows are the source of truth: one row per user and object, enforced
+by the ``like_unique`` constraint. Writes always go to the database and the
+constraint decides whether a like is new, so concurrent requests of one user
+can never count twice.
+
+Reads (``liked_by_me`` on every serialized photo and word) are answered from
+memory. Each process keeps the liked ids of its ``LIKESET_CACHE_USERS`` most
+recently active users in an LRU; a user's set is one sorted ``array('q')``
+per target (8 bytes per like) searched with bisect, loaded with a single
+query on the unique index. Every like or unlike bumps a per-user version
+stamp in the Django cache; a set whose stamp no longer matches is reloaded,
+so with a shared cache (``REDIS_URL``) a like made through another worker
+shows up on the next request. The worker that made the change does not
+reload: when the transaction commits it bisect-inserts or removes the ids
+in its cached set and tags it with the new stamp, and the like response is
+rendered from the liked objects alone (``respond_with``). Without one, several workers run with
+``LIKESET_CACHE_USERS = 0`` and load the set on every request.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Like
+from .trending import TARGET_OF
+
+VERSION_KEY = 'api:likes:{}'
+VERSION_TTL = 24 * 3600
+
+
+class LikeSet:
+    __slots__ = ('version', 'ids')
+
+    def __init__(self, version, ids):
+        self.version = version
+        self.ids = ids
+
+    def has(self, model, pk):
+        ids = self.ids.get(TARGET_OF.get(model))
+        if not ids:
+            return False
+        index = bisect_left(ids, pk)
+        return index < len(ids) and ids[index] == pk
+
+
+EMPTY = LikeSet(None, {})
+
+_sets = OrderedDict()
+_lock = threading.Lock()
+
+
+def _capacity():
+    return getattr(settings, 'LIKESET_CACHE_USERS', 10000)
+
+
+def _version_key(user_id):
+    return VERSION_KEY.format(user_id)
+
+
+def get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=VERSION_TTL)
+        version = cache.get(key) or time.time_ns()
+    return version
+
+
+def _bump(user_id):
+    key = _version_key(user_id)
+    version = max(time.time_ns(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=VERSION_TTL)
+    return version
+
+
+def bump_version(user_id):
+    """Invalidate the user's set in every process."""
+    _bump(user_id)
+    with _lock:
+        _sets.pop(user_id, None)
+
+
+def _changed(user_id, target, pks, liked):
+    # 今すぐバージョンを進め（他のプロセスと ETag 用）、コミット時にもう一度進めて手元の集合を直す
+    expected = cache.get(_version_key(user_id))
+    _bump(user_id)
+    transaction.on_commit(lambda: _patch(user_id, target, pks, liked, expected))
+
+
+def _patch(user_id, target, pks, liked, expected):
+    version = _bump(user_id)
+    with _lock:
+        likes = _sets.get(user_id)
+        if likes is None:
+            return
+        if likes.version != expected:
+            # 途中で読み直されたか別のプロセスが書いた集合は直さずに捨てる
+            del _sets[user_id]
+            return
+        # 読み中の他のリクエストがあるので複製してから直す
+        ids = array('q', likes.ids.get(target, ()))
+        for pk in pks:
+            index = bisect_left(ids, pk)
+            present = index < len(ids) and ids[index] == pk
+            if liked and not present:
+                ids.insert(index, pk)
+            elif not liked and present:
+                del ids[index]
+        _sets[user_id] = LikeSet(version, {**likes.ids, target: ids})
+
+
+def user_key(user):
+    """Part of a personalized ETag: changes whenever ``user`` likes or unlikes something."""
+    return '' if user is None else f'{user.pk}:{get_version(user.pk)}'
+
+
+def _build(version, rows):
+    ids = {}
+    for target, object_id in sorted(rows):
+        ids.setdefault(target, array('q')).append(object_id)
+    return LikeSet(version, ids)
+
+
+def _cached(user_id, version):
+    with _lock:
+        likes = _sets.get(user_id)
+        if likes is not None and likes.version == version:
+            _sets.move_to_end(user_id)
+            return likes
+    return None
+
+
+def _install(user_id, likes):
+    with _lock:
+        _sets[user_id] = likes
+        _sets.move_to_end(user_id)
+        while len(_sets) > _capacity():
+            _sets.popitem(last=False)
+    return likes
+
+
+def _rows(user_id):
+    return Like.objects.filter(user_id=user_id).values_list('target', 'object_id')
+
+
+def get(user_id):
+    """The user's LikeSet, reloaded when its version stamp changed."""
+    # 行より先にバージョンを読む（読み込み中のいいねは次回の不一致で拾う）
+    version = get_version(user_id)
+    return _cached(user_id, version) or _install(user_id, _build(version, list(_rows(user_id))))
+
+
+async def aget(user_id):
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        version = get_version(user_id)
+    return _cached(user_id, version) or _install(user_id, _build(version, [row async for row in _rows(user_id)]))
+
+
+def for_request(request, user):
+    """Memoized LikeSet of the request's user (``EMPTY`` when logged out)."""
+    request = getattr(request, '_request', request)
+    if not hasattr(request, '_api_likes'):
+        request._api_likes = EMPTY if user is None else get(user.pk)
+    return request._api_likes
+
+
+def respond_with(request, model, pks):
+    """
+    Answer ``liked_by_me`` for the rest of the request from ``pks`` alone.
+    For like responses, which only render objects whose state is known, so
+    the user's whole set is not reloaded after the write.
+    """
+    getattr(request, '_request', request)._api_likes = LikeSet(None, {TARGET_OF[model]: array('q', sorted(pks))})
+
+
+async def afor_request(request, user):
+    if not hasattr(request, '_api_likes'):
+        request._api_likes = EMPTY if user is None else await aget(user.pk)
+    return request._api_likes
+
+
+def liked(user_id, model, pks):
+    """The subset of ``pks`` the user has liked, read from the database."""
+    return set(Like.objects.filter(user_id=user_id, target=TARGET_OF[model], object_id__in=set(pks))
+               .values_list('object_id', flat=True))
+
+
+def add(user_id, model, pks, at=None):
+    """
+    Insert likes of ``pks`` (existing objects) made at ``at`` (now by
+    default); returns the set of pks that were not liked yet. Filter ``pks``
+    with ``liked()`` first, outside the transaction: this only inserts, so
+    its transaction starts with a write.
+    """
+    target = TARGET_OF[model]
+    pks = set(pks)
+    if not pks:
+        return pks
+    at = at or timezone.now()
+    try:
+        with transaction.atomic():
+            Like.objects.bulk_create([Like(user_id=user_id, target=target, object_id=pk, created_at=at)
+                                      for pk in pks])
+    except IntegrityError:
+        # 同じユーザーの並行リクエストと競合した。1 件ずつ入れて、入ったものだけを新規とする
+        pks = {pk for pk in pks if _insert(user_id, target, pk, at)}
+    _changed(user_id, target, pks, True)
+    return pks
+
+
+def _insert(user_id, target, pk, at):
+    try:
+        with transaction.atomic():
+            Like.objects.create(user_id=user_id, target=target, object_id=pk, created_at=at)
+    except IntegrityError:
+        return False
+    return True
+
+
+def remove(user_id, model, pk):
+    """Delete the user's like of ``pk``; returns when it was made, or None if there was none."""
+    like = Like.objects.filter(user_id=user_id, target=TARGET_OF[model], object_id=pk).only('created_at').first()
+    # 並行した取り消しと競合したら消せた方だけが数える
+    if like is None or not Like.objects.filter(pk=like.pk).delete()[0]:
+        return None
+    _changed(user_id, TARGET_OF[model], [pk], False)
+    return like.created_at
+
+
+def forget_object(model, pk):
+    """Drop the like rows of a deleted photo or word."""
+    Like.objects.filter(target=TARGET_OF[model], object_id=pk).delete()
@@ -0,0 +1,47 @@
+import gzip
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api import export
+from api.models import Photo, Word, Experience
+from api.renderers import CSVRenderer, NDJSONRenderer
+
+MODELS = {'photos': Photo, 'words': Word, 'experiences': Experience}
+RENDERERS = {'ndjson': NDJSONRenderer, 'csv': CSVRenderer}
+
+
+class Command(BaseCommand):
+    help = 'Write photos, words and experiences to gzipped NDJSON or CSV files (same rows as /export/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=list(MODELS), nargs='+', default=list(MODELS))
+        parser.add_argument('--format', choices=list(RENDERERS), default='ndjson')
+        parser.add_argument('--since', help='Only rows created after this ISO 8601 datetime')
+        parser.add_argument('--after-id', type=int, default=None,
+                            help='With --since, resume right after the row (since, after-id) of a previous export')
+        parser.add_argument('--output-dir', default='.', help='Directory for <model>.<format>.gz')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per fetch (default EXPORT_CHUNK_SIZE)')
+        parser.add_argument('--level', type=int, default=6, choices=range(1, 10), help='gzip compression level')
+
+    def handle(self, *args, **kwargs):
+        since = None
+        if kwargs['since']:
+            try:
+                since = export.parse_since(kwargs['since'])
+            except ValueError:
+                raise CommandError(f'--since must be an ISO 8601 datetime: {kwargs["since"]}')
+        if kwargs['after_id'] is not None and since is None:
+            raise CommandError('--after-id requires --since')
+        os.makedirs(kwargs['output_dir'], exist_ok=True)
+        renderer = RENDERERS[kwargs['format']]()
+        for name in kwargs['model']:
+            path = os.path.join(kwargs['output_dir'], f'{name}.{kwargs["format"]}.gz')
+            started = time.monotonic()
+            # 書き終えるまでは一時ファイルに書き、途中で失敗しても前回のファイルを壊さない
+            with gzip.open(f'{path}.tmp', 'wb', compresslevel=kwargs['level']) as f:
+                for chunk in export.stream(MODELS[name], renderer, since, kwargs['chunk_size'], kwargs['after_id']):
+                    f.write(chunk)
+            os.replace(f'{path}.tmp', path)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: wrote {path} ({os.path.getsize(path)} bytes) in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+from api import images
+from api.models import Photo, Experience
+
+MODELS = {'photos': Photo, 'experiences': Experience}
+
+
+class Command(BaseCommand):
+    help = 'Download remote image_url originals and generate their responsive variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=list(MODELS), nargs='+', default=list(MODELS))
+        parser.add_argument('--limit', type=int, default=None, help='Process at most N rows per model')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel downloads')
+        parser.add_argument('--timeout', type=float, default=15.0, help='Seconds per download')
+        parser.add_argument('--max-bytes', type=int, default=None,
+                            help='Skip larger originals (default IMAGE_MAX_UPLOAD_SIZE)')
+
+    def handle(self, *args, **kwargs):
+        self.timeout = kwargs['timeout']
+        self.max_bytes = kwargs['max_bytes'] or images.max_upload_size()
+        for name in kwargs['model']:
+            model = MODELS[name]
+            # まだ取り込んでいないリモート画像だけが対象
+            rows = model.objects.filter(variants=[], image_url__startswith='http').order_by('id')
+            if kwargs['limit'] is not None:
+                rows = rows[:kwargs['limit']]
+            started = time.monotonic()
+            done = failed = 0
+            rows = rows.iterator()
+            with ThreadPoolExecutor(max_workers=kwargs['concurrency']) as pool:
+                # 元画像をメモリに溜め込まないよう少しずつダウンロードする
+                while batch := list(islice(rows, kwargs['concurrency'] * 4)):
+                    for instance, data in pool.map(self.download, batch):
+                        if self.ingest(name, instance, data):
+                            done += 1
+                        else:
+                            failed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: ingested {done}, failed {failed} in {time.monotonic() - started:.1f}s'))
+
+    def ingest(self, name, instance, data):
+        try:
+            if data is None:
+                raise images.InvalidImage('download failed')
+            original = images.ingest(instance, data)
+        except images.InvalidImage as e:
+            self.stderr.write(f'{name} #{instance.pk}: {e}')
+            return False
+        try:
+            # save() でシグナルが飛び、ETag のバージョンも進む
+            instance.save(update_fields=['image_url', 'width', 'height', 'variants'])
+        except Exception:
+            images.delete(original, instance.variants)
+            raise
+        return True
+
+    def download(self, instance):
+        request = Request(instance.image_url, headers={'User-Agent': 'thisisjapan-ingest/1.0'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except (OSError, ValueError):
+            return instance, None
+        return instance, data if len(data) <= self.max_bytes else None
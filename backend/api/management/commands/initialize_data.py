@@ -1,17 +1,72 @@
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from api import counters
+from api.conditional import bump_version
 from api.models import User, Photo, Word, Experience
+from api.synthetic import Generator
 
 class Command(BaseCommand):
     help = 'Initialize default data for the This is Japan application'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, default=0,
+            help='Also generate N photos and N words, N/10 users and N/100 experiences of synthetic data',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT statement')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for --scale')
+
     def handle(self, *args, **kwargs):
+        self.batch_size = kwargs['batch_size']
+        # すべて 1 トランザクションでまとめて投入する
+        with transaction.atomic():
+            self.create_default_data()
+            if kwargs['scale']:
+                self.create_synthetic_data(kwargs['scale'], kwargs['seed'])
+            # bulk_create はシグナルを送らないのでユーザーごとのカウンタを集計し直す
+            counters.recount()
+        # bulk_create はシグナルを送らないので ETag 用のバージョンを手動で進める
+        for model in (User, Photo, Word, Experience):
+            bump_version(model)
+        self.stdout.write(self.style.SUCCESS('Default data initialization completed'))
+
+    def bulk_insert(self, model, objects):
+        total = 0
+        objects = iter(objects)
+        while batch := list(islice(objects, self.batch_size)):
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        return total
+
+    def create_synthetic_data(self, scale, seed):
+        generator = Generator(seed=seed)
+        started = time.monotonic()
+        start = User.objects.count()
+        users = User.objects.bulk_create(generator.users(max(1, scale // 10), start=start),
+                                         batch_size=self.batch_size)
+        user_ids = [user.id for user in users]
+        counts = {
+            'users': len(user_ids),
+            'photos': self.bulk_insert(Photo, generator.photos(scale, user_ids)),
+            'words': self.bulk_insert(Word, generator.words(scale, user_ids)),
+            'experiences': self.bulk_insert(Experience, generator.experiences(max(1, scale // 100))),
+        }
+        summary = ', '.join(f'{n} {name}' for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {summary} in {time.monotonic() - started:.1f}s'))
+
+    def create_default_data(self):
         self.stdout.write('Creating default data...')
         
         # Create default user
         default_user, created = User.objects.get_or_create(
             username='defaultuser',
             defaults={
-                'password': 'password123',
+                'password': make_password('password123'),
                 'is_japanese': False
             }
         )
@@ -54,10 +109,10 @@ class Command(BaseCommand):
                 }
             ]
             
-            for photo_data in photos:
-                photo = Photo.objects.create(**photo_data)
-                photo.likes = photo.id  # Set likes proportional to ID for demo
-                photo.save()
+            # Set likes proportional to ID for demo
+            Photo.objects.bulk_create([
+                Photo(likes=i, **photo_data) for i, photo_data in enumerate(photos, start=1)
+            ])
             
             self.stdout.write(self.style.SUCCESS(f'Created {len(photos)} sample photos'))
         
@@ -96,10 +151,10 @@ class Command(BaseCommand):
                 }
             ]
             
-            for word_data in words:
-                word = Word.objects.create(**word_data)
-                word.likes = word.id  # Set likes proportional to ID for demo
-                word.save()
+            # Set likes proportional to ID for demo
+            Word.objects.bulk_create([
+                Word(likes=i, **word_data) for i, word_data in enumerate(words, start=1)
+            ])
             
             self.stdout.write(self.style.SUCCESS(f'Created {len(words)} sample words'))
         
@@ -138,9 +193,6 @@ class Command(BaseCommand):
                 }
             ]
             
-            for exp_data in experiences:
-                Experience.objects.create(**exp_data)
+            Experience.objects.bulk_create([Experience(**exp_data) for exp_data in experiences])
             
-            self.stdout.write(self.style.SUCCESS(f'Created {len(experiences)} sample experiences'))
-        
-        self.stdout.write(self.style.SUCCESS('Default data initialization completed'))
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS(f'Created {len(experiences)} sample experiences'))
\ No newline at end of file
@@ -0,0 +1,103 @@
+import signal
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from api import tasks
+from api.models import Task
+
+
+class Stats:
+    """Per task name counts and run times, shared by the worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.failures = defaultdict(int)
+
+    def add(self, name, ok, seconds):
+        with self.lock:
+            self.durations[name].append(seconds)
+            if not ok:
+                self.failures[name] += 1
+
+    def drain(self):
+        with self.lock:
+            durations, failures = self.durations, self.failures
+            self.durations, self.failures = defaultdict(list), defaultdict(int)
+        return durations, failures
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (api/tasks.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle thread waits before polling again')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between timing summaries (0 = only at exit)')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **kwargs):
+        self.stop = threading.Event()
+        self.stats = Stats()
+        self.once = kwargs['once']
+        self.poll_interval = kwargs['poll_interval']
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop.set())
+
+        requeued = tasks.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale task(s)')
+        threads = [threading.Thread(target=self.work, name=f'task-worker-{i}')
+                   for i in range(kwargs['concurrency'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'Running tasks with {len(threads)} thread(s)')
+
+        interval = kwargs['stats_interval']
+        last_report = time.monotonic()
+        while any(thread.is_alive() for thread in threads):
+            self.stop.wait(1.0)
+            if interval and time.monotonic() - last_report >= interval:
+                last_report = time.monotonic()
+                tasks.requeue_stale()
+                self.report()
+                close_old_connections()
+        for thread in threads:
+            thread.join()
+        self.report()
+        connection.close()
+
+    def work(self):
+        try:
+            while not self.stop.is_set():
+                task = tasks.claim()
+                if task is None:
+                    if self.once:
+                        return
+                    self.stop.wait(self.poll_interval)
+                    continue
+                ok, seconds = tasks.run(task)
+                self.stats.add(task.name, ok, seconds)
+                # 長時間動くワーカーでも切れた接続を使い続けない
+                close_old_connections()
+        finally:
+            connection.close()
+
+    def report(self):
+        durations, failures = self.stats.drain()
+        queued = Task.objects.filter(status=Task.QUEUED).count()
+        failed = Task.objects.filter(status=Task.FAILED).count()
+        self.stdout.write(f'queue: {queued} queued, {failed} failed')
+        for name, samples in sorted(durations.items()):
+            ordered = sorted(samples)
+            self.stdout.write(
+                f'  {name}: {len(samples)} run, {failures[name]} failed, '
+                f'p50 {statistics.median(ordered) * 1000:.1f}ms, '
+                f'p95 {ordered[max(0, round(0.95 * len(ordered)) - 1)] * 1000:.1f}ms, '
+                f'max {ordered[-1] * 1000:.1f}ms')
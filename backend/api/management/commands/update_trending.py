@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api import trending
+
+
+class Command(BaseCommand):
+    help = 'Fold new like events into the trending scores (api/trending.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Events per transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and update every N seconds (0 = run once)')
+
+    def handle(self, *args, **kwargs):
+        while True:
+            started = time.monotonic()
+            processed = trending.update(kwargs['batch_size'])
+            if processed or not kwargs['interval']:
+                self.stdout.write(f'Processed {processed} like events in {time.monotonic() - started:.2f}s')
+            if not kwargs['interval']:
+                break
+            close_old_connections()
+            time.sleep(kwargs['interval'])
@@ -0,0 +1,338 @@
+"""
+Per-route request metrics: latency, SQL query count, DB time, serializer
+time and response size.
+
+``MetricsMiddleware`` samples a fraction of requests (``METRICS_SAMPLE_RATE``,
+0 by default). For a sampled request it:
+
+* counts and times every SQL statement through a database execute wrapper,
+* times top-level ``serializer.data`` calls of the response serializers,
+  and counts the queries run inside them (lazy relation loads, i.e. N+1s).
+  Serializers opt in with the ``TimedData`` mixin (``TimedListSerializer``
+  for ``many=True``) or by wrapping their work in ``serializing()``;
+  DRF itself is left unpatched,
+* records histograms labelled with the URL name, for example ``photo-list``,
+* adds a ``Server-Timing`` header that browser dev tools can display.
+
+Unsampled requests skip all of this, so the only cost is one
+``random()`` call. With sampling off there is no cost at all.
+
+``/metrics`` serves the histograms, and the always-on object cache,
+throttling and coalescing counters, in the Prometheus text format. Values
+are kept per process, so scrape each worker directly (or run one worker
+per container) when the server has several. It is closed by default: with
+``METRICS_TOKEN`` set it requires ``Authorization: Bearer <token>``,
+otherwise it only answers clients in ``METRICS_ALLOWED_IPS`` (loopback by
+default; addresses or networks, matched against ``REMOTE_ADDR``).
+"""
+import ipaddress
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+        for label_values, (counts, total, n) in sorted(series.items()):
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {n}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('api_request_duration_seconds', 'Request latency.', LATENCY_BUCKETS,
+                             ('route', 'method', 'status'))
+DB_QUERIES = Histogram('api_db_queries', 'SQL statements per request.', QUERY_BUCKETS, ('route', 'method'))
+DB_DURATION = Histogram('api_db_duration_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS,
+                        ('route', 'method'))
+SERIALIZER_QUERIES = Histogram('api_serializer_queries', 'SQL statements issued while serializing (N+1s).',
+                               QUERY_BUCKETS, ('route', 'method'))
+SERIALIZER_DURATION = Histogram('api_serializer_duration_seconds', 'Time spent in serializer.data per request.',
+                                LATENCY_BUCKETS, ('route', 'method'))
+RESPONSE_SIZE = Histogram('api_response_size_bytes', 'Response body size.', SIZE_BUCKETS, ('route', 'method'))
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_QUERIES, SERIALIZER_DURATION, RESPONSE_SIZE)
+
+# サンプリングに関係なく常に数える
+OBJECT_CACHE_HITS = Counter('api_object_cache_hits_total', 'Object cache hits (api/objectcache.py).', ('model',))
+OBJECT_CACHE_MISSES = Counter('api_object_cache_misses_total', 'Object cache misses.', ('model',))
+THROTTLED = Counter('api_throttled_requests_total', 'Requests rejected by a rate limit (api/throttling.py).',
+                    ('scope',))
+COALESCED = Counter('api_coalesced_requests_total', 'Requests answered with another request\'s result '
+                    '(api/singleflight.py).', ('view',))
+COUNTERS = (OBJECT_CACHE_HITS, OBJECT_CACHE_MISSES, THROTTLED, COALESCED)
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'serializer_queries', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_queries = 0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+# サンプリング中のリクエストだけがここに統計を持つ（ASGI でも sync_to_async 先に引き継がれる）
+_current = ContextVar('api_request_stats', default=None)
+
+
+@contextmanager
+def collect():
+    """Measure the block as if it were a sampled request (benchmarks and tests)."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+        if stats.serializing:
+            stats.serializer_queries += 1
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
+
+
+connection_created.connect(install_query_wrapper)
+
+@contextmanager
+def serializing():
+    """Count the block as serializer time, and its queries as serializer queries."""
+    stats = _current.get()
+    # ネストしたシリアライザや未サンプリングのリクエストはそのまま
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - started
+        stats.serializing = False
+
+
+class TimedData:
+    """Serializer mixin that measures ``.data`` with ``serializing()``."""
+
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+
+
+def sample_rate():
+    return getattr(settings, 'METRICS_SAMPLE_RATE', 0.0)
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'unmatched'
+
+
+def record(request, response, stats, size):
+    elapsed = time.perf_counter() - stats.started
+    route, method = route_of(request), request.method
+    REQUEST_DURATION.observe((route, method, str(response.status_code)), elapsed)
+    DB_QUERIES.observe((route, method), stats.queries)
+    DB_DURATION.observe((route, method), stats.db_time)
+    SERIALIZER_QUERIES.observe((route, method), stats.serializer_queries)
+    SERIALIZER_DURATION.observe((route, method), stats.serializer_time)
+    RESPONSE_SIZE.observe((route, method), size)
+
+
+def server_timing(stats):
+    total = (time.perf_counter() - stats.started) * 1000
+    return (f'app;dur={total:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'ser;dur={stats.serializer_time * 1000:.1f}')
+
+
+# ストリーミング中のクエリ（.iterator() など）も数えるため、送信中は統計を有効に戻す
+def _count_stream(chunks, request, response, stats):
+    size = 0
+    _current.set(stats)
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _current.set(None)
+        record(request, response, stats, size)
+
+
+async def _acount_stream(chunks, request, response, stats):
+    size = 0
+    _current.set(stats)
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _current.set(None)
+        record(request, response, stats, size)
+
+
+class MetricsMiddleware:
+    """
+    Records per-route metrics for a ``METRICS_SAMPLE_RATE`` fraction of
+    requests and adds ``Server-Timing`` to them. Place it first in
+    MIDDLEWARE so the timings include the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        rate = sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        rate = sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(stats)
+        if response.streaming:
+            # 本文を送り終えた時点で記録する
+            if response.is_async:
+                response.streaming_content = _acount_stream(response.streaming_content, request, response, stats)
+            else:
+                response.streaming_content = _count_stream(response.streaming_content, request, response, stats)
+        else:
+            record(request, response, stats, len(response.content))
+        return response
+
+
+def _allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    networks = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's histograms and counters."""
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    body = '\n'.join(metric.render() for metric in (*HISTOGRAMS, *COUNTERS)) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,49 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# api.search.SEARCH_TARGETS / SEARCH_CONFIG と一致させること
+SEARCH_FIELDS = {
+    'word': ('original', 'translation', 'description'),
+    'photo': ('title', 'description'),
+    'experience': ('title', 'location'),
+}
+
+
+def search_indexes(model_name, fields):
+    yield GinIndex(SearchVector(*fields, config='simple'), name=f'{model_name}_fts_idx')
+    # icontains は UPPER(col) LIKE UPPER(...) になるため式索引にする
+    for field in fields:
+        yield GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=f'{model_name}_{field}_trgm_idx')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('api', model_name)
+        for index in search_indexes(model_name, fields):
+            schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('api', model_name)
+        for index in search_indexes(model_name, fields):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_top_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # api.counters.recount と同じ集計（1 本の UPDATE）
+    User = apps.get_model('api', 'User')
+
+    def total(model_name, expression):
+        rows = apps.get_model('api', model_name).objects.filter(user=OuterRef('pk')).order_by().values('user')
+        return Coalesce(Subquery(rows.annotate(total=expression).values('total')), 0)
+
+    User.objects.update(
+        photo_count=total('Photo', Count('*')),
+        word_count=total('Word', Count('*')),
+        likes_received=total('Photo', Sum('likes')) + total('Word', Sum('likes')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='likes_received',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='photo_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='word_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='photo_user_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='word',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='word_user_feed_idx'),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='api.user'),
+        ),
+        migrations.AlterField(
+            model_name='word',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='words', to='api.user'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
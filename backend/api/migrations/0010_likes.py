@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_user_feeds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Like',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.PositiveSmallIntegerField(choices=[(1, 'Photo'), (2, 'Word')])),
+                ('object_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='liked', to='api.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['target', 'object_id'], name='like_target_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'target', 'object_id'), name='like_unique')],
+            },
+        ),
+    ]
@@ -3,9 +3,13 @@ from django.utils import timezone
 
 class User(models.Model):
     username = models.CharField(max_length=100, unique=True)
-    password = models.CharField(max_length=100)
+    password = models.CharField(max_length=255)
     is_japanese = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # プロフィール用の非正規化カウンタ（api/counters.py が書き込み時に更新する）
+    photo_count = models.IntegerField(default=0)
+    word_count = models.IntegerField(default=0)
+    likes_received = models.IntegerField(default=0)
 
     def __str__(self):
         return self.username
@@ -14,10 +18,26 @@ class Photo(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     image_url = models.CharField(max_length=255)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos')
+    # アップロード画像の寸法とレスポンシブ用バリアント（api.images 参照）
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=list, blank=True)
+    # user_id 単独の索引は photo_user_feed_idx が兼ねる
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos', db_index=False)
     likes = models.IntegerField(default=0)
+    # 時間減衰つきの人気度（対数）。api/trending.py のジョブが更新する
+    trending_score = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='photo_feed_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='photo_user_feed_idx'),
+            models.Index(fields=['-likes', '-id'], name='photo_top_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='photo_trending_idx',
+                         condition=models.Q(trending_score__isnull=False)),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -25,10 +45,20 @@ class Word(models.Model):
     original = models.CharField(max_length=140)
     translation = models.CharField(max_length=140, blank=True, null=True)
     description = models.TextField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='words')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='words', db_index=False)
     likes = models.IntegerField(default=0)
+    trending_score = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='word_feed_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='word_user_feed_idx'),
+            models.Index(fields=['-likes', '-id'], name='word_top_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='word_trending_idx',
+                         condition=models.Q(trending_score__isnull=False)),
+        ]
+
     def __str__(self):
         return self.original
 
@@ -36,8 +66,80 @@ class Experience(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     image_url = models.CharField(max_length=255)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=list, blank=True)
     location = models.CharField(max_length=100)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='experience_feed_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+class LikeEvent(models.Model):
+    """
+    Likes not yet folded into ``trending_score``. Written next to every like
+    counter update and drained by ``api.trending.update()``.
+    """
+    PHOTO = 1
+    WORD = 2
+    TARGET_CHOICES = [(PHOTO, 'Photo'), (WORD, 'Word')]
+
+    target = models.PositiveSmallIntegerField(choices=TARGET_CHOICES)
+    object_id = models.BigIntegerField()
+    count = models.IntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.get_target_display()} #{self.object_id} +{self.count}'
+
+class Like(models.Model):
+    """One user's like of a photo or word (see api/likesets.py)."""
+    # user_id 単独の索引は like_unique が兼ねる
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='liked', db_index=False)
+    target = models.PositiveSmallIntegerField(choices=LikeEvent.TARGET_CHOICES)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'target', 'object_id'], name='like_unique'),
+        ]
+        indexes = [
+            # 写真や単語の削除時にいいねを消すための索引
+            models.Index(fields=['target', 'object_id'], name='like_target_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} likes {self.get_target_display()} #{self.object_id}'
+
+class Task(models.Model):
+    """A unit of deferred work, claimed by ``manage.py run_tasks`` (see api/tasks.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # 待ち行列の先頭だけを読む部分インデックス（成功したタスクは削除される）
+            models.Index(fields=['run_after', 'id'], name='task_queue_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['status', 'started_at'], name='task_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
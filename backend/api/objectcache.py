@@ -0,0 +1,170 @@
+"""
+Per-object cache for the retrieve endpoints, ``users/by_username`` and the
+session user.
+
+Rows are cached by primary key in the ``OBJECT_CACHE_ALIAS`` cache
+(``objects``: a bounded LocMem LRU per process by default, Redis when
+``REDIS_URL`` is set; a dummy cache when several workers run without
+Redis) for ``OBJECT_CACHE_TIMEOUT`` seconds. An entry holds
+the row's column values only and is turned back into an instance with
+``Model.from_db``. Related rows are never embedded: ``get(...,
+related=('user',))`` attaches the author from its own entry, so a renamed
+user cannot linger inside cached photos.
+
+Invalidation:
+
+* a full ``save()`` deletes the entry at once and writes the saved row
+  through to the cache when the transaction commits (``post_save``);
+* ``save(update_fields=...)``, deletes, like increments and bulk writes
+  only delete the entry, at once and again on commit.
+
+Misses fill the cache with ``add()``, so a reader that loaded a row just
+before a write never overwrites the written-through value. The timeout
+bounds how long the remaining races (a read racing a delete or a like) can
+serve an old row. ``trending_score`` is updated with ``bulk_update`` and is
+not invalidated because no endpoint renders it. Misses read the primary even
+when the request reads from a replica (api/replicas.py), so a lagging
+replica never puts an old row into the cache.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import metrics
+from .replicas import PRIMARY
+
+KEY = 'obj:{}:{}'
+INDEX_KEY = 'obj:{}:{}={}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'OBJECT_CACHE_ALIAS', 'objects')]
+
+
+def _timeout():
+    return getattr(settings, 'OBJECT_CACHE_TIMEOUT', 300)
+
+
+def _key(model, pk):
+    return KEY.format(model._meta.label_lower, pk)
+
+
+def _index_key(model, field, value):
+    # 任意の文字列をキーに入れないようにハッシュする
+    return INDEX_KEY.format(model._meta.label_lower, field, hashlib.md5(str(value).encode()).hexdigest())
+
+
+def _normalize_pk(model, pk):
+    """URL の "5" と 5 を同じキーにする。不正な値は model.DoesNotExist"""
+    try:
+        return model._meta.pk.to_python(pk)
+    except ValidationError:
+        raise model.DoesNotExist from None
+
+
+def _values(instance):
+    """Column values of a fully loaded, saved instance, or None if it cannot be cached."""
+    deferred = instance.get_deferred_fields()
+    values = []
+    for field in instance._meta.concrete_fields:
+        if field.attname in deferred:
+            return None
+        value = getattr(instance, field.attname)
+        if hasattr(value, 'resolve_expression'):
+            return None
+        values.append(field.to_python(value))
+    return values
+
+
+def _build(model, values):
+    return model.from_db('default', [f.attname for f in model._meta.concrete_fields], values)
+
+
+def _attach(instance, related):
+    for name in related:
+        field = instance._meta.get_field(name)
+        setattr(instance, name, get(field.related_model, getattr(instance, field.attname)))
+    return instance
+
+
+def _record(model, hit):
+    (metrics.OBJECT_CACHE_HITS if hit else metrics.OBJECT_CACHE_MISSES).inc((model._meta.label_lower,))
+
+
+def get(model, pk, related=()):
+    """Return the instance with ``pk`` (raises ``model.DoesNotExist``)."""
+    pk = _normalize_pk(model, pk)
+    key = _key(model, pk)
+    values = get_cache().get(key)
+    _record(model, values is not None)
+    if values is not None:
+        return _attach(_build(model, values), related)
+    instance = model._default_manager.using(PRIMARY).get(pk=pk)
+    values = _values(instance)
+    get_cache().add(key, values, timeout=_timeout())
+    return _attach(instance, related)
+
+
+async def aget(model, pk):
+    """Async ``get`` without related rows."""
+    pk = _normalize_pk(model, pk)
+    key = _key(model, pk)
+    values = await get_cache().aget(key)
+    _record(model, values is not None)
+    if values is not None:
+        return _build(model, values)
+    instance = await model._default_manager.using(PRIMARY).aget(pk=pk)
+    await get_cache().aadd(key, _values(instance), timeout=_timeout())
+    return instance
+
+
+def get_by(model, field, value, related=()):
+    """
+    Look an instance up by a unique field through a ``value -> pk`` index.
+    The index is never invalidated; a renamed or deleted row simply fails
+    the check below and is looked up again.
+    """
+    key = _index_key(model, field, value)
+    pk = get_cache().get(key)
+    if pk is not None:
+        try:
+            instance = get(model, pk, related)
+        except model.DoesNotExist:
+            instance = None
+        if instance is not None and getattr(instance, field) == value:
+            return instance
+    instance = model._default_manager.using(PRIMARY).get(**{field: value})
+    _record(model, False)
+    get_cache().set(key, instance.pk, timeout=_timeout())
+    get_cache().add(_key(model, instance.pk), _values(instance), timeout=_timeout())
+    return _attach(instance, related)
+
+
+def remember(instance):
+    """Cache a row that was just read, like a miss does (never replaces an entry)."""
+    values = _values(instance)
+    if values is not None:
+        get_cache().add(_key(type(instance), instance.pk), values, timeout=_timeout())
+
+
+def store(instance):
+    """Write ``instance`` through to the cache once the current transaction commits."""
+    model, values = type(instance), _values(instance)
+    key = _key(model, instance.pk)
+    get_cache().delete(key)
+    if values is None:
+        transaction.on_commit(lambda: get_cache().delete(key))
+    else:
+        transaction.on_commit(lambda: get_cache().set(key, values, timeout=_timeout()))
+
+
+def invalidate(model, pks):
+    """Drop cached rows now and again after commit (writes that bypass ``save()``)."""
+    keys = [_key(model, pk) for pk in pks]
+    if not keys:
+        return
+    get_cache().delete_many(keys)
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
@@ -0,0 +1,166 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination on every field of ``ordering``.
+
+    DRF's CursorPagination keeps only the first ordering field in the cursor
+    and steps over rows sharing its value with an OFFSET, so a run of equal
+    ``created_at`` or ``rank`` values is scanned again on every page and rows
+    are repeated or skipped when the run changes between requests. Here the
+    cursor holds all ordering values of the row at the page boundary and the
+    next page is ``WHERE (a, b) < (x, y)`` written out as
+    ``a < x OR (a = x AND b < y)``. The last ordering field must be unique.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request) or (None, False)
+        if position is not None:
+            position = self._to_python(queryset.model, position)
+
+        ordering = tuple(f[1:] if f.startswith('-') else f'-{f}' for f in self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        # 1 件多く読んで先のページの有無を判定する
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        return self.page
+
+    def _after(self, ordering, position):
+        """Rows strictly after ``position`` in ``ordering``."""
+        conditions = []
+        for i, field in enumerate(ordering):
+            equal = {f.lstrip('-'): v for f, v in zip(ordering[:i], position)}
+            lookup = f'{field.lstrip("-")}__{"lt" if field.startswith("-") else "gt"}'
+            conditions.append(Q(**equal, **{lookup: position[i]}))
+        return reduce(or_, conditions)
+
+    def _to_python(self, model, position):
+        values = []
+        for field, value in zip(self.ordering, position):
+            try:
+                values.append(model._meta.get_field(field.lstrip('-')).to_python(value))
+            except FieldDoesNotExist:
+                # 注釈 (rank など) は数値だけ受け付ける
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise NotFound(self.invalid_cursor_message)
+                values.append(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def position(self, row):
+        """Ordering values of ``row`` (a model instance or a ``values()`` dict)."""
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return values
+
+    def decode_cursor(self, request):
+        """Return ``(position, reverse)``, or None on the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            token = json.loads(urlsafe_b64decode(encoded.encode()))
+            position, reverse = token['p'], bool(token.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse=False):
+        token = {'p': position, 'r': 1} if reverse else {'p': position}
+        encoded = urlsafe_b64encode(json.dumps(token, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[0]), reverse=True)
+
+
+class FeedCursorPagination(KeysetCursorPagination):
+    """Keyset pagination over ``(-created_at, -id)``; no COUNT(*) or OFFSET scan."""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class FeedPagination(BasePagination):
+    """
+    Page-number pagination by default, cursor pagination when the request
+    carries a ``cursor`` parameter (``?cursor=`` starts at the first page).
+
+    Set ``FEED_PAGINATION = 'cursor'`` to make cursor mode the default;
+    requests with ``?page=N`` then still get page-number pagination.
+    """
+
+    def __init__(self):
+        self.delegate = None
+
+    def use_cursor(self, request):
+        if FeedCursorPagination.cursor_query_param in request.query_params:
+            return True
+        if getattr(settings, 'FEED_PAGINATION', 'page') == 'cursor':
+            return PageNumberPagination.page_query_param not in request.query_params
+        return False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.delegate = FeedCursorPagination()
+        else:
+            self.delegate = PageNumberPagination()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return FeedCursorPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return FeedCursorPagination().get_schema_operation_parameters(view)
+
+
+class SearchCursorPagination(KeysetCursorPagination):
+    """Keyset pagination over the ordering chosen by the search view."""
+    ordering = ('-rank', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'search_ordering', self.ordering)
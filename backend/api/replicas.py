@@ -0,0 +1,156 @@
+"""
+Read replicas with read-your-writes.
+
+``DB_REPLICAS`` adds a database alias per replica (see settings.py) and
+lists them in ``DATABASE_REPLICAS``. ``PrimaryReplicaRouter`` sends every
+write to ``default`` (the primary) and reads there too, except inside
+``reads()``: the viewsets enter it for ``list``, ``retrieve`` and ``top``
+(``replica_actions``), and it picks one replica for the whole block so a
+page and its count come from the same server.
+
+A client that wrote is pinned to the primary for ``REPLICA_MAX_LAG``
+seconds, the assumed upper bound of replication lag, so it never misses its
+own new photo or like. ``PrimaryPinMiddleware`` sets a cookie after any
+request that wrote through the ORM or was a successful
+POST/PUT/PATCH/DELETE; a request carrying it, or one that already wrote,
+reads the primary. It is a cookie and not a session flag because the
+session is itself read from the database. Sessions are always read from
+the primary.
+
+Other clients may read data up to ``REPLICA_MAX_LAG`` old. Shared caches
+must not keep such rows, so the object cache and the leaderboards load
+from ``PRIMARY``, and ``conditional`` sends no validators for a replica
+response computed within that time of the last write.
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'db_primary'
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG', 5.0)
+
+
+class Routing:
+    """Routing state of one request."""
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_routing = ContextVar('api_db_routing', default=None)
+
+
+def current():
+    """The replica the current block reads from, or None for the primary."""
+    routing = _routing.get()
+    return routing.replica if routing is not None else None
+
+
+@contextmanager
+def reads():
+    """Read from one replica inside the block, unless the client is pinned or already wrote."""
+    routing = _routing.get()
+    token = None
+    if routing is None:
+        routing = Routing()
+        token = _routing.set(routing)
+    previous = routing.replica
+    if replicas() and not routing.pinned and not routing.wrote:
+        routing.replica = random.choice(replicas())
+    try:
+        yield routing.replica
+    finally:
+        routing.replica = previous
+        if token is not None:
+            _routing.reset(token)
+
+
+def may_be_stale(version):
+    """Whether a replica read may predate the write stamped ``version`` (ns, see conditional)."""
+    return current() is not None and time.time_ns() - version < max_lag() * 1_000_000_000
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'sessions':
+            return PRIMARY
+        return current() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # 以降の読み込みは自分の書き込みが見えるプライマリから
+            routing.wrote = True
+            routing.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class PrimaryPinMiddleware:
+    """
+    Tracks writes and pins the client to the primary (see the module
+    docstring). Place it before SessionMiddleware so saving the session
+    counts as a write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = Routing(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, routing)
+
+    async def __acall__(self, request):
+        routing = Routing(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, routing)
+
+    def pin(self, request, response, routing):
+        if not replicas():
+            return response
+        if routing.wrote or (request.method in UNSAFE_METHODS and response.status_code < 400):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=math.ceil(max_lag()), httponly=True,
+                domain=settings.SESSION_COOKIE_DOMAIN, secure=settings.SESSION_COOKIE_SECURE,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        return response
@@ -0,0 +1,84 @@
+"""
+Search over words, photos and experiences.
+
+On PostgreSQL two indexed modes are available:
+
+* ``fts``: full-text search. The tsvector built by ``search_vector()`` is
+  covered by a GIN expression index (migration 0004) and results are ranked
+  with ``ts_rank``.
+* ``trigram``: substring search for Japanese text, which has no word
+  boundaries for the tsvector parser. ``icontains`` filters are backed by
+  per-column ``gin_trgm_ops`` indexes on ``UPPER(column)`` and results are
+  ranked by trigram word similarity. Queries shorter than three
+  characters cannot use a trigram index.
+
+``auto`` (the default) picks ``trigram`` when the query contains Japanese
+characters. Other database backends fall back to an unindexed ``icontains``
+scan, which is only meant for development.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast, Greatest
+
+from .models import Word, Photo, Experience
+
+SEARCH_TARGETS = {
+    'words': (Word, ('original', 'translation', 'description')),
+    'photos': (Photo, ('title', 'description')),
+    'experiences': (Experience, ('title', 'location')),
+}
+
+MODES = ('auto', 'fts', 'trigram')
+
+# 日英混在のため語幹処理をしない simple 設定を使う（0004 の索引と一致させること）
+SEARCH_CONFIG = 'simple'
+
+# ひらがな・カタカナ・CJK 統合漢字・半角カナ
+JAPANESE_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]')
+
+
+def search_vector(fields):
+    return SearchVector(*fields, config=SEARCH_CONFIG)
+
+
+def resolve_mode(query, mode):
+    if mode == 'auto':
+        return 'trigram' if JAPANESE_RE.search(query) else 'fts'
+    return mode
+
+
+def search(target, query, mode='auto'):
+    """
+    Return ``(queryset, ordering)`` for ``query`` against ``target``.
+
+    The queryset is annotated with a float ``rank`` and ``ordering`` is the
+    keyset to paginate it by.
+    """
+    model, fields = SEARCH_TARGETS[target]
+    queryset = model.objects.all()
+    if model is not Experience:
+        queryset = queryset.select_related('user')
+
+    if connection.vendor != 'postgresql':
+        matches = reduce(or_, [Q(**{f'{field}__icontains': query}) for field in fields])
+        return queryset.filter(matches).annotate(rank=Value(0.0)), ('-created_at', '-id')
+
+    if resolve_mode(query, mode) == 'trigram':
+        matches = reduce(or_, [Q(**{f'{field}__icontains': query}) for field in fields])
+        similarities = [TrigramWordSimilarity(query, field) for field in fields]
+        rank = Greatest(*similarities)
+        queryset = queryset.filter(matches)
+    else:
+        vector = search_vector(fields)
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = queryset.alias(document=vector).filter(document=search_query)
+        rank = SearchRank(vector, search_query)
+    # real のままだとカーソル位置の文字列表現が往復で一致しないため double に揃える
+    return queryset.annotate(rank=Cast(rank, FloatField())), ('-rank', '-id')
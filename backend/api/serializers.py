@@ -1,10 +1,85 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+from . import auth, counters, images, likesets, metrics
 from .models import User, Photo, Word, Experience
 
-class UserSerializer(serializers.ModelSerializer):
+def batch_max_size():
+    return getattr(settings, 'BATCH_MAX_SIZE', 500)
+
+def fast_serialization():
+    return getattr(settings, 'FAST_SERIALIZATION', True)
+
+class BatchUserField(serializers.PrimaryKeyRelatedField):
+    """Resolves users from the batch's single prefetch query instead of one query per item."""
+
+    def to_internal_value(self, data):
+        users = getattr(self.parent.parent, 'prefetched_users', None)
+        if users is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return users[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+class TimedListSerializer(metrics.TimedData, serializers.ListSerializer):
+    """ListSerializer whose ``.data`` is measured by api/metrics.py (``many=True`` of the serializers below)."""
+
+class BulkCreateListSerializer(TimedListSerializer):
+    """Validates a batch with one user lookup and inserts it with one bulk_create."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            user_ids = set()
+            for item in data:
+                try:
+                    user_ids.add(int(item['user']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self.prefetched_users = User.objects.in_bulk(user_ids)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            objects = model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+            # シグナルが飛ばないので投稿者のカウンタはここで進める
+            counters.add_items(model, objects)
+            return objects
+
+class SrcsetField(serializers.ReadOnlyField):
+    """Renders the stored image variants as one ``srcset`` string per format."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'variants')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return images.srcset(value)
+
+class LikedByMeField(serializers.ReadOnlyField):
+    """Whether the requesting user liked the object, from the LikeSet in the context (no query per row)."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return self.context.get('likes', likesets.EMPTY).has(type(instance), instance.pk)
+
+class UserSerializer(metrics.TimedData, serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'is_japanese', 'created_at']
+        fields = ['id', 'username', 'is_japanese', 'created_at', 'photo_count', 'word_count', 'likes_received']
+        read_only_fields = ['photo_count', 'word_count', 'likes_received']
+        list_serializer_class = TimedListSerializer
 
 class UserCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,34 +87,190 @@ class UserCreateSerializer(serializers.ModelSerializer):
         fields = ['username', 'password', 'is_japanese']
         extra_kwargs = {'password': {'write_only': True}}
 
-class PhotoSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        validated_data['password'] = auth.hash_password(validated_data['password'])
+        return super().create(validated_data)
+
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'is_japanese']
+
+class PhotoSerializer(metrics.TimedData, serializers.ModelSerializer):
+    srcset = SrcsetField()
+    liked_by_me = LikedByMeField()
+
     class Meta:
         model = Photo
-        fields = ['id', 'title', 'description', 'image_url', 'user', 'likes', 'created_at']
-        read_only_fields = ['likes']
+        fields = ['id', 'title', 'description', 'image_url', 'width', 'height', 'srcset', 'user', 'likes',
+                  'liked_by_me', 'created_at']
+        read_only_fields = ['likes', 'width', 'height']
+        list_serializer_class = TimedListSerializer
+
+class PhotoWithAuthorSerializer(PhotoSerializer):
+    user = AuthorSerializer(read_only=True)
 
 class PhotoCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Photo
         fields = ['title', 'description', 'image_url', 'user']
 
-class WordSerializer(serializers.ModelSerializer):
+class PhotoUploadSerializer(PhotoCreateSerializer):
+    """Multipart upload: ``image_url`` is filled in from the stored original."""
+    image = serializers.ImageField(write_only=True)
+
+    class Meta(PhotoCreateSerializer.Meta):
+        fields = ['title', 'description', 'user', 'image']
+
+class PhotoBatchCreateSerializer(PhotoCreateSerializer):
+    user = BatchUserField(queryset=User.objects.all())
+
+    class Meta(PhotoCreateSerializer.Meta):
+        list_serializer_class = BulkCreateListSerializer
+
+class WordSerializer(metrics.TimedData, serializers.ModelSerializer):
+    liked_by_me = LikedByMeField()
+
     class Meta:
         model = Word
-        fields = ['id', 'original', 'translation', 'description', 'user', 'likes', 'created_at']
+        fields = ['id', 'original', 'translation', 'description', 'user', 'likes', 'liked_by_me', 'created_at']
         read_only_fields = ['likes']
+        list_serializer_class = TimedListSerializer
+
+class WordWithAuthorSerializer(WordSerializer):
+    user = AuthorSerializer(read_only=True)
 
 class WordCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Word
         fields = ['original', 'translation', 'description', 'user']
 
-class ExperienceSerializer(serializers.ModelSerializer):
+class WordBatchCreateSerializer(WordCreateSerializer):
+    user = BatchUserField(queryset=User.objects.all())
+
+    class Meta(WordCreateSerializer.Meta):
+        list_serializer_class = BulkCreateListSerializer
+
+class ExperienceSerializer(metrics.TimedData, serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = Experience
-        fields = ['id', 'title', 'description', 'image_url', 'location', 'created_at']
+        fields = ['id', 'title', 'description', 'image_url', 'width', 'height', 'srcset', 'location', 'created_at']
+        read_only_fields = ['width', 'height']
+        list_serializer_class = TimedListSerializer
 
 class ExperienceCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Experience
-        fields = ['title', 'description', 'image_url', 'location']
\ No newline at end of file
+        fields = ['title', 'description', 'image_url', 'location']
+
+class ExperienceUploadSerializer(ExperienceCreateSerializer):
+    image = serializers.ImageField(write_only=True)
+
+    class Meta(ExperienceCreateSerializer.Meta):
+        fields = ['title', 'description', 'location', 'image']
+
+class BatchLikeSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_ids(self, value):
+        if len(value) > batch_max_size():
+            raise serializers.ValidationError(f'Ensure this field has no more than {batch_max_size()} elements.')
+        return value
+
+def _datetime(value):
+    # DRF の DateTimeField と同じ表現（現在のタイムゾーンに変換し、UTC は 'Z'）
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+class ValuesSerializer:
+    """
+    Read-only serializer for list and /top responses.
+
+    Builds the same dicts as the ModelSerializer it mirrors straight from
+    ``QuerySet.values(*columns)`` rows, without model instances or DRF's
+    per-field machinery. Model instances (the cached leaderboards) are read
+    through the same columns. Subclasses define ``columns`` and
+    ``to_representation``; ``self.likes`` is the LikeSet from the context.
+    """
+    columns = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.getters = [(column, attrgetter(column.replace('__', '.'))) for column in cls.columns]
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.likes = self.context.get('likes', likesets.EMPTY)
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.columns)
+
+    def row(self, obj):
+        if isinstance(obj, dict):
+            return obj
+        return {column: getter(obj) for column, getter in self.getters}
+
+    @property
+    def data(self):
+        with metrics.serializing():
+            if self.many:
+                return [self.to_representation(self.row(obj)) for obj in self.instance]
+            return self.to_representation(self.row(self.instance))
+
+class PhotoValuesSerializer(ValuesSerializer):
+    columns = ('id', 'title', 'description', 'image_url', 'width', 'height', 'variants', 'user_id', 'likes',
+               'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'], 'title': row['title'], 'description': row['description'],
+            'image_url': row['image_url'], 'width': row['width'], 'height': row['height'],
+            'srcset': images.srcset(row['variants']), 'user': self.user(row), 'likes': row['likes'],
+            'liked_by_me': self.likes.has(Photo, row['id']), 'created_at': _datetime(row['created_at']),
+        }
+
+    def user(self, row):
+        return row['user_id']
+
+class PhotoWithAuthorValuesSerializer(PhotoValuesSerializer):
+    columns = PhotoValuesSerializer.columns + ('user__username', 'user__is_japanese')
+
+    def user(self, row):
+        return {'id': row['user_id'], 'username': row['user__username'], 'is_japanese': row['user__is_japanese']}
+
+class WordValuesSerializer(ValuesSerializer):
+    columns = ('id', 'original', 'translation', 'description', 'user_id', 'likes', 'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'], 'original': row['original'], 'translation': row['translation'],
+            'description': row['description'], 'user': self.user(row), 'likes': row['likes'],
+            'liked_by_me': self.likes.has(Word, row['id']), 'created_at': _datetime(row['created_at']),
+        }
+
+    def user(self, row):
+        return row['user_id']
+
+class WordWithAuthorValuesSerializer(WordValuesSerializer):
+    columns = WordValuesSerializer.columns + ('user__username', 'user__is_japanese')
+
+    def user(self, row):
+        return {'id': row['user_id'], 'username': row['user__username'], 'is_japanese': row['user__is_japanese']}
+
+class ExperienceValuesSerializer(ValuesSerializer):
+    columns = ('id', 'title', 'description', 'image_url', 'width', 'height', 'variants', 'location', 'created_at')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'], 'title': row['title'], 'description': row['description'],
+            'image_url': row['image_url'], 'width': row['width'], 'height': row['height'],
+            'srcset': images.srcset(row['variants']), 'location': row['location'],
+            'created_at': _datetime(row['created_at']),
+        }
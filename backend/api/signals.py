@@ -0,0 +1,84 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, leaderboard, likesets, objectcache
+from .conditional import bump_version
+from .models import User, Photo, Word, Experience
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Word)
+def update_leaderboard(sender, instance, **kwargs):
+    leaderboard.record(instance)
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Word)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    leaderboard.discard(sender, instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Word)
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Word)
+@receiver(post_delete, sender=Experience)
+def bump_model_version(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Word)
+@receiver(post_save, sender=Experience)
+def write_through_object_cache(sender, instance, update_fields=None, **kwargs):
+    # update_fields 付きの保存では他の列が古い可能性があるので書き込まずに消すだけ
+    if update_fields is None:
+        objectcache.store(instance)
+    else:
+        objectcache.invalidate(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Word)
+@receiver(post_delete, sender=Experience)
+def forget_cached_object(sender, instance, **kwargs):
+    objectcache.invalidate(sender, [instance.pk])
+
+
+@receiver(pre_save, sender=Photo)
+@receiver(pre_save, sender=Word)
+def remember_counter_origin(sender, instance, update_fields=None, **kwargs):
+    # 既存行の持ち主と likes を保存前に読んでおく（投稿者・likes を書かない保存では読まない）
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {'user', 'user_id', 'likes'} & set(update_fields):
+        return
+    instance._counter_origin = sender.objects.filter(pk=instance.pk).values_list('user_id', 'likes').first()
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Word)
+def update_user_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.add_items(sender, [instance])
+        return
+    origin = instance.__dict__.pop('_counter_origin', None)
+    if origin is not None:
+        counters.move(sender, origin, instance)
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Word)
+def discount_user_counters(sender, instance, **kwargs):
+    counters.add_items(sender, [instance], sign=-1)
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Word)
+def delete_likes(sender, instance, **kwargs):
+    likesets.forget_object(sender, instance.pk)
@@ -0,0 +1,94 @@
+"""
+Single-flight request coalescing.
+
+``do(name, key, func)`` runs ``func`` once for all callers that ask for the same
+key at the same time: the first caller (the leader) runs it, the others
+wait and get the leader's result, or its exception. With
+``COALESCE_WINDOW`` seconds (0 by default) the result is also handed to
+callers that arrive shortly after it was computed, which absorbs a burst
+that is not perfectly simultaneous. ``COALESCE_REQUESTS = False`` turns
+coalescing off.
+
+Keys must describe everything the result depends on. ``conditional`` uses
+its ETag input (path, Accept, model version stamps and the user's like
+version) plus the host, so a write never lets an older result be shared.
+Waiting blocks a thread, so this is for the sync views only.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# 古い結果の掃除を始める件数
+SWEEP_SIZE = 1000
+
+
+class Call:
+    __slots__ = ('done', 'result', 'error', 'finished_at')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class Group:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _fresh(self, call, window, now):
+        return call.finished_at is None or now - call.finished_at <= window
+
+    def do(self, key, func, window=0.0):
+        """Return ``(result, shared)``; ``shared`` is True when another caller computed it."""
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or not self._fresh(call, window, now)
+            if leader:
+                if len(self._calls) >= SWEEP_SIZE:
+                    self._calls = {k: c for k, c in self._calls.items() if self._fresh(c, window, now)}
+                call = self._calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if window > 0 and call.error is None:
+                    call.finished_at = time.monotonic()
+                elif self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def clear(self):
+        with self._lock:
+            self._calls.clear()
+
+
+_group = Group()
+
+
+def window():
+    return getattr(settings, 'COALESCE_WINDOW', 0.0)
+
+
+def do(name, key, func):
+    """Coalesced ``func()`` under ``key``; ``name`` labels the metrics."""
+    if not getattr(settings, 'COALESCE_REQUESTS', True):
+        return func(), False
+    result, shared = _group.do(key, func, window())
+    if shared:
+        metrics.COALESCED.inc((name,))
+    return result, shared
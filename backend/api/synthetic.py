@@ -0,0 +1,101 @@
+"""
+Synthetic but realistic-looking users, photos, words and experiences.
+
+Used by ``initialize_data --scale`` and the benchmark scripts to load
+production-sized data. Generators yield unsaved model instances so callers
+can insert them with ``bulk_create`` in constant memory.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .models import User, Photo, Word, Experience
+
+GIVEN_NAMES = ['haruto', 'yui', 'sota', 'hina', 'riku', 'mei', 'kaito', 'sakura',
+               'emma', 'liam', 'olivia', 'noah', 'lucas', 'mia', 'leon', 'sofia']
+FAMILY_NAMES = ['sato', 'suzuki', 'takahashi', 'tanaka', 'ito', 'watanabe', 'yamamoto',
+                'nakamura', 'smith', 'garcia', 'muller', 'martin', 'rossi', 'kim']
+
+VOCABULARY = [
+    ('桜', 'さくら', 'cherry blossom'), ('富士山', 'ふじさん', 'Mount Fuji'),
+    ('侘寂', 'わびさび', 'wabi-sabi'), ('木漏れ日', 'こもれび', 'sunlight through trees'),
+    ('一期一会', 'いちごいちえ', 'once in a lifetime'), ('頑張る', 'がんばる', 'persevere'),
+    ('温泉', 'おんせん', 'hot spring'), ('紅葉', 'こうよう', 'autumn leaves'),
+    ('寺院', 'じいん', 'temple'), ('茶道', 'さどう', 'tea ceremony'),
+    ('着物', 'きもの', 'kimono'), ('祭り', 'まつり', 'festival'),
+    ('月見', 'つきみ', 'moon viewing'), ('花火', 'はなび', 'fireworks'),
+    ('旅館', 'りょかん', 'traditional inn'), ('鳥居', 'とりい', 'shrine gate'),
+    ('間', 'ま', 'space/interval'), ('生き甲斐', 'いきがい', 'reason for being'),
+]
+
+PLACES = [('京都', '京都府'), ('金沢', '石川県'), ('箱根', '神奈川県'), ('鎌倉', '神奈川県'),
+          ('奈良', '奈良県'), ('日光', '栃木県'), ('札幌', '北海道'), ('那覇', '沖縄県'),
+          ('東京', '東京都'), ('大阪', '大阪府'), ('広島', '広島県'), ('高山', '岐阜県')]
+
+ACTIVITIES = ['茶道体験', '着物散策', '温泉巡り', '寿司作り教室', '座禅体験', '書道教室',
+              '和太鼓体験', '酒蔵見学', '陶芸体験', '紅葉狩り']
+
+
+class Generator:
+    def __init__(self, seed=None, days=730):
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.days = days
+        self.unusable_password = make_password(None)
+
+    def created_at(self):
+        return self.now - timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def likes(self):
+        # 少数の投稿に「いいね」が集中するロングテール分布
+        return int(self.rng.paretovariate(1.2)) - 1
+
+    def users(self, count, start=0):
+        for i in range(start, start + count):
+            given, family = self.rng.choice(GIVEN_NAMES), self.rng.choice(FAMILY_NAMES)
+            yield User(
+                username=f'{given}_{family}_{i}',
+                password=self.unusable_password,
+                is_japanese=self.rng.random() < 0.4,
+                created_at=self.created_at(),
+            )
+
+    def photos(self, count, user_ids):
+        for _ in range(count):
+            city, prefecture = self.rng.choice(PLACES)
+            kanji, _, english = self.rng.choice(VOCABULARY)
+            yield Photo(
+                title=f'{city}の{kanji}',
+                description=f'{prefecture}{city}で撮影した{kanji}（{english}）',
+                image_url=f'https://picsum.photos/seed/{self.rng.randrange(10**9)}/800/600',
+                user_id=self.rng.choice(user_ids),
+                likes=self.likes(),
+                created_at=self.created_at(),
+            )
+
+    def words(self, count, user_ids):
+        for _ in range(count):
+            kanji, kana, english = self.rng.choice(VOCABULARY)
+            other_kanji, _, other_english = self.rng.choice(VOCABULARY)
+            yield Word(
+                original=f'{kanji} - {kana}',
+                translation=english.capitalize(),
+                description=f'{english.capitalize()}. Often mentioned together with {other_kanji} ({other_english}).',
+                user_id=self.rng.choice(user_ids),
+                likes=self.likes(),
+                created_at=self.created_at(),
+            )
+
+    def experiences(self, count):
+        for _ in range(count):
+            city, prefecture = self.rng.choice(PLACES)
+            activity = self.rng.choice(ACTIVITIES)
+            yield Experience(
+                title=f'{city}で{activity}',
+                description=f'{prefecture}{city}の地元の方と一緒に楽しむ{activity}',
+                image_url=f'https://picsum.photos/seed/{self.rng.randrange(10**9)}/800/600',
+                location=f'{city}, {prefecture}',
+                created_at=self.created_at(),
+            )
@@ -0,0 +1,126 @@
+"""
+Database-backed background tasks.
+
+Views call ``enqueue()`` to insert a ``Task`` row, which commits together
+with the rest of the request's writes, and return immediately.
+``manage.py run_tasks`` workers claim queued rows with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of worker threads and
+processes can share the queue without blocking on each other's rows.
+
+Handlers are plain functions registered by name::
+
+    @tasks.register('images.render')
+    def render(model, pk, original):
+        ...
+
+They are called with the task's JSON payload as keyword arguments. A
+handler that raises is retried with exponential backoff
+(``TASK_RETRY_DELAY`` * 2**attempt) until ``max_attempts`` is reached; the
+row is then kept with status ``failed`` and the error. Successful tasks are
+deleted, which keeps the queue index small. Rows left ``running`` by a
+crashed worker are requeued after ``TASK_TIMEOUT`` seconds.
+"""
+import logging
+import time
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def register(name):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    if name not in _registry:
+        raise LookupError(f'Unknown task {name!r}')
+    return Task.objects.create(
+        name=name,
+        payload=payload or {},
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 3),
+    )
+
+
+def claim():
+    """Lock, mark running and return the next due task, or None."""
+    # SQLite には行ロックがなく、トランザクション内の読み取り→書き込みはロック昇格で
+    # 即座に "database is locked" になるため、自動コミットの条件付き UPDATE だけで取得する
+    locking = connection.features.has_select_for_update_skip_locked
+    while True:
+        now = timezone.now()
+        with transaction.atomic() if locking else nullcontext():
+            task = (Task.objects.select_for_update(skip_locked=True)
+                    .filter(status=Task.QUEUED, run_after__lte=now)
+                    .order_by('run_after', 'id').first())
+            if task is None:
+                return None
+            # 状態を条件に更新するので、行ロックがなくても二重に取得されない
+            claimed = Task.objects.filter(pk=task.pk, status=Task.QUEUED).update(
+                status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            task.status, task.started_at, task.attempts = Task.RUNNING, now, task.attempts + 1
+            return task
+
+
+def run(task):
+    """Execute a claimed task; returns ``(succeeded, seconds)``."""
+    started = time.perf_counter()
+    try:
+        handler = _registry.get(task.name)
+        if handler is None:
+            raise LookupError(f'Unknown task {task.name!r}')
+        handler(**task.payload)
+    except Exception:
+        elapsed = time.perf_counter() - started
+        logger.exception('Task %s failed (attempt %d/%d)', task, task.attempts, task.max_attempts)
+        _fail(task, traceback.format_exc())
+        return False, elapsed
+    elapsed = time.perf_counter() - started
+    Task.objects.filter(pk=task.pk).delete()
+    return True, elapsed
+
+
+def _fail(task, error):
+    if task.attempts >= task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED, last_error=error)
+        return
+    delay = getattr(settings, 'TASK_RETRY_DELAY', 5.0) * 2 ** (task.attempts - 1)
+    Task.objects.filter(pk=task.pk).update(
+        status=Task.QUEUED, last_error=error, run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def requeue_stale(timeout=None):
+    """Requeue (or fail) tasks whose worker died mid-run. Returns the number of rows touched."""
+    timeout = timeout if timeout is not None else getattr(settings, 'TASK_TIMEOUT', 300)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = Task.objects.filter(status=Task.RUNNING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, last_error='Timed out')
+    return failed + stale.update(status=Task.QUEUED, last_error='Timed out')
+
+
+def run_pending(limit=None):
+    """Run due tasks in this thread until the queue is empty; returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        task = claim()
+        if task is None:
+            break
+        run(task)
+        count += 1
+    return count
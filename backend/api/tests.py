@@ -1,3 +1,1445 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import (
+    conditional, counters, leaderboard, likes, likesets, metrics, objectcache, replicas, search, singleflight, tasks, throttling,
+    trending,
+)
+from .models import User, Photo, Word, Experience, Like, LikeEvent, Task
+from .pagination import SearchCursorPagination
+from .serializers import (
+    AuthorSerializer, ExperienceSerializer, ExperienceValuesSerializer, PhotoSerializer, PhotoValuesSerializer,
+    PhotoWithAuthorSerializer, PhotoWithAuthorValuesSerializer, WordSerializer, WordValuesSerializer,
+    WordWithAuthorSerializer, WordWithAuthorValuesSerializer,
+)
+
+
+def _run_in_threads(func, count, workers=16):
+    def call(i):
+        try:
+            return func(i)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(call, range(count)))
+
+
+def _login(client, user):
+    # ログイン API を通さずにセッションへ user_id を入れる
+    session = client.session
+    session['user_id'] = user.pk
+    session.save()
+    return client
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=self.user)
+        self.word = Word.objects.create(original='間', description='interval', user=self.user)
+        self.client = _login(APIClient(), self.user)
+
+    def test_like_increments_counter(self):
+        response = self.client.post(f'/api/photos/{self.photo.id}/like/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes'], 1)
+        response = self.client.post(f'/api/words/{self.word.id}/like/')
+        self.assertEqual(response.data['likes'], 1)
+
+    def test_like_only_updates_likes_column(self):
+        Photo.objects.filter(pk=self.photo.pk).update(title='changed')
+        self.client.post(f'/api/photos/{self.photo.id}/like/')
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.title, 'changed')
+        self.assertEqual(self.photo.likes, 1)
+
+    def test_apply_likes_uses_single_update(self):
+        other = Photo.objects.create(title='京都', image_url='/kyoto.jpg', user=self.user)
+        # いいねの UPDATE と likes_received の UPDATE 各 1 回。持ち主は呼び出し側が渡す
+        with self.assertNumQueries(2):
+            likes.apply_likes(Photo, {self.photo.pk: 3, other.pk: 5},
+                              {self.photo.pk: self.user.pk, other.pk: self.user.pk})
+        self.assertEqual(Photo.objects.get(pk=self.photo.pk).likes, 3)
+        self.assertEqual(Photo.objects.get(pk=other.pk).likes, 5)
+        self.assertEqual(User.objects.get(pk=self.user.pk).likes_received, 8)
+
+    def test_likes_credit_the_owner_without_expiring_user_etags(self):
+        users_version = conditional.get_version(User)
+        # SAVEPOINT / RELEASE と 2 つの UPDATE、likes の読み直し。持ち主の SELECT はない
+        with self.assertNumQueries(5):
+            likes.record_like(self.photo)
+        self.assertEqual(conditional.get_version(User), users_version)
+        self.assertEqual(User.objects.get(pk=self.user.pk).likes_received, 1)
+
+    @override_settings(LIKES_WRITE_BEHIND=True)
+    def test_write_behind_batches_owner_credits(self):
+        other = Photo.objects.create(title='京都', image_url='/kyoto.jpg', user=self.user)
+        buffer = likes.LikeBuffer(threshold=1000, interval=3600)
+        likes._buffer = buffer
+        try:
+            for photo in (self.photo, other, other):
+                likes.record_like(photo)
+            self.assertEqual(User.objects.get(pk=self.user.pk).likes_received, 0)
+            # SAVEPOINT と RELEASE のほかは 2 つの UPDATE だけで、持ち主の SELECT はない
+            with self.assertNumQueries(4):
+                self.assertEqual(buffer.flush(), 3)
+            self.assertEqual(User.objects.get(pk=self.user.pk).likes_received, 3)
+        finally:
+            likes._buffer = None
+
+    @override_settings(LIKES_WRITE_BEHIND=True)
+    def test_write_behind_buffers_until_flush(self):
+        buffer = likes.LikeBuffer(threshold=1000, interval=3600)
+        likes._buffer = buffer
+        try:
+            response = self.client.post(f'/api/photos/{self.photo.id}/like/')
+            self.assertEqual(response.data['likes'], 1)
+            # 2 回目は数えないが、未フラッシュ分は同じように見える
+            self.assertEqual(self.client.post(f'/api/photos/{self.photo.id}/like/').data['likes'], 1)
+            self.assertEqual(Photo.objects.get(pk=self.photo.pk).likes, 0)
+            self.assertEqual(buffer.flush(), 1)
+            self.assertEqual(Photo.objects.get(pk=self.photo.pk).likes, 1)
+        finally:
+            likes._buffer = None
+
+
+class LikeDedupTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        likesets._sets.clear()
+        self.taro = User.objects.create(username='taro', password='x')
+        self.hanako = User.objects.create(username='hanako', password='x')
+        self.photos = [Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=self.taro)
+                       for i in range(12)]
+        self.word = Word.objects.create(original='間', description='interval', user=self.taro)
+        self.client = _login(APIClient(), self.hanako)
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+        likesets._sets.clear()
+
+    @override_settings(LIKESET_CACHE_USERS=0)
+    def test_sets_are_not_kept_without_capacity(self):
+        self.assertFalse(likesets.get(self.hanako.pk).has(Photo, self.photos[0].pk))
+        # バージョンを進めない書き込み（別のワーカーの書き込みの代わり）も次の読み込みで見える
+        Like.objects.create(user=self.hanako, target=LikeEvent.PHOTO, object_id=self.photos[0].pk)
+        self.assertTrue(likesets.get(self.hanako.pk).has(Photo, self.photos[0].pk))
+        self.assertEqual(len(likesets._sets), 0)
+
+    def test_each_user_counts_once_and_can_unlike(self):
+        url = f'/api/photos/{self.photos[0].id}/like/'
+        self.assertEqual(self.client.post(url).data['likes'], 1)
+        response = self.client.post(url)
+        self.assertEqual((response.data['likes'], response.data['liked_by_me']), (1, True))
+        self.assertEqual(_login(APIClient(), self.taro).post(url).data['likes'], 2)
+        response = self.client.delete(url)
+        self.assertEqual((response.data['likes'], response.data['liked_by_me']), (1, False))
+        self.assertEqual(self.client.delete(url).data['likes'], 1)
+        self.assertEqual(User.objects.get(pk=self.taro.pk).likes_received, 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_like_requires_login(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.post(f'/api/photos/{self.photos[0].id}/like/').status_code, 401)
+        self.assertEqual(anonymous.post(f'/api/words/{self.word.id}/like/').status_code, 401)
+        self.assertEqual(Photo.objects.get(pk=self.photos[0].pk).likes, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_liked_by_me_without_a_query_per_item(self):
+        liked = {self.photos[i].id for i in (0, 5, 11)}
+        self.client.post('/api/photos/batch_like/', {'ids': sorted(liked)}, format='json')
+        self.client.post(f'/api/words/{self.word.id}/like/')
+        urls = ['/api/photos/', f'/api/users/{self.taro.pk}/photos/', '/api/photos/top/', '/api/async/photos/']
+        for fast in (True, False):
+            with self.settings(FAST_SERIALIZATION=fast):
+                for url in urls:
+                    data = self.client.get(url, {'page_size': 12, 'limit': 12}).json()
+                    results = data['results'] if isinstance(data, dict) else data
+                    self.assertEqual({p['id'] for p in results if p['liked_by_me']}, liked, url)
+                    data = APIClient().get(url, {'page_size': 12, 'limit': 12}).json()
+                    results = data['results'] if isinstance(data, dict) else data
+                    self.assertFalse(any(p['liked_by_me'] for p in results), url)
+        self.assertTrue(self.client.get(f'/api/words/{self.word.id}/').data['liked_by_me'])
+        # ページの大きさによらずクエリ数は同じ
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/photos/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/photos/', {'page_size': 12})
+        self.assertEqual(len(small), len(large))
+
+    def test_etag_varies_by_user_and_their_likes(self):
+        anonymous = APIClient().get('/api/photos/')
+        mine = self.client.get('/api/photos/')
+        self.assertNotEqual(anonymous['ETag'], mine['ETag'])
+        self.assertIn('Cookie', mine['Vary'])
+        self.assertTrue(mine['Cache-Control'].startswith('private'))
+        self.assertTrue(anonymous['Cache-Control'].startswith('public'))
+        self.assertEqual(self.client.get('/api/photos/', HTTP_IF_NONE_MATCH=mine['ETag']).status_code, 304)
+        self.client.post(f'/api/words/{self.word.id}/like/')
+        # 写真一覧の内容は変わらなくても liked_by_me の元が変わったので 200
+        self.assertEqual(self.client.get('/api/photos/', HTTP_IF_NONE_MATCH=mine['ETag']).status_code, 200)
+
+    @override_settings(LIKESET_CACHE_USERS=1)
+    def test_likeset_follows_writes_from_other_processes(self):
+        self.assertFalse(likesets.get(self.hanako.pk).has(Photo, self.photos[3].pk))
+        # 別プロセスのいいね: 行とバージョンだけが変わる
+        Like.objects.create(user=self.hanako, target=LikeEvent.PHOTO, object_id=self.photos[3].pk)
+        likesets.bump_version(self.hanako.pk)
+        likesets._sets[self.hanako.pk] = likesets.get(self.taro.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(likesets.get(self.hanako.pk).has(Photo, self.photos[3].pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(likesets.get(self.hanako.pk).has(Photo, self.photos[3].pk))
+        self.assertFalse(likesets.get(self.hanako.pk).has(Word, self.photos[3].pk))
+        likesets.get(self.taro.pk)
+        self.assertEqual(list(likesets._sets), [self.taro.pk])
+
+    @override_settings(LIKESET_CACHE_USERS=10)
+    def test_likes_patch_the_cached_set_instead_of_reloading_it(self):
+        photo = self.photos[4]
+        self.assertFalse(likesets.get(self.hanako.pk).has(Photo, photo.pk))
+        for method, liked in (('post', True), ('delete', False)):
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(f'/api/photos/{photo.id}/like/')
+            self.assertEqual(response.data['liked_by_me'], liked)
+            # ユーザーの全いいねを読む SELECT（object_id で絞らないもの）はない
+            self.assertFalse([q['sql'] for q in queries
+                              if q['sql'].startswith('SELECT') and 'api_like' in q['sql'] and 'object_id' not in q['sql']])
+            with self.assertNumQueries(0):
+                self.assertEqual(likesets.get(self.hanako.pk).has(Photo, photo.pk), liked)
+
+    def test_deleting_an_object_deletes_its_likes(self):
+        self.client.post(f'/api/photos/{self.photos[0].id}/like/')
+        self.client.delete(f'/api/photos/{self.photos[0].id}/')
+        self.assertFalse(Like.objects.exists())
+
+
+class LikeConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=user)
+        self.word = Word.objects.create(original='間', description='interval', user=user)
+
+    def test_parallel_likes_are_not_lost(self):
+        users = User.objects.bulk_create([User(username=f'fan{i}', password='x') for i in range(200)])
+        # 別々の端末から（IP ごとのレート制限にかからないように）
+        clients = [_login(APIClient(REMOTE_ADDR=f'10.0.0.{i}'), user) for i, user in enumerate(users)]
+
+        def like(i):
+            # 各ユーザーが 4 回ずつ並行して押しても 1 回と数える
+            return clients[i % len(clients)].post(f'/api/photos/{self.photo.id}/like/').status_code
+
+        statuses = _run_in_threads(like, 800)
+        self.assertEqual(set(statuses), {200})
+        self.assertEqual(Photo.objects.get(pk=self.photo.pk).likes, 200)
+        self.assertEqual(Like.objects.count(), 200)
+
+    def test_parallel_write_behind_likes_are_not_lost(self):
+        buffer = likes.LikeBuffer(threshold=250, interval=3600)
+
+        def like(i):
+            target = self.photo if i % 2 else self.word
+            buffer.add(type(target), target.pk)
+
+        _run_in_threads(like, 5000)
+        buffer.flush()
+        self.assertEqual(Photo.objects.get(pk=self.photo.pk).likes, 2500)
+        self.assertEqual(Word.objects.get(pk=self.word.pk).likes, 2500)
+
+
+class FeedPaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='taro', password='x')
+        for i in range(25):
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=user)
+        self.client = APIClient()
+
+    def test_page_number_is_default(self):
+        response = self.client.get('/api/photos/')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_cursor_pages_cover_feed_in_order(self):
+        response = self.client.get('/api/photos/?cursor=')
+        self.assertNotIn('count', response.data)
+        titles = [p['title'] for p in response.data['results']]
+        response = self.client.get(response.data['next'])
+        titles += [p['title'] for p in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(titles, [f'photo {i}' for i in reversed(range(25))])
+
+    def test_cursor_pages_break_created_at_ties_on_id(self):
+        # 一括登録のように 5 件ずつ同じ時刻
+        now = timezone.now()
+        for i, pk in enumerate(Photo.objects.order_by('id').values_list('id', flat=True)):
+            Photo.objects.filter(pk=pk).update(created_at=now - timedelta(seconds=i // 5))
+        expected = list(Photo.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        ids, url = [], '/api/photos/?cursor=&page_size=3'
+        while url:
+            response = self.client.get(url)
+            ids += [p['id'] for p in response.data['results']]
+            url, previous = response.data['next'], response.data['previous']
+        self.assertEqual(ids, expected)
+        # 最後のページから previous を辿っても同じ並び
+        ids = [p['id'] for p in response.data['results']]
+        while previous:
+            response = self.client.get(previous)
+            ids = [p['id'] for p in response.data['results']] + ids
+            previous = response.data['previous']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/photos/?cursor=bm90LWpzb24=').status_code, 404)
+        self.assertEqual(self.client.get('/api/photos/?cursor=eyJwIjpbIngiLDFdfQ==').status_code, 404)
+
+    @override_settings(FEED_PAGINATION='cursor')
+    def test_cursor_mode_setting(self):
+        self.assertNotIn('count', self.client.get('/api/photos/').data)
+        self.assertIn('count', self.client.get('/api/photos/?page=1').data)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        self.user = User.objects.create(username='taro', password='x')
+        self.photos = [
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=self.user, likes=i)
+            for i in range(10)
+        ]
+        self.client = APIClient()
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+
+    def test_top_is_ordered_by_likes(self):
+        response = self.client.get('/api/photos/top/?limit=3')
+        self.assertEqual([p['likes'] for p in response.data], [9, 8, 7])
+
+    def test_warm_board_needs_no_queries(self):
+        self.client.get('/api/photos/top/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/photos/top/?limit=3')
+        self.assertEqual(len(response.data), 3)
+
+    def test_like_updates_board_incrementally(self):
+        self.client.get('/api/photos/top/')
+        for i in range(10):
+            fan = User.objects.create(username=f'fan{i}', password='x')
+            _login(APIClient(), fan).post(f'/api/photos/{self.photos[0].id}/like/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/photos/top/?limit=1')
+        self.assertEqual(response.data[0]['id'], self.photos[0].id)
+        self.assertEqual(response.data[0]['likes'], 10)
+
+    def test_deleted_rows_leave_the_board(self):
+        self.client.get('/api/photos/top/')
+        self.client.delete(f'/api/photos/{self.photos[9].id}/')
+        response = self.client.get('/api/photos/top/?limit=1')
+        self.assertEqual(response.data[0]['likes'], 8)
+
+    @override_settings(LEADERBOARD_MAX_LIMIT=4)
+    def test_limit_is_capped(self):
+        self.assertEqual(len(self.client.get('/api/photos/top/?limit=1000').data), 4)
+        self.assertEqual(len(self.client.get('/api/photos/top/?limit=abc').data), 4)
+
+
+class AuthorExpansionTests(TestCase):
+    def setUp(self):
+        for i in range(20):
+            user = User.objects.create(username=f'user{i}', password='x', is_japanese=bool(i % 2))
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=user)
+            Word.objects.create(original=f'word {i}', description='d', user=user)
+        self.client = APIClient()
+
+    def test_expanded_author_fields(self):
+        photo = self.client.get('/api/photos/?expand=user').data['results'][0]
+        self.assertEqual(photo['user'], {'id': photo['user']['id'], 'username': 'user19', 'is_japanese': True})
+        self.assertIsInstance(self.client.get('/api/photos/').data['results'][0]['user'], int)
+
+    def test_expanded_page_is_a_single_query(self):
+        for url in ('/api/photos/?cursor=&expand=user', '/api/words/?cursor=&expand=user'):
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), 20)
+        # ページ番号モードでは COUNT(*) が 1 本増えるだけ
+        with self.assertNumQueries(2):
+            self.client.get('/api/photos/?expand=user')
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        variants = [{'name': f'photos/a-{w}.{fmt}', 'width': w, 'format': fmt}
+                    for w in (640, 320) for fmt in ('webp', 'avif')]
+        for i in range(25):
+            user = User.objects.create(username=f'user{i}', password='x', is_japanese=bool(i % 2))
+            Photo.objects.create(title=f'写真 {i}', description=None if i % 3 else 'd', image_url='/p.jpg',
+                                 width=640 if i % 2 else None, height=480 if i % 2 else None,
+                                 variants=variants if i % 2 else [], user=user, likes=i % 7)
+            Word.objects.create(original=f'word {i}', translation='t', description='d\u2028', user=user, likes=i)
+            Experience.objects.create(title=f'exp {i}', description='d', image_url='/e.jpg', location='京都',
+                                      variants=variants)
+        self.client = APIClient()
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+
+    def test_responses_match_model_serializers(self):
+        urls = [
+            '/api/photos/', '/api/photos/?expand=user&page=2', '/api/photos/?cursor=&page_size=7',
+            '/api/words/?expand=user', '/api/experiences/?cursor=', '/api/photos/top/?limit=10',
+            '/api/words/top/?limit=10&expand=user', '/api/photos/trending/',
+            '/api/async/photos/?expand=user', '/api/async/words/top/?limit=10',
+        ]
+        likes.record_likes(Photo, {Photo.objects.first().pk: 2})
+        trending.record(Photo, {Photo.objects.first().pk: 2}, timezone.now())
+        trending.update()
+        for url in urls:
+            with self.subTest(url=url):
+                fast = self.client.get(url)
+                with override_settings(FAST_SERIALIZATION=False):
+                    leaderboard._boards.clear()
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+
+    def test_values_serializers_match_model_serializers(self):
+        pairs = [
+            (Photo, PhotoValuesSerializer, PhotoSerializer),
+            (Photo, PhotoWithAuthorValuesSerializer, PhotoWithAuthorSerializer),
+            (Word, WordValuesSerializer, WordSerializer),
+            (Word, WordWithAuthorValuesSerializer, WordWithAuthorSerializer),
+            (Experience, ExperienceValuesSerializer, ExperienceSerializer),
+        ]
+        # 偶数 id の写真と単語をいいね済みにする
+        liked = likesets.LikeSet(1, {
+            trending.TARGET_OF[model]: sorted(pk for pk in model.objects.values_list('id', flat=True) if pk % 2 == 0)
+            for model in (Photo, Word)
+        })
+        context = {'likes': liked}
+        for model, values_class, model_class in pairs:
+            with self.subTest(serializer=values_class.__name__):
+                queryset = model.objects.order_by('id').select_related(*(['user'] if model is not Experience else []))
+                expected = json.loads(json.dumps(model_class(queryset, many=True, context=context).data, cls=JSONEncoder))
+                self.assertTrue(any(row.get('liked_by_me') for row in expected) or model is Experience)
+                # values() の行でも（ランキングの）インスタンスでも同じ
+                for rows in (values_class.values(queryset), list(queryset)):
+                    data = values_class(rows, many=True, context=context).data
+                    self.assertEqual(json.loads(json.dumps(data, cls=JSONEncoder)), expected)
+                self.assertEqual(values_class(queryset[0], context=context).data, expected[0])
+
+    def test_list_is_still_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/photos/?expand=user')
+        self.assertEqual(response.data['results'][0]['user']['username'], 'user24')
+
+    def test_renderer_matches_json_renderer(self):
+        from decimal import Decimal
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = {'text': '桜 "quoted"\u2028\u2029', 'when': timezone.now(), 'price': Decimal('1.50'),
+                'items': [1, 2.5, None, True], 'nested': {'id': 1}}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class ObjectCacheTests(TestCase):
+    def setUp(self):
+        objectcache.get_cache().clear()
+        metrics.OBJECT_CACHE_HITS.clear()
+        metrics.OBJECT_CACHE_MISSES.clear()
+        self.user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='富士山', image_url='/p.jpg', user=self.user)
+        self.client = APIClient()
+
+    def test_retrieve_is_served_from_cache(self):
+        url = f'/api/photos/{self.photo.pk}/?expand=user'
+        with self.assertNumQueries(2):
+            first = self.client.get(url)
+        # username -> pk の索引を作る 1 回だけ DB を読む
+        with self.assertNumQueries(1):
+            self.client.get('/api/users/by_username/', {'username': 'taro'})
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+            self.client.get(f'/api/users/{self.user.pk}/')
+            self.client.get('/api/users/by_username/', {'username': 'taro'})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.data['user']['username'], 'taro')
+        self.assertEqual(self.client.get('/api/photos/abc/').status_code, 404)
+        label = ('api.photo',)
+        self.assertEqual((metrics.OBJECT_CACHE_HITS.value(label), metrics.OBJECT_CACHE_MISSES.value(label)), (1, 1))
+        self.assertIn('api_object_cache_hits_total{model="api.user"} 3', self.client.get('/metrics').content.decode())
+
+    def test_no_stale_reads_after_writes(self):
+        url = f'/api/photos/{self.photo.pk}/'
+        self.client.get(url)
+        self.client.get('/api/users/by_username/', {'username': 'taro'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'title': '桜'}, format='json')
+        # 保存した行がそのまま書き込まれているので DB を読まない
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data['title'], '桜')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _login(APIClient(), self.user).post(f'{url}like/')
+        self.assertEqual(self.client.get(url).data['likes'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            likes.record_likes(Photo, {self.photo.pk: 2})
+        self.assertEqual(self.client.get(url).data['likes'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/users/{self.user.pk}/', {'username': 'hanako'}, format='json')
+        self.assertEqual(self.client.get(url, {'expand': 'user'}).data['user']['username'], 'hanako')
+        self.assertEqual(self.client.get('/api/users/by_username/', {'username': 'taro'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/users/by_username/', {'username': 'hanako'}).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_writes_without_commit_hooks_invalidate_immediately(self):
+        url = f'/api/photos/{self.photo.pk}/'
+        self.client.get(url)
+        # TestCase では on_commit が実行されないが、保存時にすぐ消しているので古い行は返らない
+        self.photo.title = 'saved'
+        self.photo.save()
+        self.assertEqual(self.client.get(url).data['title'], 'saved')
+
+
+class UserFeedTests(TestCase):
+    def setUp(self):
+        objectcache.get_cache().clear()
+        self.taro = User.objects.create(username='taro', password='x')
+        self.hanako = User.objects.create(username='hanako', password='x')
+        now = timezone.now()
+        for i in range(5):
+            for user in (self.taro, self.hanako):
+                Photo.objects.create(title=f'{user.username} {i}', image_url='/p.jpg', user=user,
+                                     created_at=now - timedelta(minutes=10 - i))
+        Word.objects.create(original='間', description='d', user=self.taro)
+        self.client = APIClient()
+
+    def counters_of(self, user):
+        user = User.objects.get(pk=user.pk)
+        return user.photo_count, user.word_count, user.likes_received
+
+    def test_user_photos_are_cursor_paginated(self):
+        response = self.client.get(f'/api/users/{self.taro.pk}/photos/', {'page_size': 2, 'expand': 'user'})
+        pages = [response.data]
+        while pages[-1]['next']:
+            # 2 ページ目以降はユーザーがキャッシュ済みなので 1 クエリ
+            with self.assertNumQueries(1):
+                pages.append(self.client.get(pages[-1]['next']).data)
+        titles = [p['title'] for page in pages for p in page['results']]
+        self.assertEqual(titles, [f'taro {i}' for i in reversed(range(5))])
+        self.assertEqual(pages[0]['results'][0]['user']['username'], 'taro')
+        words = self.client.get(f'/api/users/{self.hanako.pk}/words/').data
+        self.assertEqual(words['results'], [])
+        self.assertEqual(self.client.get('/api/users/0/photos/').status_code, 404)
+
+    def test_profile_carries_counters_without_count_queries(self):
+        with self.assertNumQueries(1):
+            profile = self.client.get(f'/api/users/{self.taro.pk}/').data
+        self.assertEqual((profile['photo_count'], profile['word_count'], profile['likes_received']), (5, 1, 0))
+
+    def test_counters_are_maintained_on_write(self):
+        photo = Photo.objects.filter(user=self.taro).first()
+        _login(APIClient(), self.hanako).post(f'/api/photos/{photo.pk}/like/')
+        likes.record_likes(Photo, {photo.pk: 2})
+        self.client.post('/api/words/batch/', [{'original': 'w', 'description': 'd', 'user': self.hanako.pk}] * 3,
+                         format='json')
+        # 別のユーザーに付け替えると投稿数と受け取ったいいねが移る
+        self.client.patch(f'/api/photos/{photo.pk}/', {'user': self.hanako.pk}, format='json')
+        Word.objects.filter(user=self.taro).first().delete()
+        self.assertEqual(self.counters_of(self.taro), (4, 0, 0))
+        self.assertEqual(self.counters_of(self.hanako), (6, 3, 3))
+        self.assertEqual(self.client.get(f'/api/users/{self.hanako.pk}/').data['likes_received'], 3)
+        # 集計し直しても同じ値になる
+        counters.recount()
+        self.assertEqual(self.counters_of(self.taro), (4, 0, 0))
+        self.assertEqual(self.counters_of(self.hanako), (6, 3, 3))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=user)
+        self.client = APIClient()
+
+    def test_validators_and_cache_control(self):
+        response = self.client.get('/api/photos/')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, must-revalidate')
+
+    def test_matching_etag_is_answered_without_queries(self):
+        for url in ('/api/photos/', f'/api/photos/{self.photo.id}/', '/api/photos/top/',
+                    '/api/experiences/', '/api/users/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/photos/')['Last-Modified']
+        response = self.client.get('/api/photos/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_like_and_save_change_the_etag(self):
+        etag = self.client.get('/api/photos/')['ETag']
+        _login(APIClient(), self.photo.user).post(f'/api/photos/{self.photo.id}/like/')
+        response = self.client.get('/api/photos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['likes'], 1)
+
+        etag = response['ETag']
+        self.photo.title = '富士山と桜'
+        self.photo.save()
+        self.assertEqual(self.client.get('/api/photos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(CONDITIONAL_GET=False)
+    def test_validators_can_be_switched_off(self):
+        response = self.client.get('/api/photos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_writes_in_a_transaction_bump_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photo.title = '富士山と桜'
+            self.photo.save()
+            # コミット前の GET（別の接続なら古い行を読む）が受け取った ETag
+            etag = self.client.get('/api/photos/')['ETag']
+        self.assertEqual(self.client.get('/api/photos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(self.client.get('/api/photos/')['ETag'],
+                            self.client.get('/api/photos/?expand=user')['ETag'])
+
+    @override_settings(API_CACHE_CONTROL='public, max-age=30')
+    def test_cache_control_is_configurable(self):
+        self.assertEqual(self.client.get('/api/words/')['Cache-Control'], 'public, max-age=30')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='taro', password='x')
+        Word.objects.create(original='侘寂 - わびさび', translation='Wabi-sabi', description='Accepting imperfection', user=user)
+        Word.objects.create(original='間 - ま', translation='Space/Interval', description='Negative space', user=user)
+        Photo.objects.create(title='京都の伝統的な寺院', description='金閣寺', image_url='/k.jpg', user=user)
+        self.client = APIClient()
+
+    def test_search_words(self):
+        response = self.client.get('/api/search/', {'q': 'wabi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([w['translation'] for w in response.data['results']], ['Wabi-sabi'])
+
+    def test_search_japanese_text(self):
+        response = self.client.get('/api/search/', {'q': '金閣寺', 'type': 'photos'})
+        self.assertEqual([p['title'] for p in response.data['results']], ['京都の伝統的な寺院'])
+
+    def test_search_paginates_with_cursor(self):
+        response = self.client.get('/api/search/', {'q': 'space', 'page_size': 1})
+        self.assertIn('next', response.data)
+        self.assertNotIn('count', response.data)
+
+    def test_cursor_breaks_rank_ties_on_id(self):
+        user = User.objects.get(username='taro')
+        for i in range(6):
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=user)
+        queryset = Photo.objects.annotate(rank=Cast(F('id') % 2, FloatField()))
+        view = SimpleNamespace(search_ordering=('-rank', '-id'))
+        ids, url = [], '/api/search/?page_size=2'
+        while url:
+            paginator = SearchCursorPagination()
+            ids += [p.id for p in paginator.paginate_queryset(queryset, Request(APIRequestFactory().get(url)), view)]
+            url = paginator.get_next_link()
+        self.assertEqual(ids, list(queryset.order_by('-rank', '-id').values_list('id', flat=True)))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'type': 'users'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'mode': 'regex'}).status_code, 400)
+
+    def test_mode_detection(self):
+        self.assertEqual(search.resolve_mode('わびさび', 'auto'), 'trigram')
+        self.assertEqual(search.resolve_mode('wabi sabi', 'auto'), 'fts')
+        self.assertEqual(search.resolve_mode('わびさび', 'fts'), 'fts')
+
+
+class InitializeDataTests(TestCase):
+    def test_default_data_is_bulk_inserted(self):
+        call_command('initialize_data', stdout=StringIO())
+        self.assertEqual(Photo.objects.count(), 5)
+        self.assertEqual(sorted(Word.objects.values_list('likes', flat=True)), [1, 2, 3, 4, 5])
+        # 2 回目は何も追加しない
+        call_command('initialize_data', stdout=StringIO())
+        self.assertEqual(Experience.objects.count(), 5)
+
+    def test_scale_generates_synthetic_data(self):
+        call_command('initialize_data', scale=200, batch_size=64, seed=1, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 21)
+        self.assertEqual(Photo.objects.count(), 205)
+        self.assertEqual(Word.objects.count(), 205)
+        self.assertEqual(Experience.objects.count(), 7)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        self.users = [User.objects.create(username=f'user{i}', password='x') for i in range(3)]
+        self.client = APIClient()
+
+    def test_batch_create_validates_once_and_inserts_once(self):
+        items = [{'original': f'word {i}', 'description': 'd', 'user': self.users[i % 3].id} for i in range(50)]
+        # ユーザー取得 1 回 + INSERT 1 回 + 投稿者カウンタの UPDATE 1 回
+        # （テスト内ではトランザクションが SAVEPOINT 2 本として数えられる）
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/words/batch/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Word.objects.count(), 50)
+
+    def test_batch_create_reports_per_item_errors(self):
+        items = [
+            {'title': 'ok', 'image_url': '/a.jpg', 'user': self.users[0].id},
+            {'title': 'no user', 'image_url': '/b.jpg', 'user': 999},
+            {'image_url': '/c.jpg', 'user': self.users[0].id},
+        ]
+        response = self.client.post('/api/photos/batch/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        # 入力と同じ並びのリスト。問題のない要素は {}
+        errors = response.data['errors']
+        self.assertIsInstance(errors, list)
+        self.assertEqual(len(errors), len(items))
+        self.assertEqual(errors[0], {})
+        self.assertEqual(set(errors[1]), {'user'})
+        self.assertEqual(set(errors[2]), {'title'})
+        self.assertEqual(Photo.objects.count(), 0)
+
+    @override_settings(BATCH_MAX_SIZE=2)
+    def test_batch_size_is_limited(self):
+        items = [{'original': 'w', 'description': 'd', 'user': self.users[0].id}] * 3
+        self.assertEqual(self.client.post('/api/words/batch/', items, format='json').status_code, 400)
+        client = _login(APIClient(), self.users[0])
+        self.assertEqual(client.post('/api/words/batch_like/', {'ids': [1, 2, 3]}, format='json').status_code, 400)
+
+    def test_batch_like_applies_counts_in_one_update(self):
+        photos = [Photo.objects.create(title=f'p{i}', image_url='/p.jpg', user=self.users[0]) for i in range(3)]
+        ids = [photos[0].id] * 3 + [photos[1].id, 999]
+        client = _login(APIClient(), self.users[0])
+        # セッションとユーザー 2 + 対象と既存のいいねの SELECT 2 + Like の一括 INSERT 1
+        # + いいね数 / トレンド用イベント / likes_received の UPDATE 3 (持ち主は対象の SELECT で分かる)
+        # + 結果の SELECT 1 + SAVEPOINT 3 本 (6)。件数には比例せず、liked_by_me のためにいいね集合も読み直さない
+        with self.assertNumQueries(15):
+            response = client.post('/api/photos/batch_like/', {'ids': ids}, format='json')
+        # 同じ id を何度送っても 1 ユーザー 1 回
+        self.assertEqual(sorted(p['likes'] for p in response.data), [1, 1])
+        self.assertEqual(Photo.objects.get(pk=photos[2].pk).likes, 0)
+        response = client.post('/api/photos/batch_like/', {'ids': [photos[0].id, photos[2].id]}, format='json')
+        self.assertEqual(sorted((p['likes'], p['liked_by_me']) for p in response.data), [(1, True), (1, True)])
+        self.assertEqual(self.client.post('/api/photos/batch_like/', {'ids': ids}, format='json').status_code, 401)
+
+
+class SessionUserTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='taro', password=make_password('secret-pass'))
+
+    def login(self):
+        client = APIClient()
+        response = client.post('/api/login/', {'username': 'taro', 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return client
+
+    def test_current_user_requires_login(self):
+        self.assertEqual(APIClient().get('/api/user/').status_code, 401)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_cached_session_current_user_needs_no_queries(self):
+        client = self.login()
+        with self.assertNumQueries(0):
+            response = client.get('/api/user/')
+            client.get('/api/user/')
+        self.assertEqual(response.data['username'], 'taro')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_session_and_logout(self):
+        client = self.login()
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/user/').status_code, 200)
+        client.post('/api/logout/')
+        self.assertEqual(client.get('/api/user/').status_code, 401)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_user_changes_are_not_served_stale(self):
+        client = self.login()
+        self.user.is_japanese = True
+        self.user.save()
+        self.assertTrue(client.get('/api/user/').data['is_japanese'])
+
+
+class PasswordHashingTests(TestCase):
+    def login(self, password):
+        return APIClient().post('/api/login/', {'username': 'taro', 'password': password}, format='json')
+
+    def test_plaintext_password_is_rehashed_on_login(self):
+        user = User.objects.create(username='taro', password='password123')
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.login('password123').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login('password123').status_code, 200)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        encoded = make_password('secret-pass', hasher='pbkdf2_sha1')
+        user = User.objects.create(username='taro', password=encoded)
+        self.assertEqual(self.login('secret-pass').status_code, 200)
+        user.refresh_from_db()
+        self.assertNotEqual(user.password, encoded)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+    def test_unusable_password_never_matches(self):
+        User.objects.create(username='taro', password=make_password(None))
+        self.assertEqual(self.login('').status_code, 400)
+        self.assertEqual(self.login(make_password(None)).status_code, 401)
+
+    def test_register_stores_a_hash(self):
+        response = APIClient().post('/api/register/', {'username': 'hanako', 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='hanako').password.startswith('pbkdf2_sha256$'))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        self.user = User.objects.create(username='taro', password=make_password('secret-pass'))
+        self.photos = [
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=self.user, likes=i)
+            for i in range(25)
+        ]
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+
+    async def test_list_pages_match_sync_feed(self):
+        response = await self.async_client.get('/api/async/photos/', {'page_size': 10, 'expand': 'user'})
+        pages = [response.json()]
+        while pages[-1]['next']:
+            pages.append((await self.async_client.get(pages[-1]['next'])).json())
+        titles = [p['title'] for page in pages for p in page['results']]
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(titles, [f'photo {i}' for i in reversed(range(25))])
+        self.assertEqual(pages[0]['results'][0]['user']['username'], 'taro')
+        response = await self.async_client.get('/api/async/photos/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_detail_and_top(self):
+        photo = self.photos[3]
+        response = await self.async_client.get(f'/api/async/photos/{photo.pk}/')
+        self.assertEqual(response.json()['title'], 'photo 3')
+        self.assertEqual(response.json()['user'], self.user.pk)
+        response = await self.async_client.get('/api/async/photos/0/')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/api/async/photos/top/', {'limit': 3})
+        self.assertEqual([p['likes'] for p in response.json()], [24, 23, 22])
+        response = await self.async_client.post('/api/async/photos/')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_current_user(self):
+        self.assertEqual((await self.async_client.get('/api/async/user/')).status_code, 401)
+        await self.async_client.post('/api/login/', {'username': 'taro', 'password': 'secret-pass'},
+                                     content_type='application/json')
+        response = await self.async_client.get('/api/async/user/')
+        self.assertEqual(response.json()['username'], 'taro')
+
+
+def _jpeg(width, height):
+    out = BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(out, 'JPEG')
+    out.seek(0)
+    out.name = 'photo.jpg'
+    return out
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=(320, 640, 2000), IMAGE_FORMATS=('webp', 'jpeg'), IMAGE_PROCESSING='inline')
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        self.media = TemporaryDirectory()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.addCleanup(self.media.cleanup)
+        self.user = User.objects.create(username='taro', password='x')
+        self.client = APIClient()
+
+    def test_upload_stores_original_and_variants(self):
+        response = self.client.post('/api/photos/upload/', {
+            'title': '桜', 'user': self.user.pk, 'image': _jpeg(1200, 800),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['width'], response.data['height']), (1200, 800))
+        self.assertTrue(response.data['image_url'].endswith('/original.jpg'))
+        self.assertEqual(set(response.data['srcset']), {'webp', 'jpeg'})
+        self.assertRegex(response.data['srcset']['webp'], r'^/media/photo/\w+/320\.webp 320w, \S+ 640w$')
+
+        photo = Photo.objects.get(pk=response.data['id'])
+        self.assertEqual(len(photo.variants), 4)
+        with Image.open(Path(self.media.name) / photo.variants[0]['name']) as variant:
+            self.assertEqual(variant.size, (320, 213))
+        # 取り込み前の行は空の srcset を返す
+        legacy = Photo.objects.create(title='old', image_url='https://example.com/a.jpg', user=self.user)
+        self.assertEqual(self.client.get(f'/api/photos/{legacy.pk}/').data['srcset'], {})
+
+    def test_experience_upload_and_invalid_image(self):
+        response = self.client.post('/api/experiences/upload/', {
+            'title': '茶道体験', 'description': '京都', 'location': '京都', 'image': _jpeg(200, 100),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        # 一番狭い幅より小さい画像は元画像だけ
+        self.assertEqual(response.data['srcset'], {})
+        bogus = BytesIO(b'not an image')
+        bogus.name = 'x.jpg'
+        response = self.client.post('/api/experiences/upload/', {
+            'title': 'x', 'description': 'x', 'location': 'x', 'image': bogus,
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_uploads_are_refused_before_decoding(self):
+        with override_settings(IMAGE_MAX_UPLOAD_SIZE=100):
+            response = self.client.post('/api/photos/upload/', {
+                'title': '桜', 'user': self.user.pk, 'image': _jpeg(400, 300),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 400 * 300 - 1):
+            response = self.client.post('/api/photos/upload/', {
+                'title': '桜', 'user': self.user.pk, 'image': _jpeg(400, 300),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pixels', response.data['message'])
+        self.assertFalse(Photo.objects.exists())
+        self.assertEqual(list(Path(self.media.name).rglob('*.*')), [])
+
+    def test_stored_files_are_removed_when_the_row_is_not_saved(self):
+        with mock.patch.object(Photo, 'save', side_effect=DatabaseError('boom')), self.assertRaises(DatabaseError):
+            self.client.post('/api/photos/upload/', {
+                'title': '桜', 'user': self.user.pk, 'image': _jpeg(800, 600),
+            }, format='multipart')
+        self.assertEqual(list(Path(self.media.name).rglob('*.*')), [])
+
+
+_flaky_calls = []
+
+
+@tasks.register('tests.flaky')
+def _flaky(fail_times=0):
+    _flaky_calls.append(fail_times)
+    if len(_flaky_calls) <= fail_times:
+        raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        _flaky_calls.clear()
+        self.user = User.objects.create(username='taro', password='x')
+
+    def test_successful_task_is_removed(self):
+        tasks.enqueue('tests.flaky')
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(_flaky_calls, [0])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_RETRY_DELAY=0, TASK_MAX_ATTEMPTS=2)
+    def test_retries_then_fails(self):
+        task = tasks.enqueue('tests.flaky', {'fail_times': 5})
+        with self.assertLogs('api.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 2)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertIn('RuntimeError: boom', task.last_error)
+
+    def test_retry_waits_for_backoff(self):
+        task = tasks.enqueue('tests.flaky', {'fail_times': 1})
+        with self.assertLogs('api.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertGreater(task.run_after, task.started_at)
+        Task.objects.update(run_after=task.started_at)
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_stale_running_task_is_requeued(self):
+        task = tasks.enqueue('tests.flaky')
+        tasks.claim()
+        self.assertIsNone(tasks.claim())
+        self.assertEqual(tasks.requeue_stale(timeout=-1), 1)
+        self.assertEqual(tasks.run_pending(), 1)
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(LookupError):
+            tasks.enqueue('tests.missing')
+
+    @override_settings(LIKES_FLUSH_TO_QUEUE=True)
+    def test_like_flush_is_queued(self):
+        photo = Photo.objects.create(title='p', image_url='/p.jpg', user=self.user)
+        buffer = likes.LikeBuffer(threshold=10**6, interval=3600)
+        buffer.add(Photo, photo.pk, 3, owner=self.user.pk)
+        buffer.flush()
+        photo.refresh_from_db()
+        self.assertEqual(photo.likes, 0)
+        self.assertEqual(Task.objects.get().payload['owners'], {str(photo.pk): self.user.pk})
+        tasks.run_pending()
+        photo.refresh_from_db()
+        self.assertEqual(photo.likes, 3)
+        self.assertEqual(User.objects.get(pk=self.user.pk).likes_received, 3)
+
+    @override_settings(IMAGE_PROCESSING='queue', IMAGE_FORMATS=('webp',), IMAGE_VARIANT_WIDTHS=(320,))
+    def test_deferred_image_variants(self):
+        with TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = APIClient().post('/api/photos/upload/', {
+                'title': '桜', 'user': self.user.pk, 'image': _jpeg(800, 600),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['srcset'], {})
+            self.assertEqual(tasks.run_pending(), 1)
+            photo = Photo.objects.get(pk=response.data['id'])
+            self.assertEqual([v['width'] for v in photo.variants], [320])
+
+
+class TaskWorkerTests(TransactionTestCase):
+    def test_worker_command_drains_queue(self):
+        user = User.objects.create(username='taro', password='x')
+        photo = Photo.objects.create(title='p', image_url='/p.jpg', user=user)
+        for _ in range(20):
+            tasks.enqueue('likes.apply', {'model': 'api.Photo', 'counts': {str(photo.pk): 1}})
+        out = StringIO()
+        call_command('run_tasks', concurrency=4, once=True, stdout=out)
+        photo.refresh_from_db()
+        self.assertEqual(photo.likes, 20)
+        self.assertFalse(Task.objects.exists())
+        self.assertIn('likes.apply: 20 run, 0 failed', out.getvalue())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+        user = User.objects.create(username='taro', password='x')
+        for i in range(5):
+            Photo.objects.create(title=f'photo {i}', image_url='/p.jpg', user=user)
+        self.client = APIClient()
+
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get('/api/photos/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('photo-list', self.client.get('/metrics').content.decode())
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_metrics(self):
+        response = self.client.get('/api/photos/', {'expand': 'user'})
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries", ser;dur=[\d.]+$')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('api_request_duration_seconds_count{route="photo-list",method="GET",status="200"} 1', body)
+        self.assertIn('api_db_queries_sum{route="photo-list",method="GET"} 2', body)
+        self.assertIn('api_db_queries_bucket{route="photo-list",method="GET",le="2"} 1', body)
+        self.assertIn(f'api_response_size_bytes_sum{{route="photo-list",method="GET"}} {len(response.content)}', body)
+        # 投稿者は select_related 済みなので、シリアライズ中のクエリ（N+1）はない
+        self.assertIn('api_serializer_queries_sum{route="photo-list",method="GET"} 0', body)
+
+    def test_serializer_queries_expose_n_plus_one(self):
+        serializer = PhotoWithAuthorSerializer(Photo.objects.all(), many=True)
+        with metrics.collect() as stats:
+            serializer.data
+        self.assertEqual(stats.serializer_queries, 6)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=('127.0.0.1', '10.1.0.0/16'))
+    def test_metrics_allowlist(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    def test_drf_serializers_are_not_patched(self):
+        # 計測は TimedData を使うシリアライザだけ
+        serializer = ListSerializer(child=AuthorSerializer(), instance=User.objects.all())
+        with metrics.collect() as stats:
+            serializer.data
+        self.assertEqual(stats.serializer_time, 0)
+        with metrics.collect() as stats:
+            PhotoSerializer(Photo.objects.all(), many=True).data
+        self.assertGreater(stats.serializer_time, 0)
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.user = user = User.objects.create(username='taro', password='x')
+        self.old, self.new, self.never = [
+            Photo.objects.create(title=title, image_url='/p.jpg', user=user) for title in ('old', 'new', 'never')
+        ]
+        self.client = APIClient()
+
+    def test_recent_likes_outrank_old_ones(self):
+        # 10 日前の 100 いいねは、半減期 1 日では今日の 1 いいねより軽い
+        LikeEvent.objects.create(target=LikeEvent.PHOTO, object_id=self.old.pk, count=100,
+                                 created_at=timezone.now() - timedelta(days=10))
+        likes.like(self.user, self.new)
+        self.assertEqual(trending.update(), 2)
+        self.assertFalse(LikeEvent.objects.exists())
+        response = self.client.get('/api/photos/trending/')
+        self.assertEqual([p['title'] for p in response.data], ['new', 'old'])
+
+    def test_like_unlike_cycles_do_not_raise_the_score(self):
+        fans = [User.objects.create(username=f'fan{i}', password='x') for i in range(3)]
+        for fan in fans:
+            likes.like(fan, self.old)
+        likes.like(self.user, self.new)
+        trending.update()
+        once = Photo.objects.get(pk=self.new.pk).trending_score
+        # 取り消しを同じバッチで畳んでも、別のバッチで畳んでも同じ
+        for fold in (False, True):
+            for _ in range(5):
+                for toggle in (likes.unlike, likes.like):
+                    toggle(self.user, self.new)
+                    if fold:
+                        trending.update()
+            trending.update()
+            self.assertAlmostEqual(Photo.objects.get(pk=self.new.pk).trending_score, once, delta=1e-6)
+        likes.unlike(self.user, self.new)
+        trending.update()
+        self.assertIsNone(Photo.objects.get(pk=self.new.pk).trending_score)
+        response = self.client.get('/api/photos/trending/')
+        self.assertEqual([p['title'] for p in response.data], ['old'])
+
+    def test_scores_accumulate_incrementally(self):
+        now = timezone.now()
+        for _ in range(3):
+            trending.record(Photo, {self.old.pk: 1}, now)
+            trending.update()
+        once = Photo.objects.get(pk=self.old.pk).trending_score
+        trending.record(Photo, {self.new.pk: 3}, now)
+        trending.update()
+        self.assertAlmostEqual(once, Photo.objects.get(pk=self.new.pk).trending_score)
+
+    def test_update_touches_only_liked_rows(self):
+        trending.record(Photo, {self.old.pk: 1}, timezone.now())
+        # SELECT（イベント）+ SELECT（対象行）+ UPDATE + DELETE、空になったかの確認 SELECT、各 SAVEPOINT 2 本
+        with self.assertNumQueries(9):
+            trending.update()
+        with self.assertNumQueries(3):
+            self.assertEqual(trending.update(), 0)
+
+
+THROTTLED_REST_FRAMEWORK = {
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'top': '3/min', 'like_session': '2/min', 'login': '2/min'},
+}
+
+
+@override_settings(REST_FRAMEWORK=THROTTLED_REST_FRAMEWORK)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        leaderboard._boards.clear()
+        throttling._local.clear()
+        metrics.THROTTLED.clear()
+        self.user = User.objects.create(username='taro', password=make_password('secret-pass'))
+        self.photo = Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=self.user)
+        # バケットはキャッシュに残るのでテストごとに消す
+        cache.clear()
+        self.ip = '192.0.2.1'
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+        metrics.THROTTLED.clear()
+        throttling._cache_down_until = 0.0
+
+    def test_top_is_limited_per_ip(self):
+        client = APIClient(REMOTE_ADDR=self.ip)
+        self.assertEqual([client.get('/api/photos/top/').status_code for _ in range(4)], [200, 200, 200, 429])
+        response = client.get('/api/words/top/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 19)
+        # 他の端末と、スコープのない一覧は制限されない
+        self.assertEqual(APIClient(REMOTE_ADDR='198.51.100.1').get('/api/photos/top/').status_code, 200)
+        self.assertEqual(client.get('/api/photos/').status_code, 200)
+        self.assertEqual(metrics.THROTTLED.value(('top',)), 2)
+
+    def test_likes_are_limited_per_user(self):
+        statuses = [_login(APIClient(REMOTE_ADDR=f'192.0.2.{10 + i}'), self.user).post(
+            f'/api/photos/{self.photo.id}/like/').status_code for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_login_is_limited(self):
+        client = APIClient(REMOTE_ADDR=self.ip)
+        statuses = [client.post('/api/login/', {'username': 'taro', 'password': 'wrong'}, format='json').status_code
+                    for _ in range(2)]
+        statuses.append(client.post('/api/login/', {'username': 'taro', 'password': 'secret-pass'},
+                                    format='json').status_code)
+        self.assertEqual(statuses, [401, 401, 429])
+
+    def test_bucket_bursts_then_refills(self):
+        key = f'throttle:test:{self.ip}'
+        self.assertEqual([throttling.take(key, 20, 1) for _ in range(20)], [0] * 20)
+        wait = throttling.take(key, 20, 1)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.05)
+        time.sleep(wait)
+        self.assertEqual(throttling.take(key, 20, 1), 0)
+
+    def test_falls_back_to_process_buckets_when_the_cache_fails(self):
+        broken = mock.MagicMock()
+        broken.__getitem__.return_value.get.side_effect = ConnectionError
+        with mock.patch.object(throttling, 'caches', broken), self.assertLogs('api.throttling', 'WARNING'):
+            client = APIClient(REMOTE_ADDR=self.ip)
+            self.assertEqual([client.get('/api/photos/top/').status_code for _ in range(4)], [200, 200, 200, 429])
+        # 失敗後しばらくはキャッシュに問い合わせない
+        self.assertEqual(broken.__getitem__.return_value.get.call_count, 1)
+
+
+class CoalescingTests(TestCase):
+    def setUp(self):
+        singleflight._group.clear()
+        metrics.COALESCED.clear()
+        user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=user)
+        self.client = APIClient()
+
+    def tearDown(self):
+        singleflight._group.clear()
+        metrics.COALESCED.clear()
+
+    def test_concurrent_calls_share_one_result(self):
+        group = singleflight.Group()
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def load():
+            calls.append(1)
+            time.sleep(0.3)
+            return 'rows'
+
+        def call(i):
+            barrier.wait()
+            return group.do('key', load)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(call, range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 7)
+        self.assertEqual({result for result, _ in results}, {'rows'})
+        # 終わった呼び出しは（窓が 0 なら）共有しない
+        self.assertEqual(group.do('key', load), ('rows', False))
+
+    def test_errors_are_shared_but_not_kept(self):
+        group = singleflight.Group()
+        with self.assertRaises(ZeroDivisionError):
+            group.do('key', lambda: 1 / 0, window=60)
+        self.assertEqual(group.do('key', lambda: 'ok', window=60), ('ok', False))
+
+    @override_settings(COALESCE_WINDOW=60)
+    def test_window_shares_responses_until_a_write(self):
+        first = self.client.get('/api/photos/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/photos/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(metrics.COALESCED.value(('photo-list',)), 1)
+        # ETag の元（バージョン）が変われば別のキーになる
+        self.photo.title = '桜'
+        self.photo.save()
+        self.assertEqual(self.client.get('/api/photos/').data['results'][0]['title'], '桜')
+        # ユーザーごとのレスポンスは他のユーザーと共有しない
+        liked = _login(APIClient(), self.photo.user)
+        liked.post(f'/api/photos/{self.photo.id}/like/')
+        self.assertTrue(liked.get('/api/photos/').data['results'][0]['liked_by_me'])
+        self.assertFalse(self.client.get('/api/photos/').data['results'][0]['liked_by_me'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='taro', password='x')
+        start = timezone.now() - timedelta(days=1)
+        self.words = [
+            Word.objects.create(original=f'word {i}', description='d', user=self.user, likes=i,
+                                created_at=start + timedelta(minutes=i))
+            for i in range(5)
+        ]
+        self.client = APIClient()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_streams_every_row_oldest_first(self):
+        response = self.client.get('/api/words/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('filename="words.ndjson"', response['Content-Disposition'])
+        chunks = list(response.streaming_content)
+        # 2 件ずつ読んで書き出す
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['original'] for row in rows], [f'word {i}' for i in range(5)])
+        self.assertEqual(rows[0], {
+            'id': self.words[0].id, 'original': 'word 0', 'translation': None, 'description': 'd',
+            'user_id': self.user.id, 'likes': 0,
+            'created_at': self.words[0].created_at.isoformat().replace('+00:00', 'Z'),
+        })
+
+    def test_csv_since_exports_newer_rows(self):
+        since = self.words[2].created_at.isoformat()
+        response = self.client.get('/api/words/export/', {'format': 'csv', 'since': since})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'original', 'translation', 'description', 'user_id', 'likes', 'created_at'])
+        self.assertEqual([row[1] for row in rows[1:]], ['word 3', 'word 4'])
+        self.assertEqual(rows[1][2], '')
+        # Accept でも選べる。新しい行がなくてもヘッダーは出す
+        since = self.words[4].created_at.isoformat()
+        response = self.client.get('/api/words/export/', {'since': since}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(),
+                         ['id,original,translation,description,user_id,likes,created_at'])
+
+    def test_after_id_resumes_within_a_timestamp(self):
+        # 同じ created_at の行を途中まで書き出した後の続き
+        since = self.words[0].created_at.isoformat()
+        Word.objects.update(created_at=self.words[0].created_at)
+        response = self.client.get('/api/words/export/', {'since': since, 'after_id': self.words[2].id})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [w.id for w in self.words[3:]])
+        # since だけだと同じ時刻の行は含まれない
+        response = self.client.get('/api/words/export/', {'since': since})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get('/api/photos/export/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/photos/export/', {'after_id': 3}).status_code, 400)
+        since = self.words[0].created_at.isoformat()
+        self.assertEqual(self.client.get('/api/photos/export/', {'since': since, 'after_id': 'x'}).status_code, 400)
+
+    async def test_asgi_streams_with_an_async_iterator(self):
+        response = await self.async_client.get('/api/words/export/')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 5)
+
+    def test_export_data_writes_gzipped_files(self):
+        Photo.objects.create(title='富士山', image_url='/fuji.jpg', user=self.user, variants=[{'w': 320}])
+        with TemporaryDirectory() as tmp:
+            call_command('export_data', output_dir=tmp, stdout=StringIO())
+            call_command('export_data', model=['photos'], format='csv', output_dir=tmp, stdout=StringIO())
+            with gzip.open(Path(tmp) / 'words.ndjson.gz', 'rt') as f:
+                self.assertEqual(len(f.read().splitlines()), 5)
+            with gzip.open(Path(tmp) / 'experiences.ndjson.gz', 'rt') as f:
+                self.assertEqual(f.read(), '')
+            with gzip.open(Path(tmp) / 'photos.csv.gz', 'rt', newline='') as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0]['title'], '富士山')
+            self.assertEqual(json.loads(rows[0]['variants']), [{'w': 320}])
+
+
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, 'needs the replica database of thisisjapan.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=5)
+class ReplicaTests(TestCase):
+    # 'replica' は別のローカル DB。プライマリの書き込みが届かない「遅れたレプリカ」として使う
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        objectcache.get_cache().clear()
+        leaderboard._boards.clear()
+        self.user = User.objects.create(username='taro', password='x')
+        self.photo = Photo.objects.create(title='new', image_url='/new.jpg', user=self.user)
+        # シグナルを飛ばさずにレプリカだけに古い行を入れる
+        author = User.objects.using('replica').bulk_create([User(username='old', password='x')])[0]
+        Photo.objects.using('replica').bulk_create([Photo(title='old', image_url='/old.jpg', user=author)])
+
+    def tearDown(self):
+        leaderboard._boards.clear()
+
+    def titles(self, client):
+        return [p['title'] for p in client.get('/api/photos/').data['results']]
+
+    def test_lists_read_the_replica(self):
+        response = APIClient().get('/api/photos/')
+        self.assertEqual([p['title'] for p in response.data['results']], ['old'])
+        # 直前の書き込みがまだ届いていないかもしれないので検証子を付けない
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        # キャッシュはプライマリから埋める
+        response = APIClient().get(f'/api/photos/{self.photo.id}/')
+        self.assertEqual(response.data['title'], 'new')
+
+    def test_writer_is_pinned_to_the_primary(self):
+        writer = APIClient()
+        response = writer.post('/api/photos/', {'title': 'mine', 'image_url': '/mine.jpg', 'user': self.user.id},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], 5)
+        self.assertEqual(self.titles(writer), ['mine', 'new'])
+        self.assertEqual(self.titles(APIClient()), ['old'])
+        # 固定が切れたらレプリカに戻る
+        del writer.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(self.titles(writer), ['old'])
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        router = replicas.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Photo), 'default')
+        with replicas.reads():
+            self.assertEqual(router.db_for_read(Photo), 'replica')
+            self.assertEqual(router.db_for_read(Session), 'default')
+            self.assertEqual(router.db_for_write(Photo), 'default')
+            self.assertEqual(router.db_for_read(Photo), 'default')
+        token = replicas._routing.set(replicas.Routing(pinned=True))
+        try:
+            with replicas.reads():
+                self.assertEqual(router.db_for_read(Photo), 'default')
+        finally:
+            replicas._routing.reset(token)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        client = APIClient()
+        response = client.post('/api/photos/', {'title': 'mine', 'image_url': '/mine.jpg', 'user': self.user.id},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        response = APIClient().get('/api/photos/')
+        self.assertEqual([p['title'] for p in response.data['results']], ['mine', 'new'])
+        self.assertIn('ETag', response)
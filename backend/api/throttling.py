@@ -0,0 +1,168 @@
+"""
+Token-bucket rate limits for the hot endpoints (``/top``, ``like``,
+``batch_like`` and ``/api/login/``).
+
+Rates live in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` under the view's
+scope, in DRF's ``"<n>/<s|m|h|d>"`` format: a bucket holds ``n`` tokens
+and refills at ``n`` per period, so a client can burst ``n`` requests and
+then sustain the rate. ``IPThrottle`` limits each client address (``<scope>``),
+``SessionThrottle`` each logged-in user or session (``<scope>_session``). A
+scope without a rate is not limited, so an empty ``DEFAULT_THROTTLE_RATES``
+turns throttling off (``throttle_classes`` is bound when DRF imports the
+views, rates are read per request). Viewsets map actions to scopes with
+``throttle_scopes``.
+
+Buckets are kept as GCRA timestamps (the time at which the bucket will be
+full again), one cache key per client, in ``THROTTLE_CACHE_ALIAS``. When that
+cache fails, buckets fall back to a per-process store for
+``THROTTLE_CACHE_RETRY`` seconds, so a Redis outage loosens the limits
+(per worker) instead of failing requests. Several workers without
+``REDIS_URL`` always have per-process buckets; settings.py divides the
+rates by the number of workers in that case. As with DRF's own throttles the
+read and the write are not atomic: two requests racing on one key can both
+take the last token.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import auth, metrics
+
+logger = logging.getLogger(__name__)
+
+KEY = 'throttle:{}:{}'
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``"10/min"`` -> ``(10, 60)``."""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class LocalStore:
+    """Bounded in-process stand-in for the cache (oldest keys are dropped first)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, 0))
+            return value if expires > time.monotonic() else None
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalStore()
+_cache_down_until = 0.0
+
+
+def _store():
+    alias = getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')
+    if not alias or time.monotonic() < _cache_down_until:
+        return _local
+    return caches[alias]
+
+
+def take(key, num, duration):
+    """Take a token from ``key``'s bucket; returns 0 or the seconds until one is available."""
+    global _cache_down_until
+    store = _store()
+    try:
+        return _take(store, key, num, duration)
+    except Exception:
+        if store is _local:
+            raise
+        # キャッシュが落ちている間はプロセス内のバケットで制限を続ける
+        logger.warning('Throttle cache unavailable, using in-process buckets', exc_info=True)
+        _cache_down_until = time.monotonic() + getattr(settings, 'THROTTLE_CACHE_RETRY', 30)
+        return _take(_local, key, num, duration)
+
+
+def _take(store, key, num, duration):
+    now = time.time()
+    interval = duration / num
+    # 満タンになる時刻（GCRA）。過去なら満タン
+    full_at = max(store.get(key) or now, now)
+    wait = full_at - now - interval * (num - 1)
+    if wait > 0:
+        return wait
+    full_at += interval
+    store.set(key, full_at, math.ceil(full_at - now) + 1)
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # 固定のスコープ（関数ビュー用）。ビューセットでは throttle_scopes[action]
+    scope = None
+    rate_suffix = ''
+
+    def get_scope(self, view):
+        if self.scope is not None:
+            return self.scope
+        return getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+
+    def get_client_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = None
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{scope}{self.rate_suffix}') if scope else None
+        if rate is None:
+            return True
+        client = self.get_client_key(request)
+        if client is None:
+            return True
+        delay = take(KEY.format(f'{scope}{self.rate_suffix}', client), *parse_rate(rate))
+        if delay:
+            self.delay = delay
+            metrics.THROTTLED.inc((scope,))
+            return False
+        return True
+
+    def wait(self):
+        return self.delay
+
+
+class IPThrottle(TokenBucketThrottle):
+    def get_client_key(self, request):
+        return self.get_ident(request)
+
+
+class SessionThrottle(TokenBucketThrottle):
+    rate_suffix = '_session'
+
+    def get_client_key(self, request):
+        user = auth.get_session_user(request)
+        if user is not None:
+            return f'user-{user.pk}'
+        session_key = request.session.session_key
+        return f'session-{session_key}' if session_key else None
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login'
+
+
+class LoginSessionThrottle(SessionThrottle):
+    scope = 'login'
@@ -0,0 +1,124 @@
+"""
+Time-decayed "trending" ranking for photos and words.
+
+A like at time ``t`` is worth ``exp(-(now - t) / tau)``, with
+``tau = TRENDING_HALF_LIFE / ln 2``. Every score decays by the same factor
+as time passes, so the ranking does not change if each like is instead
+weighted by ``exp((t - EPOCH) / tau)`` for a fixed ``EPOCH``. With that
+weight a score only ever grows, and a new like only touches its own row. We
+store the natural log of the sum (``trending_score``) so the numbers stay
+small, and add new likes with log-sum-exp.
+
+``likes.like()`` and ``like_many()`` append a ``LikeEvent`` for every new
+like, stamped with the ``created_at`` of its ``Like`` row. ``unlike()``
+appends a negative event with the time of the like it withdraws. That event
+has exactly the same weight, so it takes the like back out, and a user who
+likes and unlikes over and over leaves the score where it was. A score
+whose likes have all been withdrawn goes back to NULL. ``update()`` drains
+the events in batches: it groups a batch per object, reads the affected
+rows' scores, writes them back with one ``bulk_update`` and deletes the
+batch. The cost therefore grows with the number of new likes, not with
+the size of the tables. The ``/trending`` endpoints read the partial
+``(-trending_score, -id)`` index directly.
+
+Changing ``TRENDING_HALF_LIFE`` only affects likes processed afterwards.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from . import tasks
+from .conditional import bump_version
+from .models import LikeEvent, Photo, Word
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TARGETS = {LikeEvent.PHOTO: Photo, LikeEvent.WORD: Word}
+TARGET_OF = {model: target for target, model in TARGETS.items()}
+
+
+def tau():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 24 * 3600) / math.log(2)
+
+
+def log_weight(count, at):
+    """log(count * exp((at - EPOCH) / tau))"""
+    return math.log(count) + (at - EPOCH).total_seconds() / tau()
+
+
+def logaddexp(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+# 取り消し後の残りがこの割合より小さければ丸め誤差とみなす
+CANCELLED = math.log1p(-1e-9)
+
+
+def logsubexp(a, b):
+    """log(exp(a) - exp(b)), or None when ``b`` takes out everything in ``a``."""
+    if b is None:
+        return a
+    if a is None or b - a >= CANCELLED:
+        return None
+    return a + math.log1p(-math.exp(b - a))
+
+
+def record(model, counts, at):
+    """
+    Append like events for ``{pk: n}`` made at ``at``; a negative ``n``
+    withdraws likes made at ``at``. Call it in the transaction that adds or
+    removes the ``Like`` rows.
+    """
+    target = TARGET_OF[model]
+    LikeEvent.objects.bulk_create([
+        LikeEvent(target=target, object_id=pk, count=n, created_at=at) for pk, n in counts.items() if n
+    ])
+
+
+def update_batch(batch_size=10000):
+    """Fold up to ``batch_size`` events into the scores; returns the number processed."""
+    with transaction.atomic():
+        # 並行して動くジョブ同士が同じイベントを二重に数えないようにロックして取る
+        events = list(LikeEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not events:
+            return 0
+        # 対象ごとに足す重みと引く重み（取り消し）を別々に log-sum-exp で集める
+        gains, losses = defaultdict(dict), defaultdict(dict)
+        for event in events:
+            scores = (gains if event.count > 0 else losses)[event.target]
+            weight = log_weight(abs(event.count), event.created_at)
+            scores[event.object_id] = logaddexp(scores.get(event.object_id), weight)
+        targets = gains.keys() | losses.keys()
+        for target in targets:
+            model, added, removed = TARGETS[target], gains[target], losses[target]
+            rows = list(model.objects.filter(pk__in=list(added.keys() | removed.keys())).only('id', 'trending_score'))
+            for row in rows:
+                score = logaddexp(row.trending_score, added.get(row.pk))
+                row.trending_score = logsubexp(score, removed.get(row.pk))
+            model.objects.bulk_update(rows, ['trending_score'], batch_size=1000)
+        LikeEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+    for target in targets:
+        bump_version(TARGETS[target])
+    return len(events)
+
+
+@tasks.register('trending.update')
+def update(batch_size=10000):
+    """Drain all pending like events; returns the number processed."""
+    total = 0
+    while processed := update_batch(batch_size):
+        total += processed
+    return total
+
+
+def top(model, limit):
+    return list(model.objects.select_related('user')
+                .filter(trending_score__isnull=False)
+                .order_by('-trending_score', '-id')[:limit])
@@ -1,7 +1,8 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
-    UserViewSet, PhotoViewSet, WordViewSet, ExperienceViewSet,
+    UserViewSet, PhotoViewSet, WordViewSet, ExperienceViewSet, SearchView,
     register_user, login_user, logout_user, get_current_user
 )
 
@@ -13,9 +14,16 @@ router.register(r'experiences', ExperienceViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('search/', SearchView.as_view(), name='search'),
     # Authentication endpoints
     path('register/', register_user, name='register'),
     path('login/', login_user, name='login'),
     path('logout/', logout_user, name='logout'),
     path('user/', get_current_user, name='current-user'),
+    # ASGI ネイティブの読み取り専用エンドポイント
+    re_path(r'^async/(?P<feed>photos|words|experiences)/$', async_views.feed_list, name='async-feed-list'),
+    re_path(r'^async/(?P<feed>photos|words)/top/$', async_views.feed_top, name='async-feed-top'),
+    re_path(r'^async/(?P<feed>photos|words|experiences)/(?P<pk>[0-9]+)/$', async_views.feed_detail,
+            name='async-feed-detail'),
+    path('async/user/', async_views.current_user, name='async-current-user'),
 ]
\ No newline at end of file
@@ -1,20 +1,243 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework import generics, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.contrib.auth.hashers import make_password, check_password
-from django.db import IntegrityError
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.http import Http404, JsonResponse
+from . import auth, export, images, leaderboard, likes, likesets, objectcache, replicas, search, tasks, trending
+from .conditional import ConditionalGetMixin, bump_version, conditional
+from .pagination import FeedCursorPagination, FeedPagination, SearchCursorPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .throttling import LoginIPThrottle, LoginSessionThrottle
 from .models import User, Photo, Word, Experience
 from .serializers import (
     UserSerializer, UserCreateSerializer,
-    PhotoSerializer, PhotoCreateSerializer,
-    WordSerializer, WordCreateSerializer,
-    ExperienceSerializer, ExperienceCreateSerializer
+    PhotoSerializer, PhotoCreateSerializer, PhotoWithAuthorSerializer, PhotoBatchCreateSerializer,
+    PhotoUploadSerializer,
+    WordSerializer, WordCreateSerializer, WordWithAuthorSerializer, WordBatchCreateSerializer,
+    ExperienceSerializer, ExperienceCreateSerializer, ExperienceUploadSerializer,
+    PhotoValuesSerializer, PhotoWithAuthorValuesSerializer, WordValuesSerializer, WordWithAuthorValuesSerializer,
+    ExperienceValuesSerializer, BatchLikeSerializer, batch_max_size, fast_serialization
 )
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+# レート制限するアクションとスコープ（REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] のキー）
+HOT_THROTTLE_SCOPES = {'top': 'top', 'like': 'like', 'batch_like': 'like', 'export': 'export'}
+
+def expand_author(request):
+    # ?expand=user のときは投稿者の username / is_japanese を埋め込む
+    return 'user' in request.query_params.get('expand', '').split(',')
+
+class ReplicaReadMixin:
+    """list / retrieve / top の読み込みはレプリカから（書き込んだ直後のクライアントはプライマリ。api/replicas.py）"""
+    replica_actions = ('list', 'retrieve', 'top')
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action は dispatch の中で決まるので as_view() のマッピングから引く
+        if self.action_map.get(request.method.lower()) not in self.replica_actions:
+            return super().dispatch(request, *args, **kwargs)
+        with replicas.reads():
+            return super().dispatch(request, *args, **kwargs)
+
+class ValuesListMixin:
+    """list と /top, /trending を values() の行と軽量シリアライザで返す（FAST_SERIALIZATION=0 で無効）
+
+    出力は通常のシリアライザと同じ。詳細・作成・更新は従来どおり ModelSerializer を使う
+    """
+    # (通常, ?expand=user 用)
+    values_serializer_classes = None
+    values_actions = ('list', 'top', 'trending')
+
+    def use_values(self):
+        return (self.values_serializer_classes is not None and self.action in self.values_actions
+                and fast_serialization())
+
+    def get_values_serializer_class(self):
+        flat, expanded = self.values_serializer_classes
+        return expanded if expand_author(self.request) else flat
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list' and self.use_values():
+            return self.get_values_serializer_class().values(queryset)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.use_values():
+            kwargs.setdefault('context', self.get_serializer_context())
+            return self.get_values_serializer_class()(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
+class CachedRetrieveMixin:
+    """retrieve はオブジェクトキャッシュから返す（更新系の get_object は常に DB を読む）"""
+    # ?expand=user のときに添える関連オブジェクト
+    cached_related = ()
+
+    def get_object(self):
+        if self.action != 'retrieve':
+            return super().get_object()
+        model = self.queryset.model
+        related = self.cached_related if expand_author(self.request) else ()
+        try:
+            obj = objectcache.get(model, self.kwargs[self.lookup_url_kwarg or self.lookup_field], related)
+        except model.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+def likes_context(request):
+    # liked_by_me 用のリクエストユーザーのいいね集合（未ログインなら空）
+    return {'likes': likesets.for_request(request, auth.get_session_user(request))}
+
+class LikeMixin:
+    """POST/DELETE /<id>/like/ と POST /batch_like/ (ログインユーザーごとに 1 回だけ数える)
+
+    シリアライザに liked_by_me 用のいいね集合を渡し、ETag をユーザーごとに分ける
+    """
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **likes_context(self.request)}
+
+    def conditional_user_key(self, request):
+        return likesets.user_key(auth.get_session_user(request))
+
+    @action(detail=True, methods=['post', 'delete'])
+    def like(self, request, pk=None):
+        user = auth.get_session_user(request)
+        if user is None:
+            return Response({"message": "Not authenticated"}, status=status.HTTP_401_UNAUTHORIZED)
+        instance = self.get_object()
+        if request.method == 'DELETE':
+            likes.unlike(user, instance)
+            likesets.respond_with(request, type(instance), [])
+        else:
+            likes.like(user, instance)
+            likesets.respond_with(request, type(instance), [instance.pk])
+        return Response(self.get_serializer(instance).data)
+
+    @action(detail=False, methods=['post'])
+    def batch_like(self, request):
+        user = auth.get_session_user(request)
+        if user is None:
+            return Response({"message": "Not authenticated"}, status=status.HTTP_401_UNAUTHORIZED)
+        serializer = BatchLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        objects = likes.like_many(user, self.queryset.model, serializer.validated_data['ids'])
+        # 返すのは全部いいね済みの行
+        likesets.respond_with(request, self.queryset.model, [obj.pk for obj in objects])
+        return Response(self.get_serializer(objects, many=True).data)
+
+class BatchMixin:
+    """POST /batch/ (一括作成) を追加する"""
+    batch_create_serializer_class = None
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({"message": "Please provide a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > batch_max_size():
+            return Response({"message": f"A batch can contain at most {batch_max_size()} items"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.batch_create_serializer_class(data=items, many=True)
+        if not serializer.is_valid():
+            # DRF 3.18 から既定で {index: errors} になる。どの版でも入力と同じ並びのリストで返す
+            errors = serializer.errors
+            if isinstance(errors, dict):
+                errors = [errors.get(i, {}) for i in range(len(items))]
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        objects = serializer.save()
+        # bulk_create はシグナルを送らないのでキャッシュを手動で無効化する
+        model = self.queryset.model
+        leaderboard.invalidate(model)
+        objectcache.invalidate(model, [obj.pk for obj in objects])
+        bump_version(model)
+        return Response(self.get_serializer(objects, many=True).data, status=status.HTTP_201_CREATED)
+
+class ImageUploadMixin:
+    """POST /upload/ (multipart) で画像を保存し、サムネイルとレスポンシブ画像を生成して作成する
+
+    既定 (IMAGE_PROCESSING = 'queue') では元画像だけ保存して 202 を返し、生成はタスクに任せる。
+    'inline' ではリクエスト内で生成して 201 を返す
+    """
+    upload_serializer_class = None
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def upload(self, request):
+        # 画像として検証する（展開する）前に大きさを確かめる
+        image = request.FILES.get('image')
+        if image is not None and image.size > images.max_upload_size():
+            return Response({"message": f"Image is larger than {images.max_upload_size()} bytes"},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        serializer = self.upload_serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        attrs = dict(serializer.validated_data)
+        upload = attrs.pop('image')
+        upload.seek(0)
+        instance = self.queryset.model(**attrs)
+        defer = images.deferred()
+        try:
+            original = images.ingest(instance, upload.read(), defer=defer)
+        except images.InvalidImage as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                instance.save()
+                if defer:
+                    # バリアントはワーカー（manage.py run_tasks）が生成する
+                    tasks.enqueue('images.render', {'model': instance._meta.label, 'pk': instance.pk,
+                                                    'original': original})
+        except Exception:
+            # 行が残らないので保存したファイルも消す
+            images.delete(original, instance.variants)
+            raise
+        code = status.HTTP_202_ACCEPTED if defer else status.HTTP_201_CREATED
+        return Response(self.get_serializer(instance).data, status=code)
+
+class ExportMixin:
+    """GET /export/ (全件を NDJSON / CSV でストリーミング、?since=&after_id= で前回の続きから)"""
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = export.parse_since(since)
+            except ValueError:
+                return Response({"message": "since must be an ISO 8601 datetime"}, status=status.HTTP_400_BAD_REQUEST)
+        after_id = request.query_params.get('after_id')
+        if after_id is not None:
+            try:
+                after_id = export.parse_after_id(after_id)
+            except ValueError:
+                return Response({"message": "after_id must be a non-negative integer"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if since is None:
+                return Response({"message": "after_id requires since"}, status=status.HTTP_400_BAD_REQUEST)
+        return export.response(request, self.queryset.model, request.accepted_renderer, since, after_id)
+
+class UserViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedRetrieveMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all().order_by('id')
+    # 投稿一覧のアクション: (モデル, 通常のシリアライザ, ?expand=user 用, 軽量版, 軽量版 ?expand=user)
+    feeds = {
+        'photos': (Photo, PhotoSerializer, PhotoWithAuthorSerializer,
+                   PhotoValuesSerializer, PhotoWithAuthorValuesSerializer),
+        'words': (Word, WordSerializer, WordWithAuthorSerializer,
+                  WordValuesSerializer, WordWithAuthorValuesSerializer),
+    }
+
+    @property
+    def conditional_models(self):
+        # ユーザーごとの投稿一覧は投稿の変更にも依存する
+        if self.action in self.feeds:
+            return (self.feeds[self.action][0], User)
+        return (User,)
+
+    def conditional_user_key(self, request):
+        # 投稿一覧だけが liked_by_me を含む
+        if self.action in self.feeds:
+            return likesets.user_key(auth.get_session_user(request))
+        return None
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -25,74 +248,167 @@ class UserViewSet(viewsets.ModelViewSet):
     def by_username(self, request):
         username = request.query_params.get('username', None)
         if username is not None:
-            user = User.objects.filter(username=username).first()
-            if user:
-                serializer = self.get_serializer(user)
-                return Response(serializer.data)
+            try:
+                user = objectcache.get_by(User, 'username', username)
+            except User.DoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            serializer = self.get_serializer(user)
+            return Response(serializer.data)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-class PhotoViewSet(viewsets.ModelViewSet):
-    queryset = Photo.objects.all().order_by('-created_at')
+    @action(detail=True, methods=['get'])
+    @conditional
+    def photos(self, request, pk=None):
+        return self.user_feed(request, pk)
+
+    @action(detail=True, methods=['get'])
+    @conditional
+    def words(self, request, pk=None):
+        return self.user_feed(request, pk)
+
+    def user_feed(self, request, pk):
+        """GET /users/<id>/photos/ と /words/ (新しい順、カーソルページネーション)"""
+        model, flat, expanded, values_flat, values_expanded = self.feeds[self.action]
+        try:
+            user = objectcache.get(User, pk)
+        except User.DoesNotExist:
+            raise Http404
+        # (user_id, -created_at, -id) の索引をそのまま辿る
+        queryset = model.objects.filter(user=user)
+        if fast_serialization():
+            serializer_class = values_expanded if expand_author(request) else values_flat
+            queryset = serializer_class.values(queryset)
+        else:
+            serializer_class = expanded if expand_author(request) else flat
+            queryset = queryset.select_related('user')
+        paginator = FeedCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        data = serializer_class(page, many=True, context={'request': request, **likes_context(request)}).data
+        return paginator.get_paginated_response(data)
+
+class PhotoViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedRetrieveMixin, ValuesListMixin, LikeMixin, BatchMixin,
+                   ImageUploadMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Photo.objects.select_related('user').order_by('-created_at', '-id')
+    pagination_class = FeedPagination
+    conditional_models = (Photo, User)
+    throttle_scopes = HOT_THROTTLE_SCOPES
+    batch_create_serializer_class = PhotoBatchCreateSerializer
+    upload_serializer_class = PhotoUploadSerializer
+    values_serializer_classes = (PhotoValuesSerializer, PhotoWithAuthorValuesSerializer)
+    cached_related = ('user',)
     
     def get_serializer_class(self):
         if self.action == 'create':
             return PhotoCreateSerializer
+        if self.action not in ('update', 'partial_update') and expand_author(self.request):
+            return PhotoWithAuthorSerializer
         return PhotoSerializer
     
     @action(detail=False, methods=['get'])
+    @conditional
     def top(self, request):
-        limit = int(request.query_params.get('limit', 5))
-        photos = Photo.objects.order_by('-likes')[:limit]
+        limit = leaderboard.parse_limit(request.query_params.get('limit'))
+        photos = leaderboard.top(Photo, limit)
         serializer = self.get_serializer(photos, many=True)
         return Response(serializer.data)
-    
-    @action(detail=True, methods=['post'])
-    def like(self, request, pk=None):
-        photo = self.get_object()
-        photo.likes += 1
-        photo.save()
-        serializer = self.get_serializer(photo)
+
+    @action(detail=False, methods=['get'])
+    @conditional
+    def trending(self, request):
+        # 時間減衰つきスコアの索引をそのまま読む（スコアは update_trending が更新）
+        limit = leaderboard.parse_limit(request.query_params.get('limit'))
+        photos = trending.top(Photo, limit)
+        serializer = self.get_serializer(photos, many=True)
         return Response(serializer.data)
 
-class WordViewSet(viewsets.ModelViewSet):
-    queryset = Word.objects.all().order_by('-created_at')
+class WordViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedRetrieveMixin, ValuesListMixin, LikeMixin, BatchMixin,
+                  ExportMixin, viewsets.ModelViewSet):
+    queryset = Word.objects.select_related('user').order_by('-created_at', '-id')
+    pagination_class = FeedPagination
+    conditional_models = (Word, User)
+    throttle_scopes = HOT_THROTTLE_SCOPES
+    batch_create_serializer_class = WordBatchCreateSerializer
+    values_serializer_classes = (WordValuesSerializer, WordWithAuthorValuesSerializer)
+    cached_related = ('user',)
     
     def get_serializer_class(self):
         if self.action == 'create':
             return WordCreateSerializer
+        if self.action not in ('update', 'partial_update') and expand_author(self.request):
+            return WordWithAuthorSerializer
         return WordSerializer
     
     @action(detail=False, methods=['get'])
+    @conditional
     def top(self, request):
-        limit = int(request.query_params.get('limit', 5))
-        words = Word.objects.order_by('-likes')[:limit]
+        limit = leaderboard.parse_limit(request.query_params.get('limit'))
+        words = leaderboard.top(Word, limit)
         serializer = self.get_serializer(words, many=True)
         return Response(serializer.data)
-    
-    @action(detail=True, methods=['post'])
-    def like(self, request, pk=None):
-        word = self.get_object()
-        word.likes += 1
-        word.save()
-        serializer = self.get_serializer(word)
+
+    @action(detail=False, methods=['get'])
+    @conditional
+    def trending(self, request):
+        # 時間減衰つきスコアの索引をそのまま読む（スコアは update_trending が更新）
+        limit = leaderboard.parse_limit(request.query_params.get('limit'))
+        words = trending.top(Word, limit)
+        serializer = self.get_serializer(words, many=True)
         return Response(serializer.data)
 
-class ExperienceViewSet(viewsets.ModelViewSet):
-    queryset = Experience.objects.all().order_by('-created_at')
+class ExperienceViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedRetrieveMixin, ValuesListMixin, ImageUploadMixin,
+                        ExportMixin, viewsets.ModelViewSet):
+    queryset = Experience.objects.all().order_by('-created_at', '-id')
+    pagination_class = FeedPagination
+    conditional_models = (Experience,)
+    throttle_scopes = {'export': 'export'}
+    upload_serializer_class = ExperienceUploadSerializer
+    values_serializer_classes = (ExperienceValuesSerializer, ExperienceValuesSerializer)
     
     def get_serializer_class(self):
         if self.action == 'create':
             return ExperienceCreateSerializer
         return ExperienceSerializer
 
+class SearchView(generics.ListAPIView):
+    """GET /api/search/?q=...&type=words|photos|experiences&mode=auto|fts|trigram"""
+    pagination_class = SearchCursorPagination
+    serializer_classes = {
+        'words': (WordSerializer, WordWithAuthorSerializer),
+        'photos': (PhotoSerializer, PhotoWithAuthorSerializer),
+        'experiences': (ExperienceSerializer, ExperienceSerializer),
+    }
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"message": "Please provide a search query"}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('type', 'words') not in search.SEARCH_TARGETS:
+            return Response({"message": "Unknown search type"}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('mode', 'auto') not in search.MODES:
+            return Response({"message": "Unknown search mode"}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset, self.search_ordering = search.search(
+            params.get('type', 'words'), params['q'].strip(), params.get('mode', 'auto'))
+        return queryset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **likes_context(self.request)}
+
+    def get_serializer_class(self):
+        flat, expanded = self.serializer_classes[self.request.query_params.get('type', 'words')]
+        return expanded if expand_author(self.request) else flat
+
 # Authentication views
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register_user(request):
     try:
         data = request.data
-        # パスワードのハッシュ化
-        hashed_password = make_password(data['password'])
+        # パスワードのハッシュ化（専用スレッドプールで実行）
+        hashed_password = auth.hash_password(data['password'])
         
         user = User.objects.create(
             username=data['username'],
@@ -101,7 +417,7 @@ def register_user(request):
         )
         
         # セッションに保存（ログイン処理の代わり）
-        request.session['user_id'] = user.id
+        auth.login(request, user)
         
         # パスワードを除外したユーザーデータを返す
         serializer = UserSerializer(user)
@@ -113,6 +429,7 @@ def register_user(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPThrottle, LoginSessionThrottle])
 def login_user(request):
     username = request.data.get('username')
     password = request.data.get('password')
@@ -123,10 +440,10 @@ def login_user(request):
     # カスタム認証ロジック
     try:
         user = User.objects.get(username=username)
-        # パスワードの検証（make_password で暗号化されたパスワードを比較）
-        if check_password(password, user.password):
+        # パスワードの検証（古いハッシュや平文はここで再ハッシュされる）
+        if auth.check_user_password(user, password):
             # セッションに保存（Django認証システムと同等）
-            request.session['user_id'] = user.id
+            auth.login(request, user)
             serializer = UserSerializer(user)
             return Response(serializer.data)
     except User.DoesNotExist:
@@ -137,19 +454,14 @@ def login_user(request):
 @api_view(['POST'])
 def logout_user(request):
     # セッションからユーザーIDを削除
-    if 'user_id' in request.session:
-        del request.session['user_id']
+    auth.logout(request)
     return Response({"message": "Successfully logged out"}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def get_current_user(request):
-    # セッションからユーザーIDを取得
-    user_id = request.session.get('user_id')
-    if user_id:
-        try:
-            user = User.objects.get(id=user_id)
-            serializer = UserSerializer(user)
-            return Response(serializer.data)
-        except User.DoesNotExist:
-            pass
+    # セッションのユーザーを取得（キャッシュ済みなら DB に問い合わせない）
+    user = auth.get_session_user(request)
+    if user is not None:
+        serializer = UserSerializer(user)
+        return Response(serializer.data)
     return Response({"message": "Not authenticated"}, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Sync WSGI versus async ASGI read endpoints under growing client concurrency.
+
+    python benchmarks/bench_async.py -c 64 256 1024 -d 15
+
+For each concurrency level, starts ``run.py wsgi`` and drives the DRF feed
+(``/api/photos/?cursor=``). It then starts ``run.py asgi`` and drives the
+async feed (``/api/async/photos/``). Both run with the same number of
+worker processes (``--workers``) against the database configured through
+the PG* environment variables; seed it first with ``initialize_data``.
+Once the clients outnumber the WSGI threads, WSGI requests queue. The ASGI
+worker keeps accepting them.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from common import BACKEND_DIR
+from loadtest import run, wait_for
+
+TARGETS = {
+    'wsgi': '/api/photos/?cursor=',
+    'asgi': '/api/async/photos/',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8013)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='threads per WSGI worker')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('-d', '--duration', type=float, default=15.0)
+    args = parser.parse_args()
+
+    print(f'{"mode":<5} {"clients":>7} {"rps":>9} {"p50_ms":>9} {"p99_ms":>9} {"errors":>7}')
+    for concurrency in args.concurrency:
+        for mode, path in TARGETS.items():
+            url = f'http://127.0.0.1:{args.port}{path}'
+            env = {
+                **os.environ,
+                'WEB_BIND': f'127.0.0.1:{args.port}',
+                'WEB_CONCURRENCY': str(args.workers),
+                'WEB_THREADS': str(args.threads),
+                'WEB_BACKLOG': str(max(2048, concurrency * 2)),
+                'WEB_ACCESS_LOG': '/dev/null',
+            }
+            server = subprocess.Popen([sys.executable, 'run.py', mode], cwd=BACKEND_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for(url)
+                result = run(url, concurrency, args.duration)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{mode:<5} {concurrency:>7} {result["rps"]:>9} {result.get("p50_ms", "-"):>9} '
+                  f'{result.get("p99_ms", "-"):>9} {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
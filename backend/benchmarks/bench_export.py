@@ -0,0 +1,82 @@
+"""
+Full-table read of /api/words/: paging through the list vs the streaming export.
+
+    python benchmarks/bench_export.py --sqlite
+    python benchmarks/bench_export.py --rows 100000 --chunk-size 5000
+
+For each table size this reads every word three ways through the test
+client and reports wall time, rows/s, SQL queries and the peak Python
+memory (tracemalloc) of the read:
+
+* ``paged``: GET /api/words/?page=N with PAGE_SIZE rows per page (what the
+  analytics and backup jobs did before),
+* ``export ndjson`` and ``export csv``: GET /api/words/export/, consumed
+  chunk by chunk.
+
+The export's peak memory should stay flat as ``--rows`` grows.
+"""
+import time
+import tracemalloc
+
+from common import benchmark_database, make_parser, seed_feed
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[2000, 20000])
+    parser.add_argument('--chunk-size', type=int, default=None, help='EXPORT_CHUNK_SIZE (default from settings)')
+    parser.add_argument('--skip-paged', action='store_true', help='only time the export')
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from django.conf import settings
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from api.models import User, Word
+
+        if args.chunk_size:
+            settings.EXPORT_CHUNK_SIZE = args.chunk_size
+        # ページをキャッシュさせない（毎回 DB から読む）
+        settings.COALESCE_REQUESTS = False
+        user = User.objects.create(username='bench', password='!')
+        client = Client()
+
+        def paged():
+            rows, page = 0, 1
+            while True:
+                data = client.get('/api/words/', {'page': page}).json()
+                rows += len(data['results'])
+                if not data['next']:
+                    return rows
+                page += 1
+
+        def exported(fmt):
+            def read():
+                response = client.get('/api/words/export/', {'format': fmt})
+                lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+                return lines - (fmt == 'csv')
+            return read
+
+        cases = {'export ndjson': exported('ndjson'), 'export csv': exported('csv')}
+        if not args.skip_paged:
+            cases = {'paged': paged, **cases}
+        print(f'{"rows":>8} {"case":<14} {"seconds":>8} {"rows/s":>9} {"queries":>8} {"peak_mb":>8}')
+        for size in args.rows:
+            seed_feed(Word, size, original=lambda i: f'word {i}', translation='translation',
+                      description='富士山と桜の説明', user=user, likes=lambda i: i % 97)
+            for name, func in cases.items():
+                tracemalloc.start()
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    rows = func()
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                assert rows == size, f'{name} read {rows} rows, expected {size}'
+                print(f'{size:>8} {name:<14} {elapsed:>8.2f} {size / elapsed:>9.0f} {len(queries):>8} '
+                      f'{peak / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
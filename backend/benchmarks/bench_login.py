@@ -0,0 +1,91 @@
+"""
+Logins per second (and per core) through /api/login/ for each password hasher.
+
+    python benchmarks/bench_login.py --sqlite -c 8 -d 10
+
+Every profile hashes the benchmark user's password with its own parameters
+and is installed as the preferred hasher, so logins verify without
+triggering a rehash. Hashing runs on the PASSWORD_HASHING_CONCURRENCY pool,
+so ``-c`` larger than that only adds queueing.
+"""
+import os
+import threading
+import time
+
+from common import benchmark_database, make_parser, summarize
+
+# name: (hasher class, cost parameters)
+PROFILES = {
+    'pbkdf2': ('TunedPBKDF2PasswordHasher', {}),
+    'pbkdf2-600k': ('TunedPBKDF2PasswordHasher', {'iterations': 600_000}),
+    'scrypt': ('TunedScryptPasswordHasher', {}),
+    'argon2': ('TunedArgon2PasswordHasher', {}),
+    'argon2-owasp': ('TunedArgon2PasswordHasher', {'memory_cost': 19_456, 'time_cost': 2, 'parallelism': 1}),
+}
+
+
+def run_logins(concurrency, duration):
+    from django.test import Client
+
+    deadline = time.monotonic() + duration
+    samples, errors = [], []
+
+    def worker():
+        client = Client()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.post('/api/login/', {'username': 'bench', 'password': 'bench-password'},
+                                   content_type='application/json')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+            samples.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('-c', '--concurrency', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from django.conf import settings
+        from django.contrib.auth.hashers import make_password
+        from django.test import override_settings
+        from api import hashers
+        from api.models import User
+
+        user = User.objects.create(username='bench', password='!')
+        cores = min(args.concurrency, settings.PASSWORD_HASHING_CONCURRENCY, os.cpu_count() or 1)
+        print(f'{"profile":<13} {"logins/s":>9} {"per core":>9} {"p50_ms":>9} {"p99_ms":>9} {"errors":>7}')
+        for name in args.profiles:
+            class_name, params = PROFILES[name]
+            hasher = getattr(hashers, class_name)
+            defaults = {key: getattr(hasher, key) for key in params}
+            # ログイン時に must_update で再ハッシュされないよう、検証側も同じパラメータにする
+            for key, value in params.items():
+                setattr(hasher, key, value)
+            try:
+                with override_settings(PASSWORD_HASHERS=[f'api.hashers.{class_name}']):
+                    user.password = make_password('bench-password')
+                    user.save(update_fields=['password'])
+                    samples, errors, elapsed = run_logins(args.concurrency, args.duration)
+            finally:
+                for key, value in defaults.items():
+                    setattr(hasher, key, value)
+            rate = len(samples) / elapsed
+            stats = summarize(samples)
+            print(f'{name:<13} {rate:>9.1f} {rate / cores:>9.1f} {stats["p50_ms"]:>9} '
+                  f'{stats["p99_ms"]:>9} {len(errors):>7}')
+
+
+if __name__ == '__main__':
+    main()
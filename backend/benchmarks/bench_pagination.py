@@ -0,0 +1,52 @@
+"""
+Page latency of /api/photos/ with page-number vs cursor pagination.
+
+    python benchmarks/bench_pagination.py --sqlite --pages 10000
+
+Page-number latency grows with the page number (COUNT(*) + OFFSET scan);
+cursor latency should stay flat from the first page to the last, also
+through the runs of photos that share a ``created_at`` (see ``seed_feed``).
+"""
+from common import benchmark_database, make_parser, measure, seed_feed, summarize
+
+PAGE_SIZE = 20
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--pages', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from django.test import Client
+        from api.models import Photo, User
+        from api.pagination import FeedCursorPagination
+
+        user, _ = User.objects.get_or_create(username='bench', defaults={'password': '!'})
+        print(f'Seeding {args.pages * PAGE_SIZE} photos...')
+        seed_feed(Photo, args.pages * PAGE_SIZE, title=lambda i: f'photo {i}',
+                  image_url='https://example.com/photo.jpg', user=user)
+
+        paginator = FeedCursorPagination()
+        paginator.base_url = '/api/photos/'
+        client = Client()
+        checkpoints = sorted({p for p in (1, 10, 100, 1000, args.pages // 2, args.pages) if p <= args.pages})
+
+        print(f'{"page":>8} {"mode":>7} {"p50_ms":>9} {"p95_ms":>9}')
+        for page in checkpoints:
+            url = f'/api/photos/?page={page}'
+            stats = summarize(measure(lambda: client.get(url), repeat=args.repeat))
+            print(f'{page:>8} {"page":>7} {stats["p50_ms"]:>9} {stats["p95_ms"]:>9}')
+
+            if page == 1:
+                cursor_url = '/api/photos/?cursor='
+            else:
+                last = Photo.objects.order_by('-created_at', '-id')[(page - 1) * PAGE_SIZE - 1]
+                cursor_url = paginator.encode_cursor(paginator.position(last))
+            stats = summarize(measure(lambda: client.get(cursor_url), repeat=args.repeat))
+            print(f'{page:>8} {"cursor":>7} {stats["p50_ms"]:>9} {stats["p95_ms"]:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+p50/p99 latency of /api/photos/ with database connection reuse off and on.
+
+    python benchmarks/bench_pooling.py -c 16 -d 15
+
+Starts one server per mode against the database configured through the PG*
+environment variables (seed it first with ``initialize_data``):
+
+* ``off``: CONN_MAX_AGE=0, a new connection per request
+* ``persistent``: CONN_MAX_AGE with health checks
+* ``pool``: psycopg 3 connection pool (DB_POOL=1)
+
+The development server starts a thread per request, so persistent
+connections are never reused there; pass ``--server`` to benchmark a
+production server command instead, e.g.
+``--server "gunicorn -c gunicorn.conf.py thisisjapan.wsgi -b 127.0.0.1:{port}"``.
+"""
+import argparse
+import os
+import shlex
+import subprocess
+
+from common import BACKEND_DIR
+from loadtest import run, wait_for
+
+MODES = {
+    'off': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'},
+    'persistent': {'DB_CONN_MAX_AGE': '600', 'DB_POOL': '0'},
+    'pool': {'DB_POOL': '1'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', default='python manage.py runserver --noreload 127.0.0.1:{port}')
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--path', default='/api/photos/')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-d', '--duration', type=float, default=15.0)
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+    print(f'{"mode":<11} {"rps":>8} {"p50_ms":>9} {"p99_ms":>9} {"errors":>7}')
+    for mode in args.modes:
+        env = {**os.environ, **MODES[mode], 'WEB_THREADS': str(args.concurrency)}
+        server = subprocess.Popen(shlex.split(args.server.format(port=args.port)), cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(url)
+            result = run(url, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f'{mode:<11} {result["rps"]:>8} {result.get("p50_ms", "-"):>9} '
+              f'{result.get("p99_ms", "-"):>9} {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
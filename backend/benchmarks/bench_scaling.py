@@ -0,0 +1,64 @@
+"""
+Requests per second of the production server as workers are added.
+
+    python benchmarks/bench_scaling.py --mode wsgi -c 64 -d 15
+
+Starts ``run.py <mode>`` with WEB_CONCURRENCY = 1, 2, 4, ... up to the
+number of CPU cores against the database configured through the PG*
+environment variables, and drives it with loadtest.py. Throughput should
+grow roughly linearly until the cores (or the database) are saturated.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from common import BACKEND_DIR
+from loadtest import run, wait_for
+
+
+def worker_counts(limit):
+    count = 1
+    while count < limit:
+        yield count
+        count *= 2
+    yield limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--port', type=int, default=8012)
+    parser.add_argument('--path', default='/api/photos/')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('-c', '--concurrency', type=int, default=64)
+    parser.add_argument('-d', '--duration', type=float, default=15.0)
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+    baseline = None
+    print(f'{"workers":>7} {"rps":>9} {"speedup":>8} {"p50_ms":>9} {"p99_ms":>9} {"errors":>7}')
+    for workers in worker_counts(args.max_workers):
+        env = {
+            **os.environ,
+            'WEB_BIND': f'127.0.0.1:{args.port}',
+            'WEB_CONCURRENCY': str(workers),
+            'WEB_THREADS': str(args.threads),
+            'WEB_ACCESS_LOG': '/dev/null',
+        }
+        server = subprocess.Popen([sys.executable, 'run.py', args.mode], cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(url)
+            result = run(url, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or result['rps']
+        print(f'{workers:>7} {result["rps"]:>9} {result["rps"] / baseline:>7.2f}x '
+              f'{result.get("p50_ms", "-"):>9} {result.get("p99_ms", "-"):>9} {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Search latency over a large word corpus.
+
+    python benchmarks/bench_search.py --words 1000000
+
+Needs PostgreSQL (the GIN indexes only exist there). Each query is run
+through /api/search/ in fts and trigram mode and, for comparison, as the
+unindexed icontains scan the endpoint replaces.
+"""
+import sys
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from common import benchmark_database, make_parser, measure, summarize
+
+QUERIES = ['tea ceremony', 'fireworks', 'mount fuji', 'わびさび', '木漏れ日', 'はなび']
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--words', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from django.db import connection
+        from django.db.models import Q
+        from django.test import Client
+        from api.models import User, Word
+        from api.synthetic import Generator
+
+        if connection.vendor != 'postgresql':
+            sys.exit('bench_search.py needs PostgreSQL')
+
+        user, _ = User.objects.get_or_create(username='bench', defaults={'password': '!'})
+        existing = Word.objects.count()
+        if existing < args.words:
+            print(f'Seeding {args.words - existing} words...')
+            words = Generator(seed=42).words(args.words - existing, [user.id])
+            while batch := list(islice(words, 10_000)):
+                Word.objects.bulk_create(batch)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE api_word')
+
+        client = Client()
+        print(f'{"query":<16} {"mode":<8} {"p50_ms":>9} {"p95_ms":>9}')
+        for query in QUERIES:
+            for mode in ('fts', 'trigram'):
+                stats = summarize(measure(
+                    lambda: client.get('/api/search/', {'q': query, 'mode': mode}), repeat=args.repeat))
+                print(f'{query:<16} {mode:<8} {stats["p50_ms"]:>9} {stats["p95_ms"]:>9}')
+            scan = reduce(or_, [Q(**{f'{f}__icontains': query}) for f in ('original', 'translation', 'description')])
+            stats = summarize(measure(
+                lambda: list(Word.objects.filter(scan).order_by('-created_at')[:20]), repeat=args.repeat))
+            print(f'{query:<16} {"scan":<8} {stats["p50_ms"]:>9} {stats["p95_ms"]:>9}')
+
+
+if __name__ == '__main__':
+    main()
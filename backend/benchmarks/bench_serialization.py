@@ -0,0 +1,48 @@
+"""
+Serialization throughput of photo pages with and without ?expand=user.
+
+    python benchmarks/bench_serialization.py --sqlite
+
+Compares the select_related('user') path against resolving authors one
+query per row, which is what clients did with follow-up /api/users/<id>/
+calls.
+"""
+from common import benchmark_database, make_parser, measure, seed_feed
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from api.models import Photo, User
+        from api.serializers import PhotoSerializer, PhotoWithAuthorSerializer
+
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', password='!', is_japanese=bool(i % 2)) for i in range(args.rows)
+        ])
+        seed_feed(Photo, args.rows, title=lambda i: f'photo {i}',
+                  image_url='https://example.com/photo.jpg', user=lambda i: users[i % len(users)])
+
+        cases = {
+            'flat': lambda: PhotoSerializer(list(Photo.objects.all()[:args.rows]), many=True).data,
+            'expanded, N+1': lambda: PhotoWithAuthorSerializer(
+                list(Photo.objects.all()[:args.rows]), many=True).data,
+            'expanded, select_related': lambda: PhotoWithAuthorSerializer(
+                list(Photo.objects.select_related('user')[:args.rows]), many=True).data,
+        }
+        print(f'{"case":<26} {"queries":>7} {"pages/s":>9} {"rows/s":>10}')
+        for name, func in cases.items():
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            samples = measure(func, repeat=args.repeat)
+            pages = len(samples) / sum(samples)
+            print(f'{name:<26} {len(queries):>7} {pages:>9.0f} {pages * args.rows:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Database load during a request spike, with and without the rate limits and
+request coalescing (api/throttling.py, api/singleflight.py).
+
+    python benchmarks/bench_spike.py --sqlite
+    python benchmarks/bench_spike.py -c 64 -d 10 --rate 50/s --max-qps 500
+
+Each burst sends ``-c`` in-process clients, all from one address and one
+logged-in session, at one endpoint for ``-d`` seconds:
+
+* ``top``: GET /api/photos/top/ while the leaderboard is dropped every
+  ``--churn`` seconds, so every churn is a cold board,
+* ``list``: GET /api/photos/ while the Photo version is bumped every
+  ``--churn`` seconds, so every churn makes the page a cache miss,
+* ``like``: POST /api/photos/<id>/like/ on random photos,
+* ``login``: POST /api/login/ with a wrong password.
+
+Every burst runs twice. ``off`` disables throttling and coalescing; ``on``
+uses ``--rate`` for the ``top`` and ``like`` scopes and ``--login-rate``
+for ``login`` (per address and per session) with coalescing enabled.
+For each run the script reports the requests sent, the ones admitted
+(2xx/304) and rejected (429), the SQL statements issued by all clients,
+and the resulting database QPS. A rejected request still reads its
+session (DRF authenticates before it throttles), so with
+``SESSION_BACKEND=db`` it costs one query.
+
+A token bucket admits at most ``n + rate * duration`` requests. The script
+exits with status 1 when a limited ``on`` run admits more than that, plus
+one request per client for the non-atomic bucket update, or when its
+database QPS exceeds ``--max-qps``.
+"""
+import logging
+import random
+import sys
+import threading
+import time
+
+from common import benchmark_database, make_parser, seed_feed
+
+PASSWORD = 'bench-password'
+
+
+class QueryCounter:
+    """Counts SQL statements on every connection opened after ``install()``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.total += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(lambda sender, connection, **kwargs: connection.execute_wrappers.append(self),
+                                   weak=False)
+        connection.execute_wrappers.append(self)
+
+
+def burst(func, clients, duration, churn=None, interval=0.1):
+    """Run ``func(client, rng)`` from every client for ``duration`` seconds; returns status counts."""
+    from django.db import connection
+
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    statuses = {}
+
+    def worker(client, rng):
+        try:
+            while time.monotonic() < deadline:
+                code = func(client, rng).status_code
+                with lock:
+                    statuses[code] = statuses.get(code, 0) + 1
+        finally:
+            connection.close()
+
+    def churner():
+        while time.monotonic() < deadline:
+            churn()
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=worker, args=(client, random.Random(i))) for i, client in enumerate(clients)]
+    if churn is not None:
+        threads.append(threading.Thread(target=churner))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def bound(rate, duration, concurrency):
+    """Most requests a token bucket for ``rate`` may admit in ``duration`` seconds (plus race slack)."""
+    from api.throttling import parse_rate
+
+    num, period = parse_rate(rate)
+    return int(num + num / period * duration) + concurrency
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=5.0, help='seconds per burst')
+    parser.add_argument('--rows', type=int, default=2000, help='photos to seed')
+    parser.add_argument('--rate', default='50/s', help='rate of the top and like scopes in the "on" runs')
+    parser.add_argument('--login-rate', default='5/s', help='rate of the login scope in the "on" runs')
+    parser.add_argument('--churn', type=float, default=0.1, help='seconds between cache misses')
+    parser.add_argument('--max-qps', type=float, help='fail when an "on" run issues more SQL statements per second')
+    parser.add_argument('--bursts', nargs='+', default=['top', 'list', 'like', 'login'])
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        # 401 / 429 ごとの警告ログを出さない
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        from django.conf import settings
+        from django.contrib.auth.hashers import make_password
+        from django.core.cache import cache
+        from django.test import Client
+        from rest_framework.settings import api_settings
+        from api import leaderboard, singleflight, throttling
+        from api.conditional import bump_version
+        from api.models import Photo, User
+
+        user = User.objects.create(username='bench', password=make_password(PASSWORD))
+        seed_feed(Photo, args.rows, title=lambda i: f'photo {i}', image_url='/p.jpg', user=user,
+                  likes=lambda i: i % 97)
+        ids = list(Photo.objects.values_list('pk', flat=True))
+        login = Client()
+        login.post('/api/login/', {'username': 'bench', 'password': PASSWORD}, content_type='application/json')
+        session = login.cookies[settings.SESSION_COOKIE_NAME].value
+        counter = QueryCounter()
+        counter.install()
+
+        bursts = {
+            'top': (lambda c, r: c.get('/api/photos/top/', {'limit': 20}), lambda: leaderboard.invalidate(Photo)),
+            'list': (lambda c, r: c.get('/api/photos/'), lambda: bump_version(Photo)),
+            'like': (lambda c, r: c.post(f'/api/photos/{r.choice(ids)}/like/'), None),
+            'login': (lambda c, r: c.post('/api/login/', {'username': 'bench', 'password': 'wrong'},
+                                          content_type='application/json'), None),
+        }
+        limited = {'top', 'like', 'login'}
+        base = dict(settings.REST_FRAMEWORK)
+        failures = []
+        print(f'{"burst":<6} {"mode":<4} {"requests":>9} {"admitted":>9} {"429":>7} {"queries":>9} '
+              f'{"db_qps":>9} {"admitted/s":>11}')
+        for name in args.bursts:
+            func, churn = bursts[name]
+            for mode in ('off', 'on'):
+                if mode == 'on':
+                    rates = {'top': args.rate, 'like': args.rate, 'login': args.login_rate}
+                    rates.update({f'{scope}_session': rate for scope, rate in rates.items()})
+                    settings.REST_FRAMEWORK = {**base, 'DEFAULT_THROTTLE_RATES': rates}
+                else:
+                    settings.REST_FRAMEWORK = {**base, 'DEFAULT_THROTTLE_RATES': {}}
+                settings.COALESCE_REQUESTS = mode == 'on'
+                api_settings.reload()
+                throttling._local.clear()
+                singleflight._group.clear()
+                cache.clear()
+                # 全クライアントで 1 つのセッションを使う
+                clients = [Client() for _ in range(args.concurrency)]
+                for client in clients:
+                    client.cookies[settings.SESSION_COOKIE_NAME] = session
+
+                before = counter.total
+                started = time.monotonic()
+                statuses = burst(func, clients, args.duration, churn, args.churn)
+                elapsed = time.monotonic() - started
+                queries = counter.total - before
+                total = sum(statuses.values())
+                admitted = sum(n for code, n in statuses.items() if code < 400 or (name == 'login' and code == 401))
+                rejected = statuses.get(429, 0)
+                qps = queries / elapsed
+                print(f'{name:<6} {mode:<4} {total:>9} {admitted:>9} {rejected:>7} {queries:>9} {qps:>9.0f} '
+                      f'{admitted / elapsed:>11.1f}')
+                if mode == 'on' and name in limited:
+                    cap = bound(rates[name], elapsed, args.concurrency)
+                    if admitted > cap:
+                        failures.append(f'{name}: admitted {admitted} > {cap}')
+                if mode == 'on' and args.max_qps and qps > args.max_qps:
+                    failures.append(f'{name}: {qps:.0f} queries/s > {args.max_qps:.0f}')
+        settings.REST_FRAMEWORK = base
+        api_settings.reload()
+
+    if failures:
+        print('\nCap exceeded:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('\nAll caps held.')
+
+
+if __name__ == '__main__':
+    main()
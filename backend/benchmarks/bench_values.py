@@ -0,0 +1,75 @@
+"""
+Photo list serialization: ModelSerializer vs the lean ``.values()`` path.
+
+    python benchmarks/bench_values.py --sqlite
+    python benchmarks/bench_values.py --rows 20 100 1000 --flat
+
+For each page size this times the full list body (query, serialization
+and JSON encoding) three ways:
+
+* ``model``: model instances + PhotoWithAuthorSerializer + JSONRenderer
+  (what ``FAST_SERIALIZATION=0`` does),
+* ``values``: ``.values()`` rows + PhotoWithAuthorValuesSerializer +
+  JSONRenderer,
+* ``values+orjson``: the same with FastJSONRenderer (falls back to
+  JSONRenderer when orjson is not installed).
+
+The bodies are checked to be identical before timing.
+"""
+from common import benchmark_database, make_parser, measure, seed_feed
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[20, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--flat', action='store_true', help='without ?expand=user')
+    args = parser.parse_args()
+
+    with benchmark_database(args):
+        from rest_framework.renderers import JSONRenderer
+        from api import renderers
+        from api.models import Photo, User
+        from api.serializers import (
+            PhotoSerializer, PhotoWithAuthorSerializer, PhotoValuesSerializer, PhotoWithAuthorValuesSerializer,
+        )
+
+        model_serializer = PhotoSerializer if args.flat else PhotoWithAuthorSerializer
+        values_serializer = PhotoValuesSerializer if args.flat else PhotoWithAuthorValuesSerializer
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', password='!', is_japanese=bool(i % 2)) for i in range(100)
+        ])
+        variants = [{'name': f'photos/bench-{w}.{fmt}', 'width': w, 'format': fmt}
+                    for w in (320, 640, 1280) for fmt in ('webp', 'avif')]
+        seed_feed(Photo, max(args.rows), title=lambda i: f'photo {i}', description='富士山と桜',
+                  image_url='https://example.com/photo.jpg', width=1280, height=960, variants=variants,
+                  user=lambda i: users[i % len(users)])
+        queryset = Photo.objects.select_related('user').order_by('-created_at', '-id')
+        plain, fast = JSONRenderer(), renderers.FastJSONRenderer()
+
+        def cases(rows):
+            return {
+                'model': lambda: plain.render(model_serializer(list(queryset[:rows]), many=True).data),
+                'values': lambda: plain.render(
+                    values_serializer(list(values_serializer.values(queryset)[:rows]), many=True).data),
+                'values+orjson': lambda: fast.render(
+                    values_serializer(list(values_serializer.values(queryset)[:rows]), many=True).data),
+            }
+
+        print(f'orjson: {"yes" if renderers.orjson else "no (JSONRenderer fallback)"}')
+        print(f'{"rows":>6} {"case":<14} {"ms/page":>9} {"rows/s":>10} {"speedup":>8}')
+        for rows in args.rows:
+            table = cases(rows)
+            bodies = {func() for func in table.values()}
+            assert len(bodies) == 1, 'serializers disagree'
+            baseline = None
+            for name, func in table.items():
+                samples = measure(func, repeat=args.repeat)
+                per_page = sum(samples) / len(samples)
+                baseline = baseline or per_page
+                print(f'{rows:>6} {name:<14} {per_page * 1000:>9.3f} {rows / per_page:>10.0f} '
+                      f'{baseline / per_page:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
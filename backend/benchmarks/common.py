@@ -0,0 +1,108 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Run the scripts from ``backend/``::
+
+    python benchmarks/bench_pagination.py --sqlite
+
+They use the database configured in ``thisisjapan.settings`` unless
+``--sqlite`` is given. Either way a separate test database is created for
+the run and destroyed afterwards (``--keepdb`` keeps it for the next run).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--sqlite', action='store_true',
+                        help='use a throwaway SQLite database instead of PostgreSQL')
+    parser.add_argument('--keepdb', action='store_true',
+                        help='keep the benchmark database between runs')
+    return parser
+
+
+def setup_django(args):
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thisisjapan.settings')
+    from django.conf import settings
+    if args.sqlite:
+        path = os.path.join(tempfile.gettempdir(), 'thisisjapan_bench.sqlite3')
+        settings.DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': path,
+                'TEST': {'NAME': path},
+                'OPTIONS': {'timeout': 30},
+            }
+        }
+    import django
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(args):
+    """Set up Django and a fresh test database for the duration of the block."""
+    setup_django(args)
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+
+
+def seed_feed(model, rows, batch_size=5000, ties=5, **fields):
+    """
+    Bulk insert ``rows`` objects with decreasing ``created_at``; runs of
+    ``ties`` rows share one timestamp, as bulk imports do, so keyset
+    pagination has to break ties on ``id``.
+    """
+    from django.utils import timezone
+    existing = model.objects.count()
+    now = timezone.now()
+    for start in range(existing, rows, batch_size):
+        stop = min(start + batch_size, rows)
+        model.objects.bulk_create([
+            model(created_at=now - timedelta(seconds=i // ties),
+                  **{k: (v(i) if callable(v) else v) for k, v in fields.items()})
+            for i in range(start, stop)
+        ])
+
+
+def measure(func, repeat=20, warmup=2):
+    """Run ``func`` repeatedly and return the wall-clock samples in seconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
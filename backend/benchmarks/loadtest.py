@@ -0,0 +1,133 @@
+"""
+Minimal HTTP load generator used by the server benchmarks.
+
+    python benchmarks/loadtest.py http://127.0.0.1:8001/api/photos/ -c 32 -d 10
+
+Each client thread keeps one keep-alive connection open and issues requests
+back to back for ``--duration`` seconds (or ``--requests`` in total).
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from common import summarize
+
+
+class Worker(threading.Thread):
+    def __init__(self, url, deadline, budget, method='GET', body=None, headers=None):
+        super().__init__(daemon=True)
+        self.parts = urlsplit(url)
+        self.path = self.parts.path + (f'?{self.parts.query}' if self.parts.query else '')
+        self.deadline = deadline
+        self.budget = budget
+        self.method = method
+        self.body = body
+        self.headers = headers or {}
+        self.samples = []
+        self.errors = 0
+
+    def connect(self):
+        cls = http.client.HTTPSConnection if self.parts.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.parts.hostname, self.parts.port, timeout=30)
+
+    def run(self):
+        conn = self.connect()
+        while time.monotonic() < self.deadline and self.budget.take():
+            start = time.perf_counter()
+            try:
+                conn.request(self.method, self.path, body=self.body, headers=self.headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    self.errors += 1
+                    continue
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    conn = self.connect()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                conn.close()
+                conn = self.connect()
+                continue
+            self.samples.append(time.perf_counter() - start)
+        conn.close()
+
+
+class Budget:
+    """Shared request counter; unlimited when ``total`` is None."""
+
+    def __init__(self, total=None):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.remaining is None:
+            return True
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def run(url, concurrency=16, duration=10.0, requests=None, method='GET', body=None, headers=None):
+    """Drive ``url`` with ``concurrency`` clients and return summary statistics."""
+    deadline = time.monotonic() + (duration if requests is None else 3600)
+    budget = Budget(requests)
+    workers = [Worker(url, deadline, budget, method, body, headers) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    samples = [s for worker in workers for s in worker.samples]
+    result = {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(worker.errors for worker in workers),
+        'rps': round(len(samples) / elapsed, 1),
+    }
+    if samples:
+        result.update(summarize(samples))
+    return result
+
+
+def wait_for(url, timeout=30.0):
+    """Block until ``url`` answers, e.g. right after starting a server."""
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request('GET', parts.path or '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('-n', '--requests', type=int, default=None)
+    parser.add_argument('--json', help='write the result to this file')
+    args = parser.parse_args()
+
+    result = run(args.url, args.concurrency, args.duration, args.requests)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
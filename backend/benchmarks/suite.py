@@ -0,0 +1,261 @@
+"""
+REST API benchmark suite with a regression gate.
+
+    python benchmarks/suite.py --sqlite --sizes 1000 10000 -c 8 -o results.json
+    python benchmarks/suite.py --sizes 10000 100000 --baseline baseline.json --threshold 15
+
+Seeds the benchmark database with ``initialize_data --scale`` up to each
+size (photos and words; users and experiences scale along) and drives every
+endpoint of api/urls.py with ``--concurrency`` in-process clients. Each
+scenario is run for ``--requests`` requests (login and register are
+capped by the password hasher and use a tenth of them). For each scenario
+the suite reports req/s, p50/p95/p99 and SQL queries per request. Rate
+limits are switched off (``bench_spike.py`` measures them).
+
+``-o`` writes the results as JSON. With ``--baseline`` the run is compared
+against an earlier JSON file and the script exits with status 1 when a
+scenario's req/s drops, or its p95 grows, by more than ``--threshold``
+percent, or when it issues more queries per request (or fails more
+requests) than before.
+``--compare CURRENT BASELINE`` compares two saved files without running.
+"""
+import json
+import platform
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import benchmark_database, make_parser, summarize
+
+PASSWORD = 'bench-password'
+
+
+def scenarios(ids):
+    """name -> (request function, expected status codes, share of --requests)."""
+    def photo(rng):
+        return rng.randint(*ids['photo'])
+
+    def word(rng):
+        return rng.randint(*ids['word'])
+
+    def experience(rng):
+        return rng.randint(*ids['experience'])
+
+    def author(rng):
+        return rng.randint(*ids['author'])
+
+    def new_photo(rng):
+        return {'title': 'bench', 'image_url': '/p.jpg', 'user': ids['user']}
+
+    def new_word(rng):
+        return {'original': '桜 - さくら', 'translation': 'Cherry blossom', 'description': 'bench', 'user': ids['user']}
+
+    return {
+        'photos-list': (lambda c, r: c.get('/api/photos/'), {200}, 1),
+        'photos-list-cursor': (lambda c, r: c.get('/api/photos/', {'cursor': '', 'expand': 'user'}), {200}, 1),
+        'photos-retrieve': (lambda c, r: c.get(f'/api/photos/{photo(r)}/'), {200}, 1),
+        'photos-top': (lambda c, r: c.get('/api/photos/top/', {'limit': 20}), {200}, 1),
+        'photos-create': (lambda c, r: c.post('/api/photos/', new_photo(r), content_type='application/json'),
+                          {201}, 1),
+        'photos-like': (lambda c, r: c.post(f'/api/photos/{photo(r)}/like/'), {200}, 1),
+        'photos-unlike': (lambda c, r: c.delete(f'/api/photos/{photo(r)}/like/'), {200}, 1),
+        'photos-batch': (lambda c, r: c.post('/api/photos/batch/', [new_photo(r) for _ in range(20)],
+                                             content_type='application/json'), {201}, 1),
+        'photos-batch-like': (lambda c, r: c.post('/api/photos/batch_like/', {'ids': [photo(r) for _ in range(20)]},
+                                                  content_type='application/json'), {200}, 1),
+        'words-list': (lambda c, r: c.get('/api/words/'), {200}, 1),
+        'words-retrieve': (lambda c, r: c.get(f'/api/words/{word(r)}/'), {200}, 1),
+        'words-top': (lambda c, r: c.get('/api/words/top/', {'limit': 20}), {200}, 1),
+        'words-create': (lambda c, r: c.post('/api/words/', new_word(r), content_type='application/json'), {201}, 1),
+        'words-like': (lambda c, r: c.post(f'/api/words/{word(r)}/like/'), {200}, 1),
+        'experiences-list': (lambda c, r: c.get('/api/experiences/'), {200}, 1),
+        'experiences-retrieve': (lambda c, r: c.get(f'/api/experiences/{experience(r)}/'), {200}, 1),
+        'users-list': (lambda c, r: c.get('/api/users/'), {200}, 1),
+        'users-by-username': (lambda c, r: c.get('/api/users/by_username/', {'username': 'bench'}), {200}, 1),
+        'users-retrieve': (lambda c, r: c.get(f'/api/users/{author(r)}/'), {200}, 1),
+        'users-photos': (lambda c, r: c.get(f'/api/users/{author(r)}/photos/', {'expand': 'user'}), {200}, 1),
+        'users-words': (lambda c, r: c.get(f'/api/users/{author(r)}/words/'), {200}, 1),
+        'search': (lambda c, r: c.get('/api/search/', {'q': r.choice(['fireworks', '花火', 'temple'])}), {200}, 1),
+        'async-photos-list': (lambda c, r: c.get('/api/async/photos/'), {200}, 1),
+        'async-photos-top': (lambda c, r: c.get('/api/async/photos/top/', {'limit': 20}), {200}, 1),
+        'current-user': (lambda c, r: c.get('/api/user/'), {200}, 1),
+        'login': (lambda c, r: c.post('/api/login/', {'username': 'bench', 'password': PASSWORD},
+                                      content_type='application/json'), {200}, 0.1),
+        'register': (lambda c, r: c.post('/api/register/', {'username': f'bench-{uuid.uuid4().hex}',
+                                                            'password': PASSWORD},
+                                         content_type='application/json'), {201}, 0.1),
+    }
+
+
+def run_scenario(func, expected, clients, requests, seed):
+    """Issue ``requests`` requests from the clients in parallel threads."""
+    from api import metrics
+
+    lock = threading.Lock()
+    remaining = [requests]
+    samples, queries, errors = [], [], []
+
+    def worker(client, rng):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            with metrics.collect() as stats:
+                response = func(client, rng)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                queries.append(stats.queries)
+                if response.status_code not in expected:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(client, random.Random(seed + i)))
+               for i, client in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 1),
+        **summarize(samples),
+        'queries': round(sum(queries) / len(queries), 2),
+        'errors': len(errors),
+    }
+
+
+def seed(size):
+    from io import StringIO
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from django.db.models import Max, Min
+    from api.models import User, Photo, Word, Experience
+
+    missing = size - Photo.objects.count()
+    if missing > 0:
+        print(f'Seeding up to {size} photos and words...')
+        call_command('initialize_data', scale=missing, seed=size, stdout=StringIO())
+    user, _ = User.objects.get_or_create(username='bench', defaults={'password': make_password(PASSWORD)})
+    ids = {'user': user.pk}
+    for name, model in (('photo', Photo), ('word', Word), ('experience', Experience), ('author', User)):
+        bounds = model.objects.aggregate(Min('id'), Max('id'))
+        ids[name] = (bounds['id__min'], bounds['id__max'])
+    return ids
+
+
+def run(args):
+    results = {}
+    with benchmark_database(args):
+        import django
+        from django.conf import settings
+        from django.db import connection
+        from django.test import Client
+        from rest_framework.settings import api_settings
+
+        # レート制限はここでは測らない（bench_spike.py を参照）
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        api_settings.reload()
+
+        clients = [Client() for _ in range(args.concurrency)]
+        for size in args.sizes:
+            ids = seed(size)
+            for client in clients:
+                client.post('/api/login/', {'username': 'bench', 'password': PASSWORD},
+                            content_type='application/json')
+            table = scenarios(ids)
+            names = [name for name in table if not args.scenarios or name in args.scenarios]
+            results[str(size)] = {}
+            print(f'\nsize={size}')
+            print(f'{"scenario":<22} {"rps":>8} {"p50_ms":>9} {"p95_ms":>9} {"p99_ms":>9} {"queries":>8} {"errors":>7}')
+            for name in names:
+                func, expected, share = table[name]
+                requests = max(args.concurrency, int(args.requests * share))
+                # ウォームアップ（リーダーボードやキャッシュを温める）
+                run_scenario(func, expected, clients[:1], min(5, requests), args.seed)
+                result = run_scenario(func, expected, clients, requests, args.seed)
+                results[str(size)][name] = result
+                print(f'{name:<22} {result["rps"]:>8} {result["p50_ms"]:>9} {result["p95_ms"]:>9} '
+                      f'{result["p99_ms"]:>9} {result["queries"]:>8} {result["errors"]:>7}')
+        meta = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+        }
+    return {'meta': meta, 'results': results}
+
+
+def compare(current, baseline, threshold):
+    """Print per-scenario deltas and return the list of regressions."""
+    regressions = []
+    print(f'\n{"size":>8} {"scenario":<22} {"rps":>9} {"p95":>9} {"queries":>11}')
+    for size, scenarios_ in current['results'].items():
+        for name, now in scenarios_.items():
+            before = baseline['results'].get(size, {}).get(name)
+            if before is None:
+                continue
+            rps = (now['rps'] - before['rps']) / before['rps'] * 100 if before['rps'] else 0.0
+            p95 = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            problems = []
+            if rps < -threshold:
+                problems.append(f'req/s {rps:+.1f}%')
+            if p95 > threshold:
+                problems.append(f'p95 {p95:+.1f}%')
+            if now['queries'] > before['queries']:
+                problems.append(f'queries {before["queries"]} -> {now["queries"]}')
+            if now['errors'] > before['errors']:
+                problems.append(f'errors {before["errors"]} -> {now["errors"]}')
+            flag = '  REGRESSION' if problems else ''
+            print(f'{size:>8} {name:<22} {rps:>+8.1f}% {p95:>+8.1f}% '
+                  f'{before["queries"]:>5}->{now["queries"]:<5}{flag}')
+            regressions.extend(f'{size} {name}: {problem}' for problem in problems)
+    return regressions
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=400, help='requests per scenario')
+    parser.add_argument('--scenarios', nargs='+', help='only run these scenarios')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    parser.add_argument('--compare', nargs=2, metavar=('CURRENT', 'BASELINE'),
+                        help='compare two result files without running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            current = json.load(f)
+        args.baseline = args.compare[1]
+    else:
+        current = run(args)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) over {args.threshold}%:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('\nNo regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Gunicorn configuration for the production server (see run.py).
+
+Every setting can be overridden from the environment:
+
+    SERVER_MODE            wsgi (threaded workers) or asgi (uvicorn workers)
+    WEB_BIND               address to listen on (default 0.0.0.0:8001)
+    WEB_CONCURRENCY        worker processes (default 2 x CPU cores + 1)
+    WEB_THREADS            threads per worker for wsgi mode (default 4)
+    WEB_KEEPALIVE          seconds to keep idle client connections open
+    WEB_TIMEOUT            seconds before a silent worker is killed and restarted
+    WEB_GRACEFUL_TIMEOUT   seconds workers get to finish requests on reload/stop
+    WEB_MAX_REQUESTS       recycle a worker after this many requests (0 = never)
+    WEB_PRELOAD            1 to import the app before forking workers
+    WEB_BACKLOG            pending connections the listen socket queues (default 2048)
+
+Send SIGHUP to the master process for a graceful reload.
+"""
+import os
+import sys
+
+# ワーカーが読む settings.py にも本番サーバーで動いていることを伝える
+os.environ.setdefault('SERVER_MODE', 'wsgi')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from thisisjapan import server  # noqa: E402
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8001')
+workers = server.WORKERS
+
+if server.MODE == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    worker_class = 'gthread'
+    threads = server.THREADS
+
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+preload_app = os.environ.get('WEB_PRELOAD', '0') == '1'
+backlog = int(os.environ.get('WEB_BACKLOG', '2048'))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # preload_app で親プロセスが開いた DB 接続をワーカー間で共有しない
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def worker_exit(server, worker):
+    # ライトビハインドで溜まっている「いいね」を書き出してから終了する
+    likes = sys.modules.get('api.likes')
+    if likes is not None and likes._buffer is not None:
+        likes._buffer.flush()
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thisisjapan.settings')
+    # テストはレプリカ用の DB も持つ test_settings で動かす（ReplicaTests を飛ばさない）
+    default = 'thisisjapan.test_settings' if sys.argv[1:2] == ['test'] else 'thisisjapan.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -2,9 +2,24 @@
 import os
 import sys
 
+SERVER_MODES = ('dev', 'wsgi', 'asgi')
+
 def main():
-    """Run administrative tasks."""
+    """Run the development server or, with SERVER_MODE=wsgi|asgi, the production server."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thisisjapan.settings')
+    mode = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('SERVER_MODE', 'dev')
+    if mode not in SERVER_MODES:
+        sys.exit(f"Unknown server mode {mode!r}, expected one of {', '.join(SERVER_MODES)}")
+
+    if mode != 'dev':
+        # Multi-process Gunicorn server configured by gunicorn.conf.py.
+        # exec so that signals (SIGTERM, SIGHUP for graceful reload) reach the Gunicorn master directly.
+        os.environ['SERVER_MODE'] = mode
+        os.environ.setdefault('DJANGO_DEBUG', '0')
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        app = 'thisisjapan.asgi:application' if mode == 'asgi' else 'thisisjapan.wsgi:application'
+        os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', app])
+
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -18,4 +33,4 @@ def main():
     execute_from_command_line(sys.argv)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,20 @@
+"""
+How the production server runs, read by both gunicorn.conf.py and
+settings.py so the two agree on the defaults.
+
+``SERVER_MODE`` is ``wsgi`` or ``asgi`` under Gunicorn (run.py and
+gunicorn.conf.py set it) and ``dev`` for runserver, manage.py and tests.
+"""
+import multiprocessing
+import os
+
+MODE = os.environ.get('SERVER_MODE', 'dev')
+# Gunicorn worker processes (default 2 x CPU cores + 1)
+WORKERS = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+# Request threads per worker in wsgi mode; the DB pool is sized from it
+THREADS = int(os.environ.get('WEB_THREADS') or 4)
+
+
+def multiprocess():
+    """Whether requests are spread over several worker processes."""
+    return MODE in ('wsgi', 'asgi') and WORKERS > 1
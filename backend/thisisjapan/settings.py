@@ -10,9 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from copy import deepcopy
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
+from . import server
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,7 +29,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-n@gk#_(jmvxy4h)9ho=)ke&qw_+++&c%&z@a@a%eyr1g3#(u%m'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# run.py sets DJANGO_DEBUG=0 for the production server modes
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -38,13 +44,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'api',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # 書き込んだクライアントをしばらくプライマリに固定する（SessionMiddleware より前）
+    'api.replicas.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,9 +95,99 @@ DATABASES = {
         'PASSWORD': os.environ.get('PGPASSWORD'),
         'HOST': os.environ.get('PGHOST'),
         'PORT': os.environ.get('PGPORT'),
+        # Keep connections open between requests and check them before reuse. Not under
+        # ASGI: queries run in sync_to_async threads whose persistent connections no
+        # request signal closes, so they would pile up (use DB_POOL=1 there instead).
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0' if server.MODE == 'asgi' else '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+        },
     }
 }
 
+# DB_POOL=1 switches to psycopg 3's connection pool (needs the "pool" extra).
+# Pools are per worker process, so size them for the threads of one worker.
+if os.environ.get('DB_POOL', '0') == '1':
+    # one connection per request thread (server.THREADS, shared with gunicorn.conf.py)
+    # plus one for background threads (like flusher)
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # required by Django when pooling
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', str(server.THREADS + 1))),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+    }
+
+# Read replicas: DB_REPLICAS="replica-a.internal,replica-b.internal:5433" adds the
+# aliases replica1, replica2, ... with the credentials of default. list, retrieve
+# and top read from them (api/replicas.py); a client that wrote reads the primary
+# for REPLICA_MAX_LAG seconds, the assumed worst-case replication lag.
+DATABASE_REPLICAS = []
+for _host in filter(None, (h.strip() for h in os.environ.get('DB_REPLICAS', '').split(','))):
+    _host, _, _port = _host.partition(':')
+    _alias = f'replica{len(DATABASE_REPLICAS) + 1}'
+    DATABASES[_alias] = {**deepcopy(DATABASES['default']), 'HOST': _host,
+                         'PORT': _port or DATABASES['default']['PORT'], 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(_alias)
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+
+
+# Cache
+# Set REDIS_URL to share the cache (model versions, sessions, ...) between workers
+# 'objects' is the per-object cache of api/objectcache.py (retrieve endpoints,
+# by_username and the session user); without Redis it is a per-process LRU of
+# OBJECT_CACHE_MAX_ENTRIES rows.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+        'objects': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'objects',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'objects': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'objects',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('OBJECT_CACHE_MAX_ENTRIES', '10000'))},
+        },
+    }
+OBJECT_CACHE_ALIAS = 'objects'
+OBJECT_CACHE_TIMEOUT = int(os.environ.get('OBJECT_CACHE_TIMEOUT', '300'))
+
+
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new passwords (pbkdf2, scrypt or argon2;
+# argon2 needs the "argon2" extra). The others stay listed so existing hashes
+# verify and are upgraded on the next login. Unset cost variables keep
+# Django's defaults.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'api.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'api.hashers.TunedScryptPasswordHasher',
+    'argon2': 'api.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '0')) or None
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', '0')) or None
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '0')) or None
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '0')) or None
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', '0')) or None
+# Threads per worker process that may hash passwords at the same time
+PASSWORD_HASHING_CONCURRENCY = int(os.environ.get('PASSWORD_HASHING_CONCURRENCY', str(os.cpu_count() or 1)))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,6 +225,37 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded images (originals and generated variants, see api/images.py)
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'media'))
+MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
+# Responsive widths in pixels; only widths narrower than the original are rendered
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1024').split(','))
+# Encoded formats, best first; formats this Pillow build cannot write are skipped
+IMAGE_FORMATS = tuple(os.environ.get('IMAGE_FORMATS', 'avif,webp').split(','))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '75'))
+# Threads per worker process that resize and encode images
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', str(os.cpu_count() or 1)))
+# 'queue' renders variants in run_tasks after the upload returns, 'inline' during the request
+IMAGE_PROCESSING = os.environ.get('IMAGE_PROCESSING', 'queue')
+# Larger uploads are refused before they are read; pixel counts are capped by PIL.Image.MAX_IMAGE_PIXELS
+IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('IMAGE_MAX_UPLOAD_SIZE', str(20 * 1024 * 1024)))
+
+# Request metrics (api/metrics.py): fraction of requests to measure, 0 disables it
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0'))
+# Add a Server-Timing header to measured responses
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '1') == '1'
+# If set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Without a token, /metrics only answers these addresses or networks (REMOTE_ADDR, so behind a proxy use the token)
+METRICS_ALLOWED_IPS = tuple(filter(None, os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')))
+
+# Background tasks (api/tasks.py, manage.py run_tasks)
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '3'))
+# Seconds before the first retry; doubles with every further attempt
+TASK_RETRY_DELAY = float(os.environ.get('TASK_RETRY_DELAY', '5'))
+# Seconds after which a task still marked running is assumed lost and requeued
+TASK_TIMEOUT = int(os.environ.get('TASK_TIMEOUT', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -136,8 +267,55 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # orjson があれば使う（"fast" extra）。出力は JSONRenderer と同じ
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # トークンバケット（api/throttling.py）。スコープのないビューは制限しない
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.IPThrottle',
+        'api.throttling.SessionThrottle',
+    ],
+    # <scope> はクライアントの IP ごと、<scope>_session はログインユーザー / セッションごと
+    'DEFAULT_THROTTLE_RATES': {
+        'top': '200/s',
+        'top_session': '20/s',
+        'like': '100/s',
+        'like_session': '10/s',
+        'login': '30/min',
+        'login_session': '10/min',
+    },
+    # X-Forwarded-For を信用するプロキシの段数（None なら REMOTE_ADDR を使う）
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
 }
+# THROTTLE_RATES="like_session=5/s,login=10/min" overrides individual rates
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].update(
+    item.strip().split('=', 1) for item in os.environ.get('THROTTLE_RATES', '').split(',') if '=' in item)
+# Cache holding the buckets; '' keeps them in each process (without REDIS_URL
+# every cache is per process too, see the multi-worker block below)
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS', 'default')
+# Seconds to keep using in-process buckets after the cache failed
+THROTTLE_CACHE_RETRY = int(os.environ.get('THROTTLE_CACHE_RETRY', '30'))
+# Identical concurrent GETs of the conditional endpoints share one response; a
+# finished response is also reused for COALESCE_WINDOW seconds (0 = in-flight only)
+COALESCE_REQUESTS = os.environ.get('COALESCE_REQUESTS', '1') == '1'
+COALESCE_WINDOW = float(os.environ.get('COALESCE_WINDOW', '0'))
+
+# Feed pagination for photos, words and experiences: 'page' (default) or 'cursor'.
+# Either mode can be chosen per request with ?page=N or ?cursor=.
+FEED_PAGINATION = os.environ.get('FEED_PAGINATION', 'page')
+
+# List, /top and /trending responses are built from .values() rows by the
+# lean serializers in api/serializers.py. FAST_SERIALIZATION=0 switches back
+# to the ModelSerializers (the JSON is the same either way).
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', '1') == '1'
+
+# Rows per server-side cursor fetch (and per streamed chunk) of the /export/
+# endpoints and manage.py export_data. The endpoints use the 'export' throttle
+# scope, which has no rate unless THROTTLE_RATES sets one (e.g. export=10/min).
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
@@ -150,3 +328,53 @@ CORS_ALLOW_METHODS = [
     'POST',
     'PUT',
 ]
+
+# Like counters
+# LIKES_WRITE_BEHIND=1 buffers likes in process and flushes them in batches
+LIKES_WRITE_BEHIND = os.environ.get('LIKES_WRITE_BEHIND', '0') == '1'
+LIKES_FLUSH_INTERVAL = float(os.environ.get('LIKES_FLUSH_INTERVAL', '1.0'))
+LIKES_FLUSH_THRESHOLD = int(os.environ.get('LIKES_FLUSH_THRESHOLD', '500'))
+# LIKES_FLUSH_TO_QUEUE=1 hands each flush to the task queue instead of updating rows in the web process
+LIKES_FLUSH_TO_QUEUE = os.environ.get('LIKES_FLUSH_TO_QUEUE', '0') == '1'
+# Half-life of a like in the /trending ranking, in seconds (api/trending.py)
+TRENDING_HALF_LIFE = float(os.environ.get('TRENDING_HALF_LIFE', str(24 * 3600)))
+# Users whose liked ids each process keeps in memory for liked_by_me (api/likesets.py)
+LIKESET_CACHE_USERS = int(os.environ.get('LIKESET_CACHE_USERS', '10000'))
+
+# Leaderboards behind /api/photos/top/ and /api/words/top/
+LEADERBOARD_MAX_LIMIT = int(os.environ.get('LEADERBOARD_MAX_LIMIT', '50'))
+LEADERBOARD_TTL = float(os.environ.get('LEADERBOARD_TTL', '60'))
+
+# Conditional GET / HTTP caching for the read endpoints (CONDITIONAL_GET=0 sends no validators)
+CONDITIONAL_GET = os.environ.get('CONDITIONAL_GET', '1') == '1'
+API_CACHE_CONTROL = os.environ.get('API_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+CONDITIONAL_GET_VERSION_TTL = int(os.environ.get('CONDITIONAL_GET_VERSION_TTL', '300'))
+
+# Maximum number of items accepted by /batch/ and /batch_like/
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '500'))
+
+# Sessions: SESSION_BACKEND=db (default) | cached_db | cache | signed_cookies.
+# cache and cached_db need a shared cache (REDIS_URL) when running several workers.
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_BACKEND', 'db')]
+
+# Several Gunicorn workers without REDIS_URL: each worker would keep serving its
+# own cached rows, like sets and ETags after another worker wrote, so the object
+# cache, the like-set cache and the conditional GET validators are switched off.
+# Each worker also keeps its own throttle buckets, so the rates are divided by
+# the number of workers to keep the total close to the configured limit.
+if server.multiprocess() and not os.environ.get('REDIS_URL'):
+    CACHES['objects'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    LIKESET_CACHE_USERS = 0
+    CONDITIONAL_GET = False
+    for _scope, _rate in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].items():
+        _num, _period = _rate.split('/')
+        # 切り上げるので、少ないレートでも各ワーカーで 1 回は通る
+        REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][_scope] = f'{-(-int(_num) // server.WORKERS)}/{_period}'
+    if SESSION_ENGINE.endswith(('.cache', '.cached_db')):
+        raise ImproperlyConfigured('SESSION_BACKEND=cache/cached_db needs REDIS_URL with several workers '
+                                   '(or WEB_CONCURRENCY=1)')
@@ -0,0 +1,14 @@
+"""
+Settings for running the test suite; ``python manage.py test`` uses them
+unless ``DJANGO_SETTINGS_MODULE`` or ``--settings`` says otherwise.
+
+Adds ``replica``, a second local database that stands in for a replica that
+never catches up (api.tests.ReplicaTests; skipped under plain settings).
+"""
+from copy import deepcopy
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES['replica'] = {**deepcopy(DATABASES['default']),
+                        'TEST': {'NAME': f"test_{DATABASES['default']['NAME']}_replica"}}
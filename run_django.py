@@ -12,14 +12,21 @@ def main():
     # Set environment variables if needed
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thisisjapan.settings')
     
-    # Start the server in a subprocess
-    cmd = [sys.executable, 'manage.py', 'runserver', '0.0.0.0:8001']
+    # SERVER_MODE=wsgi|asgi runs the production Gunicorn server (see backend/run.py)
+    mode = os.environ.get('SERVER_MODE', 'dev')
+    if mode == 'dev':
+        cmd = [sys.executable, 'manage.py', 'runserver', '0.0.0.0:8001']
+    else:
+        cmd = [sys.executable, 'run.py', mode]
     print(f"Starting Django server with command: {' '.join(cmd)}")
     
     try:
         # Start server and wait for it
         process = subprocess.Popen(cmd)
         print(f"Django server started with PID {process.pid}")
+        # Forward termination and reload (SIGHUP → graceful reload in Gunicorn) to the server
+        for sig in (signal.SIGTERM, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: process.send_signal(signum))
         # Wait for the process to complete or be interrupted
         process.wait()
     except KeyboardInterrupt:
@@ -35,4 +42,4 @@ def main():
         print("Django server shutdown complete")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()